@@ -0,0 +1,385 @@
+import socketserver
+import threading
+import time
+from typing import Dict, List, Set, Tuple
+
+
+# a tiny in-process RESP server which implements just enough of Redis (keys with ttl, hashes, pub/sub and streams)
+# for the service's own redis client, so the benchmark needs no Redis installation
+class RedisStandIn:
+    def __init__(self, host: str = '127.0.0.1', port: int = 0):
+        self.__lock = threading.Lock()
+        self.__dbs: Dict[int, Dict[bytes, object]] = {}
+        self.__expires: Dict[int, Dict[bytes, float]] = {}
+        self.__subscribers: Dict[bytes, Set['_RespHandler']] = {}
+        self.__streams: Dict[bytes, _Stream] = {}
+        self.__stream_added = threading.Condition(self.__lock)
+        stand_in = self
+
+        class Handler(_RespHandler):
+            owner = stand_in
+
+        self.server = socketserver.ThreadingTCPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.host: str = host
+        self.port: int = self.server.server_address[1]
+
+    def start(self) -> int:
+        th = threading.Thread(target=self.server.serve_forever)
+        th.daemon = True
+        th.start()
+        return self.port
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __get_db(self, db: int) -> Dict[bytes, object]:
+        store = self.__dbs.get(db)
+        if store is None:
+            store = {}
+            self.__dbs[db] = store
+            self.__expires[db] = {}
+        return store
+
+    def __get_alive(self, db: int, key: bytes):
+        store = self.__get_db(db)
+        expires_at = self.__expires[db].get(key)
+        if expires_at is not None and expires_at < time.monotonic():
+            store.pop(key, None)
+            self.__expires[db].pop(key, None)
+        return store.get(key)
+
+    def execute(self, handler: '_RespHandler', args: List[bytes]) -> bytes:
+        command = args[0].upper().decode('utf-8')
+        db = handler.db
+        with self.__lock:
+            if command == 'PING':
+                if handler.subscribed:
+                    return _array([b'pong', args[1] if len(args) > 1 else b''])
+                return _bulk(args[1]) if len(args) > 1 else b'+PONG\r\n'
+            if command == 'ECHO':
+                return _bulk(args[1])
+            if command == 'SELECT':
+                handler.db = int(args[1])
+                return b'+OK\r\n'
+            if command in ('CLIENT', 'READONLY', 'RESET'):
+                return b'+OK\r\n'
+            if command == 'GET':
+                return _bulk(self.__get_alive(db, args[1]))
+            if command in ('SET', 'SETEX'):
+                if command == 'SETEX':
+                    key, ttl, value = args[1], float(args[2]), args[3]
+                else:
+                    key, value, ttl = args[1], args[2], None
+                    options = [a.upper() for a in args[3:]]
+                    if b'EX' in options:
+                        ttl = float(args[3 + options.index(b'EX') + 1])
+                    elif b'PX' in options:
+                        ttl = float(args[3 + options.index(b'PX') + 1]) / 1000.
+                self.__get_db(db)[key] = value
+                if ttl is not None:
+                    self.__expires[db][key] = time.monotonic() + ttl
+                else:
+                    self.__expires[db].pop(key, None)
+                return b'+OK\r\n'
+            if command == 'EXPIRE':
+                if self.__get_alive(db, args[1]) is None:
+                    return b':0\r\n'
+                self.__expires[db][args[1]] = time.monotonic() + float(args[2])
+                return b':1\r\n'
+            if command == 'DEL':
+                count = 0
+                for key in args[1:]:
+                    if self.__get_db(db).pop(key, None) is not None:
+                        count += 1
+                    self.__expires[db].pop(key, None)
+                return _int(count)
+            if command == 'EXISTS':
+                return _int(sum(1 for key in args[1:] if self.__get_alive(db, key) is not None))
+            if command == 'HSET':
+                hash_value = self.__get_alive(db, args[1])
+                if not isinstance(hash_value, dict):
+                    hash_value = {}
+                    self.__get_db(db)[args[1]] = hash_value
+                added = 0
+                for index in range(2, len(args) - 1, 2):
+                    if args[index] not in hash_value:
+                        added += 1
+                    hash_value[args[index]] = args[index + 1]
+                return _int(added)
+            if command == 'HGET':
+                hash_value = self.__get_alive(db, args[1])
+                return _bulk(hash_value.get(args[2]) if isinstance(hash_value, dict) else None)
+            if command == 'HDEL':
+                hash_value = self.__get_alive(db, args[1])
+                if not isinstance(hash_value, dict):
+                    return _int(0)
+                return _int(sum(1 for field in args[2:] if hash_value.pop(field, None) is not None))
+            if command == 'HGETALL':
+                hash_value = self.__get_alive(db, args[1])
+                items: List[bytes] = []
+                if isinstance(hash_value, dict):
+                    for k, v in hash_value.items():
+                        items.extend([k, v])
+                return _array(items)
+            if command == 'PUBLISH':
+                subscribers = list(self.__subscribers.get(args[1], set()))
+                for subscriber in subscribers:
+                    subscriber.send(_array([b'message', args[1], args[2]]))
+                return _int(len(subscribers))
+            if command == 'SUBSCRIBE':
+                replies = b''
+                for channel in args[1:]:
+                    self.__subscribers.setdefault(channel, set()).add(handler)
+                    handler.channels.add(channel)
+                    replies += _subscription_reply(b'subscribe', channel, len(handler.channels))
+                handler.subscribed = True
+                return replies
+            if command == 'UNSUBSCRIBE':
+                channels = args[1:] if len(args) > 1 else list(handler.channels)
+                replies = b''
+                for channel in channels:
+                    self.__subscribers.get(channel, set()).discard(handler)
+                    handler.channels.discard(channel)
+                    replies += _subscription_reply(b'unsubscribe', channel, len(handler.channels))
+                handler.subscribed = len(handler.channels) > 0
+                return replies
+            if command.startswith('X'):
+                return self.__execute_stream(command, args)
+            return f'-ERR unknown command \'{command}\'\r\n'.encode('utf-8')
+
+    # streams are kept out of the db keyspace, which is enough for the event bus
+    def __execute_stream(self, command: str, args: List[bytes]) -> bytes:
+        options = [a.upper() for a in args]
+        if command == 'XADD':
+            stream = self.__streams.setdefault(args[1], _Stream())
+            index = 2
+            max_len = 0
+            if options[index] == b'MAXLEN':
+                index += 1
+                if args[index] in (b'~', b'='):
+                    index += 1
+                max_len = int(args[index])
+                index += 1
+            entry_id = stream.add(args[index + 1:])
+            if max_len > 0 and len(stream.entries) > max_len:
+                del stream.entries[:len(stream.entries) - max_len]
+            self.__stream_added.notify_all()
+            return _bulk(_format_id(entry_id))
+        if command == 'XGROUP' and options[1] == b'CREATE':
+            if args[2] not in self.__streams:
+                if b'MKSTREAM' not in options:
+                    return b'-ERR The XGROUP subcommand requires the key to exist\r\n'
+                self.__streams[args[2]] = _Stream()
+            stream = self.__streams[args[2]]
+            if args[3] in stream.groups:
+                return b'-BUSYGROUP Consumer Group name already exists\r\n'
+            stream.groups[args[3]] = _StreamGroup(stream.last_id if args[4] == b'$' else _parse_id(args[4]))
+            return b'+OK\r\n'
+        if command == 'XREADGROUP':
+            group_name, consumer = args[2], args[3]
+            count = int(args[options.index(b'COUNT') + 1]) if b'COUNT' in options else 0
+            block = int(args[options.index(b'BLOCK') + 1]) if b'BLOCK' in options else None
+            key = args[options.index(b'STREAMS') + 1]
+            stream = self.__streams.get(key)
+            if stream is None or group_name not in stream.groups:
+                return b'-NOGROUP No such key or consumer group\r\n'
+            group = stream.groups[group_name]
+            deadline = time.monotonic() + block / 1000. if block else None
+            while True:
+                entries = [e for e in stream.entries if e[0] > group.last_id]
+                if count > 0:
+                    entries = entries[:count]
+                if len(entries) > 0 or deadline is None or time.monotonic() >= deadline:
+                    break
+                self.__stream_added.wait(deadline - time.monotonic())
+            if len(entries) == 0:
+                return b'*-1\r\n'
+            for entry_id, _ in entries:
+                group.pending[entry_id] = [consumer, time.monotonic()]
+            group.last_id = entries[-1][0]
+            return _encode([[key, [[_format_id(i), fields] for i, fields in entries]]])
+        if command == 'XACK':
+            stream = self.__streams.get(args[1])
+            group = stream.groups.get(args[2]) if stream is not None else None
+            if group is None:
+                return _int(0)
+            return _int(sum(1 for entry_id in args[3:] if group.pending.pop(_parse_id(entry_id), None) is not None))
+        if command == 'XAUTOCLAIM':
+            stream = self.__streams.get(args[1])
+            group = stream.groups.get(args[2]) if stream is not None else None
+            if group is None:
+                return b'-NOGROUP No such key or consumer group\r\n'
+            consumer, min_idle, start = args[3], int(args[4]) / 1000., _parse_id(args[5])
+            count = int(args[options.index(b'COUNT') + 1]) if b'COUNT' in options else 100
+            now = time.monotonic()
+            fields_by_id = dict(stream.entries)
+            claimed, deleted = [], []
+            for entry_id in sorted(group.pending):
+                if entry_id < start or now - group.pending[entry_id][1] < min_idle:
+                    continue
+                if len(claimed) + len(deleted) >= count:
+                    break
+                if entry_id in fields_by_id:
+                    group.pending[entry_id] = [consumer, now]
+                    claimed.append([_format_id(entry_id), fields_by_id[entry_id]])
+                else:
+                    group.pending.pop(entry_id)
+                    deleted.append(_format_id(entry_id))
+            return _encode([b'0-0', claimed, deleted])
+        if command == 'XPENDING':
+            stream = self.__streams.get(args[1])
+            group = stream.groups.get(args[2]) if stream is not None else None
+            if group is None:
+                return b'-NOGROUP No such key or consumer group\r\n'
+            index = 3
+            min_idle = .0
+            if options[index] == b'IDLE':
+                min_idle = int(args[index + 1]) / 1000.
+                index += 2
+            count = int(args[index + 2])
+            consumer = args[index + 3] if len(args) > index + 3 else None
+            now = time.monotonic()
+            items = []
+            for entry_id in sorted(group.pending):
+                owner, delivered_at = group.pending[entry_id]
+                if now - delivered_at < min_idle or (consumer is not None and owner != consumer):
+                    continue
+                items.append([_format_id(entry_id), owner, int((now - delivered_at) * 1000), 1])
+                if len(items) >= count:
+                    break
+            return _encode(items)
+        if command == 'XCLAIM':
+            stream = self.__streams.get(args[1])
+            group = stream.groups.get(args[2]) if stream is not None else None
+            if group is None:
+                return b'-NOGROUP No such key or consumer group\r\n'
+            consumer, min_idle = args[3], int(args[4]) / 1000.
+            now = time.monotonic()
+            fields_by_id = dict(stream.entries)
+            claimed = []
+            for raw_id in args[5:]:
+                entry_id = _parse_id(raw_id)
+                item = group.pending.get(entry_id)
+                if item is None or now - item[1] < min_idle:
+                    continue
+                if entry_id in fields_by_id:
+                    group.pending[entry_id] = [consumer, now]
+                    claimed.append([_format_id(entry_id), fields_by_id[entry_id]])
+                else:
+                    group.pending.pop(entry_id)
+            return _encode(claimed)
+        return f'-ERR unknown command \'{command}\'\r\n'.encode('utf-8')
+
+    def remove_handler(self, handler: '_RespHandler'):
+        with self.__lock:
+            for channel in handler.channels:
+                self.__subscribers.get(channel, set()).discard(handler)
+
+
+class _StreamGroup:
+    def __init__(self, last_id: Tuple[int, int]):
+        self.last_id: Tuple[int, int] = last_id
+        # entry id => [consumer, delivered at]
+        self.pending: Dict[Tuple[int, int], list] = {}
+
+
+class _Stream:
+    def __init__(self):
+        self.entries: List[Tuple[Tuple[int, int], List[bytes]]] = []
+        self.last_id: Tuple[int, int] = (0, 0)
+        self.groups: Dict[bytes, _StreamGroup] = {}
+
+    def add(self, fields: List[bytes]) -> Tuple[int, int]:
+        ms = int(time.time() * 1000)
+        self.last_id = (self.last_id[0], self.last_id[1] + 1) if ms <= self.last_id[0] else (ms, 0)
+        self.entries.append((self.last_id, fields))
+        return self.last_id
+
+
+class _RespHandler(socketserver.StreamRequestHandler):
+    owner: RedisStandIn = None
+
+    def setup(self):
+        super().setup()
+        self.db: int = 0
+        self.subscribed: bool = False
+        self.channels: Set[bytes] = set()
+        self.write_lock = threading.Lock()
+
+    def send(self, data: bytes):
+        with self.write_lock:
+            try:
+                self.wfile.write(data)
+                self.wfile.flush()
+            except OSError:
+                pass
+
+    def handle(self):
+        try:
+            while True:
+                args = self.__read_command()
+                if args is None:
+                    return
+                if len(args) == 0:
+                    continue
+                if args[0].upper() == b'QUIT':
+                    self.send(b'+OK\r\n')
+                    return
+                self.send(self.owner.execute(self, args))
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            self.owner.remove_handler(self)
+
+    def __read_command(self) -> List[bytes] | None:
+        line = self.rfile.readline()
+        if len(line) == 0:
+            return None
+        if not line.startswith(b'*'):
+            return line.strip().split()  # inline command
+        count = int(line[1:].strip())
+        args: List[bytes] = []
+        for _ in range(count):
+            header = self.rfile.readline()
+            length = int(header[1:].strip())
+            args.append(self.rfile.read(length + 2)[:-2])
+        return args
+
+
+def _bulk(value) -> bytes:
+    if value is None:
+        return b'$-1\r\n'
+    if isinstance(value, str):
+        value = value.encode('utf-8')
+    return b'$' + str(len(value)).encode('ascii') + b'\r\n' + value + b'\r\n'
+
+
+def _int(value: int) -> bytes:
+    return b':' + str(value).encode('ascii') + b'\r\n'
+
+
+def _array(items: List[bytes]) -> bytes:
+    return b'*' + str(len(items)).encode('ascii') + b'\r\n' + b''.join(_bulk(item) for item in items)
+
+
+def _encode(value) -> bytes:
+    if isinstance(value, list):
+        return b'*' + str(len(value)).encode('ascii') + b'\r\n' + b''.join(_encode(item) for item in value)
+    if isinstance(value, int):
+        return _int(value)
+    return _bulk(value)
+
+
+def _parse_id(value: bytes) -> Tuple[int, int]:
+    ms, _, seq = value.decode('ascii').partition('-')
+    return int(ms), int(seq or 0)
+
+
+def _format_id(entry_id: Tuple[int, int]) -> bytes:
+    return f'{entry_id[0]}-{entry_id[1]}'.encode('ascii')
+
+
+def _subscription_reply(kind: bytes, channel: bytes, count: int) -> bytes:
+    return b'*3\r\n' + _bulk(kind) + _bulk(channel) + _int(count)
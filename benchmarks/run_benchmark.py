@@ -0,0 +1,259 @@
+# runs the object detection or facial recognition pipeline against a stub DeepStack server and a Redis stand-in,
+# e.g. python3 -m benchmarks.run_benchmark --pipeline od --cameras 40 --fps 2 --duration 30 --output od.json
+# then after a change: python3 -m benchmarks.run_benchmark --pipeline od --cameras 40 --fps 2 --duration 30 --compare od.json
+import argparse
+import asyncio
+import io
+import json
+import multiprocessing
+import os
+import sys
+import threading
+import time
+from typing import Dict, List
+
+import numpy as np
+import psutil
+import requests
+from PIL import Image
+from redis.exceptions import RedisError
+
+from benchmarks.redis_stand_in import RedisStandIn
+from benchmarks.stub_deepstack_server import StubDeepStackServer
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='deepstack_service benchmark')
+    parser.add_argument('--pipeline', choices=['od', 'fr'], default='od')
+    parser.add_argument('--cameras', type=int, default=10)
+    parser.add_argument('--fps', type=float, default=2., help='frames per second per camera')
+    parser.add_argument('--duration', type=float, default=20., help='seconds')
+    parser.add_argument('--drain', type=float, default=5., help='seconds to wait for the in-flight frames after the run')
+    parser.add_argument('--width', type=int, default=1280)
+    parser.add_argument('--height', type=int, default=720)
+    parser.add_argument('--latency', type=float, default=.05, help='stub DeepStack latency in seconds')
+    parser.add_argument('--detections', type=int, default=2, help='canned detection count per response')
+    parser.add_argument('--by-reference', action='store_true', help='sends the frames as redis keys')
+    parser.add_argument('--streams', action='store_true', help='sends the frames over a Redis stream instead of pub/sub')
+    parser.add_argument('--persons', type=int, default=0, help='person boxes in the facial recognition input events')
+    parser.add_argument('--msgpack', action='store_true', help='encodes the input and output events as msgpack with raw image bytes')
+    parser.add_argument('--set', action='append', default=[],
+                        help='overrides a config.deep_stack field, e.g. --set worker_count=8 or --set runtime_type=1 for asyncio')
+    parser.add_argument('--output', default='', help='writes the result as json')
+    parser.add_argument('--compare', default='', help='compares the result with a previous json result')
+    return parser.parse_args()
+
+
+def _run_stand_ins(queue, latency: float, detection_count: int, width: int, height: int):
+    redis_stand_in = RedisStandIn()
+    stub = StubDeepStackServer(latency, detection_count, width, height)
+    queue.put((redis_stand_in.start(), stub.start()))
+    threading.Event().wait()
+
+
+def _create_frame(width: int, height: int, seed: int) -> bytes:
+    rng = np.random.default_rng(seed)
+    # a smooth gradient with a little noise compresses like a real camera frame rather than pure noise
+    gradient = np.linspace(0, 255, width, dtype=np.float32)[None, :, None].repeat(height, 0).repeat(3, 2)
+    noise = rng.normal(0, 12, (height, width, 3)).astype(np.float32)
+    img = Image.fromarray(np.clip(gradient + noise, 0, 255).astype(np.uint8))
+    buffer = io.BytesIO()
+    img.save(buffer, format='JPEG', quality=80)
+    return buffer.getvalue()
+
+
+def _apply_overrides(ds_config, overrides: List[str]):
+    for item in overrides:
+        key, value = item.split('=', 1)
+        current = getattr(ds_config, key)
+        if isinstance(current, list):
+            setattr(ds_config, key, [v for v in value.split(',') if len(v) > 0])
+        elif isinstance(current, bool):
+            setattr(ds_config, key, value.lower() in ('1', 'true', 'yes'))
+        elif isinstance(current, int):
+            setattr(ds_config, key, int(value))
+        elif isinstance(current, float):
+            setattr(ds_config, key, float(value))
+        else:
+            setattr(ds_config, key, value)
+
+
+def _percentile(values: List[float], p: float) -> float:
+    return float(np.percentile(values, p)) if len(values) > 0 else .0
+
+
+def main():
+    args = parse_args()
+
+    queue = multiprocessing.Queue()
+    # the stand-ins run in another process, so the cpu and memory figures belong to the pipeline only
+    stand_ins = multiprocessing.Process(target=_run_stand_ins, args=(queue, args.latency, args.detections, args.width, args.height))
+    stand_ins.daemon = True
+    stand_ins.start()
+    redis_port, stub_port = queue.get(timeout=10.)
+
+    os.environ['REDIS_HOST'] = '127.0.0.1'
+    os.environ['REDIS_PORT'] = str(redis_port)
+    sys.argv = sys.argv[:1]  # ConfigRedis parses the command line arguments
+
+    from common.utilities import config, crate_redis_connection, RedisDb
+    ds_config = config.deep_stack
+    ds_config.server_url = 'http://127.0.0.1'
+    ds_config.server_port = stub_port
+    ds_config.replica_count = 1
+    ds_config.metrics_enabled = False
+    _apply_overrides(ds_config, args.set)
+    if args.streams:
+        ds_config.event_bus_stream_channels = ['snapshot_in', 'read_service']
+    if args.msgpack:
+        ds_config.event_codec_msgpack_channels = ['snapshot_in', 'read_service', 'snapshot_out']
+
+    from common.config import DeepStackRuntimeType
+    from common.data.image_repository import ImageRepository
+    from common.deepstack.async_deepstack_client import create_async_deepstack_client
+    from common.deepstack.backend_pool import ReplicaRole
+    from common.event_bus.event_bus_factory import create_event_bus, create_async_event_bus
+    from common.event_bus.event_codec import EventCodec, decode_event
+    from core_fr.async_event_handlers import FrAsyncReadServiceEventHandler
+    from core_fr.utilities import EventChannels
+    from core_od.async_event_handlers import OdAsyncReadServiceEventHandler
+
+    if args.pipeline == 'od':
+        from core_od.deepstack_object_detector import DeepstackObjectDetector
+        from core_od.event_handlers import OdReadServiceEventHandler
+        handler = OdReadServiceEventHandler(DeepstackObjectDetector())
+        in_channel = EventChannels.snapshot_in
+    else:
+        from core_fr.event_handlers import FrReadServiceEventHandler
+        handler = FrReadServiceEventHandler()
+        in_channel = EventChannels.read_service
+
+    sent_at: Dict[str, float] = {}
+    latencies: List[float] = []
+    results_lock = threading.Lock()
+
+    def receive():
+        pub_sub = crate_redis_connection(RedisDb.EVENTBUS).pubsub()
+        pub_sub.subscribe(EventChannels.snapshot_out)
+        for message in pub_sub.listen():
+            if message['type'] != 'message':
+                continue
+            received_at = time.perf_counter()
+            name = decode_event(message['data'])['name']
+            with results_lock:
+                started_at = sent_at.get(name)
+                if started_at is not None:
+                    latencies.append(received_at - started_at)
+
+    def subscribe():
+        if ds_config.runtime_type == DeepStackRuntimeType.Asyncio:
+            asyncio.run(subscribe_async())
+        else:
+            create_event_bus(in_channel).subscribe_async(handler)
+
+    async def subscribe_async():
+        publisher = create_async_event_bus(EventChannels.snapshot_out)
+        if args.pipeline == 'od':
+            async_handler = OdAsyncReadServiceEventHandler(create_async_deepstack_client(ReplicaRole.ObjectDetection), publisher)
+        else:
+            async_handler = FrAsyncReadServiceEventHandler(create_async_deepstack_client(ReplicaRole.FaceRecognition), publisher)
+        await create_async_event_bus(in_channel).subscribe(async_handler, ds_config.async_max_in_flight)
+
+    def run_until_stopped(fn):
+        try:
+            fn()
+        except (RedisError, OSError):
+            pass  # the stand-ins are stopped at the end of the run
+
+    for target in [receive, subscribe]:
+        th = threading.Thread(target=run_until_stopped, args=[target])
+        th.daemon = True
+        th.start()
+    time.sleep(1.)
+
+    frames = [_create_frame(args.width, args.height, index) for index in range(args.cameras)]
+    person_width = args.width // (2 * max(1, args.persons))
+    persons = [{'pred_cls_name': 'person', 'pred_cls_idx': 0, 'pred_score': .9,
+                'box': {'x1': 2 * i * person_width, 'y1': args.height // 4, 'x2': (2 * i + 1) * person_width, 'y2': args.height}}
+               for i in range(args.persons)]
+    images = ImageRepository(crate_redis_connection(RedisDb.MAIN), 60)
+    stop_at = time.perf_counter() + args.duration
+
+    def produce(camera_index: int):
+        publisher = create_event_bus(in_channel)
+        codec = EventCodec(in_channel)
+        source_id = f'camera_{camera_index}'
+        interval = 1. / args.fps
+        seq = 0
+        next_at = time.perf_counter()
+        while next_at < stop_at:
+            # the sequence number after the jpeg end marker makes every frame unique for the result cache
+            frame = frames[camera_index] + str(seq).encode('ascii')
+            name = f'{source_id}:{seq}'
+            if args.pipeline == 'od':
+                dic = {'name': name, 'source_id': source_id, 'ai_clip_enabled': False}
+                image_field = 'base64_image'
+            else:
+                dic = {'name': name, 'source': source_id, 'ai_clip_enabled': False, 'detections': persons, 'channel': 'od_service',
+                       'list_name': 'detected_objects'}
+                image_field = 'img'
+            if args.by_reference:
+                dic['image_key'] = images.add(frame)
+                event = codec.encode(dic)
+            else:
+                event = codec.encode(dic, image_field, frame)
+            with results_lock:
+                sent_at[name] = time.perf_counter()
+            publisher.publish(event)
+            seq += 1
+            next_at += interval
+            time.sleep(max(.0, next_at - time.perf_counter()))
+
+    process = psutil.Process()
+    cpu_before = process.cpu_times()
+    started_at = time.perf_counter()
+    rss_samples: List[int] = []
+    producers = [threading.Thread(target=produce, args=[index]) for index in range(args.cameras)]
+    for producer in producers:
+        producer.daemon = True
+        producer.start()
+    while time.perf_counter() < stop_at + args.drain:
+        rss_samples.append(process.memory_info().rss)
+        time.sleep(.5)
+    elapsed = time.perf_counter() - started_at
+    cpu_after = process.cpu_times()
+
+    try:
+        stub_stats = requests.get(f'http://127.0.0.1:{stub_port}/stats', timeout=5.).json()
+    except BaseException:
+        stub_stats = {}
+    with results_lock:
+        sent_count, values = len(sent_at), list(latencies)
+    cpu_seconds = (cpu_after.user + cpu_after.system) - (cpu_before.user + cpu_before.system)
+    result = {'args': vars(args), 'sent': sent_count, 'received': len(values),
+              'throughput_fps': len(values) / args.duration if args.duration > 0 else .0,
+              'latency_p50_ms': _percentile(values, 50) * 1000., 'latency_p95_ms': _percentile(values, 95) * 1000.,
+              'latency_p99_ms': _percentile(values, 99) * 1000., 'cpu_percent': cpu_seconds / elapsed * 100.,
+              'rss_max_mb': max(rss_samples) / (1024. * 1024.) if len(rss_samples) > 0 else .0,
+              'deepstack_requests': stub_stats.get('requests', 0), 'deepstack_upload_mb': stub_stats.get('received_bytes', 0) / (1024. * 1024.)}
+
+    print(json.dumps(result, indent=4))
+    if len(args.output) > 0:
+        with open(args.output, 'w') as file:
+            json.dump(result, file, indent=4)
+    if len(args.compare) > 0:
+        with open(args.compare) as file:
+            previous = json.load(file)
+        print('metric                        previous        current         change')
+        for key, value in result.items():
+            if key == 'args' or not isinstance(value, (int, float)):
+                continue
+            before = previous.get(key, .0)
+            change = f'{(value - before) / before * 100.:+.1f}%' if before else 'n/a'
+            print(f'{key:<30}{before:<16.2f}{value:<16.2f}{change}')
+
+    stand_ins.terminate()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List
+
+
+def create_detections(count: int, width: int, height: int) -> List[dict]:
+    labels = ['person', 'car', 'dog', 'bicycle', 'truck']
+    ret: List[dict] = []
+    for index in range(count):
+        x_min, y_min = int(width * .1) + index * 10, int(height * .1) + index * 10
+        ret.append({'label': labels[index % len(labels)], 'confidence': .9, 'x_min': x_min, 'y_min': y_min,
+                    'x_max': min(width - 1, x_min + int(width * .2)), 'y_max': min(height - 1, y_min + int(height * .3))})
+    return ret
+
+
+def create_faces(count: int, width: int, height: int) -> List[dict]:
+    ret: List[dict] = []
+    for index, d in enumerate(create_detections(count, width, height)):
+        d.pop('label')
+        d['userid'] = f'user_{index}'
+        ret.append(d)
+    return ret
+
+
+# a DeepStack stand-in which answers after a configurable latency with canned predictions,
+# the request bodies are read but never decoded, so the stub itself costs almost nothing
+class StubDeepStackServer:
+    def __init__(self, latency: float, detection_count: int, width: int, height: int, host: str = '127.0.0.1', port: int = 0):
+        detections = json.dumps({'success': True, 'predictions': create_detections(detection_count, width, height)}).encode('utf-8')
+        faces = json.dumps({'success': True, 'predictions': create_faces(detection_count, width, height)}).encode('utf-8')
+        stub = self
+        self.request_count: int = 0
+        self.received_bytes: int = 0
+        self.__lock = threading.Lock()
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'  # keep-alive
+
+            def do_POST(self):
+                size = stub.read_body(self)
+                time.sleep(latency)
+                if self.path.startswith('/v1/vision/detection'):
+                    body = detections
+                elif self.path.startswith('/v1/vision/face/recognize'):
+                    body = faces
+                else:
+                    body = b'{"success": true}'
+                stub.on_request(size)
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                body = json.dumps({'requests': stub.request_count, 'received_bytes': stub.received_bytes}).encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, fmt, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.host: str = host
+        self.port: int = self.server.server_address[1]
+
+    @staticmethod
+    def read_body(handler: BaseHTTPRequestHandler) -> int:
+        if handler.headers.get('Transfer-Encoding', '').lower() == 'chunked':
+            total = 0
+            while True:
+                size = int(handler.rfile.readline().strip().split(b';')[0], 16)
+                handler.rfile.read(size + 2)
+                total += size
+                if size == 0:
+                    return total
+        length = int(handler.headers.get('Content-Length', 0))
+        handler.rfile.read(length)
+        return length
+
+    def on_request(self, size: int):
+        with self.__lock:
+            self.request_count += 1
+            self.received_bytes += size
+
+    def start(self) -> int:
+        th = threading.Thread(target=self.server.serve_forever)
+        th.daemon = True
+        th.start()
+        return self.port
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
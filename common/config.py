@@ -72,6 +72,17 @@ class DeepStackDockerType(IntEnum):
     ARM64_SERVER = 4
 
 
+class DeepStackRuntimeType(IntEnum):
+    Threaded = 0
+    Asyncio = 1
+
+
+class WorkerOverflowPolicy(IntEnum):
+    Block = 0
+    DropOldest = 1
+    DropNewest = 2
+
+
 class ArchiveActionType(IntEnum):
     Delete = 0
     MoveToNewLocation = 1
@@ -177,6 +188,93 @@ class DeepStackConfig:
         self.fr_enabled: bool = True
         self.fr_threshold: float = .7
         self.docker_type: DeepStackDockerType = DeepStackDockerType.GPU
+        self.worker_count: int = 4
+        self.worker_queue_size: int = 32
+        self.worker_overflow_policy: WorkerOverflowPolicy = WorkerOverflowPolicy.DropOldest
+        self.od_max_in_flight_per_camera: int = 1
+        self.http_pool_size: int = 16
+        self.http_timeout: float = 30.
+        self.runtime_type: DeepStackRuntimeType = DeepStackRuntimeType.Threaded
+        self.async_max_in_flight: int = 256
+        self.image_by_reference: bool = False
+        self.image_ttl: int = 60  # seconds
+        self.od_motion_gate_enabled: bool = False
+        self.od_motion_gate_threshold: float = .02  # mean absolute difference ratio
+        self.od_motion_gate_size: int = 32  # thumbnail width and height
+        self.od_motion_gate_max_interval: float = 30.  # seconds, a static scene is inferred again after it
+        self.od_motion_gate_reuse_results: bool = False
+        self.result_cache_enabled: bool = True
+        self.result_cache_max_items: int = 1024
+        self.result_cache_max_bytes: int = 8 * 1024 * 1024
+        self.result_cache_ttl: float = 10.  # seconds
+        self.replica_count: int = 1
+        self.fr_replica_count: int = 0  # zero means all replicas serve both object detection and facial recognition
+        self.backend_max_failures: int = 3  # consecutive failures which open the circuit breaker of a backend
+        self.backend_ejection_time: float = 10.  # seconds, the circuit breaker stays open for this long
+        self.metrics_enabled: bool = True
+        self.metrics_host: str = '127.0.0.1'
+        self.metrics_port: int = 9191  # object detection uses this port, facial recognition uses the next one
+        self.fr_train_upload_workers: int = 4
+        self.fr_train_preprocess_workers: int = 0  # zero means the cpu count
+        self.fr_train_max_image_size: int = 1280  # the longest side of the uploaded training images, zero disables the resizing
+        self.fr_backup_generations: int = 3  # the number of the previous backups kept next to the current one
+        self.fr_restore_timeout: float = 60.  # seconds to wait for the DeepStack server to accept the restore
+        self.event_bus_stream_channels: List[str] = []  # e.g. ['snapshot_in', 'read_service'], the others use pub/sub
+        self.event_bus_stream_group: str = 'deepstack_service'
+        self.event_bus_stream_batch_size: int = 16
+        self.event_bus_stream_block_ms: int = 1000
+        self.event_bus_stream_max_len: int = 1000  # approximate, the older entries are trimmed on publish
+        self.event_bus_stream_reclaim_idle_ms: int = 30000  # pending entries of a dead consumer are claimed after it
+        self.event_bus_stream_reclaim_interval: float = 5.  # seconds
+        self.od_mosaic_enabled: bool = False
+        self.od_mosaic_max_batch_size: int = 4  # needs at least the same number of workers (or async_max_in_flight) to fill a batch
+        self.od_mosaic_max_wait_ms: float = 20.
+        self.od_mosaic_max_tile_size: int = 640  # the frames with a longer side are detected alone
+        self.od_zones_enabled: bool = False  # the per-camera ROI and exclusion masks are stored in the deepstack_zones hash
+        self.od_zones_refresh_interval: float = 10.  # seconds
+        self.od_inference_resize_enabled: bool = False
+        self.od_inference_max_size: int = 0  # the longest side sent to DeepStack, zero sends the frames as they are
+        self.od_inference_size_refresh_interval: float = 10.  # seconds, the per-camera sizes are in the deepstack_inference_sizes hash
+        self.event_codec_msgpack_channels: List[str] = []  # e.g. ['snapshot_out'], the others publish json. Both are decoded on every channel
+        self.od_tracker_enabled: bool = False
+        self.od_tracker_iou_threshold: float = .3
+        self.od_tracker_centroid_threshold: float = .5  # ratio of the track box diagonal, used for the boxes which do not overlap enough
+        self.od_tracker_max_missed: int = 3  # frames, a track which is not matched longer than this dies
+        self.od_tracker_refresh_interval: float = 30.  # seconds, the unchanged tracks are published again after it
+        self.fr_person_gate_enabled: bool = False  # facial recognition runs only on the person boxes reported by object detection
+        self.fr_person_gate_padding: float = .15  # ratio of the person box size added on each side
+        self.fr_person_gate_mosaic: bool = False  # sends the person crops of a frame as a single mosaic instead of one request per crop
+        self.fr_face_cache_enabled: bool = False  # reuses the confirmed identities of the person tracks instead of recognizing every frame
+        self.fr_face_cache_vote_frames: int = 3  # frames voted before an identity is confirmed
+        self.fr_face_cache_reverify_interval: float = 10.  # seconds, a confirmed identity is recognized again after it
+        self.fr_face_cache_iou_threshold: float = .3
+        self.fr_face_cache_track_ttl: float = 5.  # seconds, a person track which is not seen longer than this is removed
+        self.breaker_window_size: int = 20  # the last requests of a backend whose error and slow rates are checked
+        self.breaker_min_requests: int = 10
+        self.breaker_error_rate: float = .5
+        self.breaker_latency_threshold: float = 5.  # seconds, a slower request counts as slow
+        self.breaker_slow_rate: float = .8
+        self.breaker_half_open_requests: int = 1  # probe requests let through when the open time is over
+        self.admission_max_in_flight: int = 64  # per DeepStack client, zero disables
+        self.admission_max_in_flight_bytes: int = 64 * 1024 * 1024  # the image bytes uploaded at the same time, zero disables
+        self.startup_ready_timeout: float = 180.  # seconds to wait for the DeepStack servers to load their models
+        self.startup_probe_initial_delay: float = .25  # seconds, doubled after each failed readiness probe
+        self.startup_probe_max_delay: float = 5.
+        self.startup_warm_up_count: int = 2  # synthetic images sent through each enabled model before the service starts, zero disables
+        self.docker_reuse_containers: bool = True  # the containers are kept on exit and adopted on start if their configuration is the same
+        self.docker_health_check_timeout: float = 3.  # seconds
+        self.docker_cpusets: List[str] = []  # e.g. ['0-3', '4-7'], the cores of each replica container, empty means no pinning
+        self.docker_mem_limit: str = ''  # e.g. '4g' per replica container, empty means no limit
+        self.autotune_enabled: bool = False  # sweeps THREADCOUNT and MODE once per host, the best settings are kept in Redis
+        self.autotune_thread_counts: List[int] = []  # empty means derived from the cpu count
+        self.autotune_performance_modes: List[int] = []  # DeepStackPerformanceMode values, empty means all
+        self.autotune_duration: float = 15.  # seconds to measure each candidate
+        self.autotune_concurrency: int = 4  # requests in flight per replica while measuring
+        self.autotune_max_p95: float = .0  # seconds, the candidates slower than this are not chosen if possible, zero disables
+        self.autotune_sample_dir: str = ''  # the jpeg frames replayed while measuring, empty means synthetic frames
+        self.autotune_retune_enabled: bool = False  # the settings are tuned again on the next start if the queue keeps growing
+        self.autotune_retune_queue_ratio: float = .8  # of worker_queue_size
+        self.autotune_retune_sustained_time: float = 300.  # seconds
 
 
 class ArchiveConfig:
@@ -234,7 +332,13 @@ class Config:
         config_json = obj.__get_connection().get(obj.__get_redis_key())
         if config_json is not None:
             simple_namespace = json.loads(config_json, object_hook=lambda d: SimpleNamespace(**d))
-            obj.__dict__.update(simple_namespace.__dict__)
+            for key, value in simple_namespace.__dict__.items():
+                section = obj.__dict__.get(key)
+                # keeps the default values of the fields which are not saved on redis yet
+                if isinstance(value, SimpleNamespace) and section is not None and hasattr(section, '__dict__'):
+                    section.__dict__.update(value.__dict__)
+                else:
+                    obj.__dict__[key] = value
         return obj
 
     def to_json(self):
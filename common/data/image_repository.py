@@ -0,0 +1,64 @@
+import uuid
+from redis import Redis
+from redis.asyncio import Redis as AsyncRedis
+
+from common.data.base_repository import BaseRepository
+
+
+# the frames are stored once as raw bytes, so the events carry only the key instead of a base64 image
+class ImageRepository(BaseRepository):
+    def __init__(self, connection: Redis, ttl: int):
+        super().__init__(connection, 'images:')
+        self.ttl: int = ttl
+
+    def create_key(self) -> str:
+        return f'{self.namespace}{uuid.uuid4().hex}'
+
+    def add(self, image: bytes) -> str:
+        key = self.create_key()
+        self.connection.set(key, image, ex=self.ttl)
+        return key
+
+    def get(self, key: str) -> bytes | None:
+        return self.connection.get(key)
+
+    # the key is forwarded to the next consumer, so its lifetime is extended
+    def touch(self, key: str):
+        self.connection.expire(key, self.ttl)
+
+
+class AsyncImageRepository(BaseRepository):
+    def __init__(self, connection: AsyncRedis, ttl: int):
+        super().__init__(connection, 'images:')
+        self.ttl: int = ttl
+
+    async def add(self, image: bytes) -> str:
+        key = f'{self.namespace}{uuid.uuid4().hex}'
+        await self.connection.set(key, image, ex=self.ttl)
+        return key
+
+    async def get(self, key: str) -> bytes | None:
+        return await self.connection.get(key)
+
+    async def touch(self, key: str):
+        await self.connection.expire(key, self.ttl)
+
+
+# the image is passed by reference if it is enabled, otherwise it is embedded into the event for the existing consumers.
+# returns the key to publish, an empty key means the image is embedded
+def get_forward_image_key(images: ImageRepository, image: bytes, image_key: str, by_reference: bool) -> str:
+    if not by_reference:
+        return ''
+    if len(image_key) > 0:
+        images.touch(image_key)
+        return image_key
+    return images.add(image)
+
+
+async def get_forward_image_key_async(images: AsyncImageRepository, image: bytes, image_key: str, by_reference: bool) -> str:
+    if not by_reference:
+        return ''
+    if len(image_key) > 0:
+        await images.touch(image_key)
+        return image_key
+    return await images.add(image)
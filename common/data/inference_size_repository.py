@@ -0,0 +1,27 @@
+from typing import Dict
+from redis import Redis
+
+from common.data.base_repository import BaseRepository
+from common.utilities import logger
+
+
+# the per-camera inference sizes (source id => the longest side), the cameras not listed use the config value
+class InferenceSizeRepository(BaseRepository):
+    def __init__(self, connection: Redis):
+        super().__init__(connection, 'deepstack_inference_sizes')
+
+    def add(self, source_id: str, max_size: int):
+        self.connection.hset(self.namespace, source_id, str(max_size))
+
+    def remove(self, source_id: str):
+        self.connection.hdel(self.namespace, source_id)
+
+    def get_all(self) -> Dict[str, int]:
+        ret: Dict[str, int] = {}
+        for key, value in self.connection.hgetall(self.namespace).items():
+            source_id = key.decode(self._encoding)
+            try:
+                ret[source_id] = int(value.decode(self._encoding))
+            except BaseException as ex:
+                logger.error(f'an error occurred while parsing the inference size of camera {source_id}, err: {ex}')
+        return ret
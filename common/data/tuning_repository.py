@@ -0,0 +1,27 @@
+import json
+from redis import Redis
+
+from common.data.base_repository import BaseRepository
+from common.utilities import logger
+
+
+# the best DeepStack container settings per host (hostname => json), measured by the autotuner
+class TuningRepository(BaseRepository):
+    def __init__(self, connection: Redis):
+        super().__init__(connection, 'deepstack_tunings')
+
+    def add(self, host: str, tuning: dict):
+        self.connection.hset(self.namespace, host, json.dumps(tuning))
+
+    def remove(self, host: str):
+        self.connection.hdel(self.namespace, host)
+
+    def get(self, host: str) -> dict | None:
+        value = self.connection.hget(self.namespace, host)
+        if value is None:
+            return None
+        try:
+            return json.loads(value.decode(self._encoding))
+        except BaseException as ex:
+            logger.error(f'an error occurred while parsing the DeepStack tuning of host {host}, err: {ex}')
+            return None
@@ -0,0 +1,29 @@
+import json
+from typing import Dict, List
+from redis import Redis
+
+from common.data.base_repository import BaseRepository
+from common.utilities import logger
+
+
+# the zones of every camera are kept in a single hash (source id => json), so all of them are loaded by one HGETALL.
+# the coordinates are ratios of the frame size (0 - 1), e.g. {"roi": [.1, .4, .7, 1.], "masks": [[[0, 0], [.3, 0], [.3, .2]]]}
+class ZoneRepository(BaseRepository):
+    def __init__(self, connection: Redis):
+        super().__init__(connection, 'deepstack_zones')
+
+    def add(self, source_id: str, roi: List[float] | None, masks: List[List[List[float]]]):
+        self.connection.hset(self.namespace, source_id, json.dumps({'roi': roi, 'masks': masks}))
+
+    def remove(self, source_id: str):
+        self.connection.hdel(self.namespace, source_id)
+
+    def get_all(self) -> Dict[str, dict]:
+        ret: Dict[str, dict] = {}
+        for key, value in self.connection.hgetall(self.namespace).items():
+            source_id = key.decode(self._encoding)
+            try:
+                ret[source_id] = json.loads(value.decode(self._encoding))
+            except BaseException as ex:
+                logger.error(f'an error occurred while parsing the zones of camera {source_id}, err: {ex}')
+        return ret
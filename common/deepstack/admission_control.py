@@ -0,0 +1,31 @@
+import threading
+
+
+# caps the requests and the image bytes in flight, a request over the limits is rejected at once instead of queueing,
+# so the memory stays bounded while DeepStack is slow
+class AdmissionControl:
+    def __init__(self, max_in_flight: int, max_in_flight_bytes: int):
+        self.max_in_flight: int = max_in_flight
+        self.max_in_flight_bytes: int = max_in_flight_bytes
+        self.__lock = threading.Lock()
+        self.in_flight: int = 0
+        self.in_flight_bytes: int = 0
+        self.rejected_count: int = 0
+
+    def try_admit(self, size: int) -> bool:
+        with self.__lock:
+            if self.max_in_flight > 0 and self.in_flight >= self.max_in_flight:
+                self.rejected_count += 1
+                return False
+            # a single image larger than the byte limit is still admitted when nothing else is in flight
+            if self.max_in_flight_bytes > 0 and self.in_flight > 0 and self.in_flight_bytes + size > self.max_in_flight_bytes:
+                self.rejected_count += 1
+                return False
+            self.in_flight += 1
+            self.in_flight_bytes += size
+            return True
+
+    def release(self, size: int):
+        with self.__lock:
+            self.in_flight -= 1
+            self.in_flight_bytes -= size
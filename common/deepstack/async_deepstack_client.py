@@ -0,0 +1,84 @@
+import time
+from typing import List
+import aiohttp
+
+from common.deepstack.admission_control import AdmissionControl
+from common.deepstack.backend_pool import BackendPool, ReplicaRole, create_backend_pool
+from common.deepstack.deepstack_client import DeepStackError, acquire_backend, create_admission_control
+from common.deepstack.result_cache import ResultCache, create_result_cache
+from common.metrics import in_flight, stage_seconds
+from common.utilities import config
+
+
+# asyncio counterpart of DeepStackClient, the connections are kept alive by the aiohttp connector
+class AsyncDeepStackClient:
+    def __init__(self, backends: BackendPool, api_key: str, pool_size: int, timeout: float, cache: ResultCache | None = None,
+                 admission: AdmissionControl | None = None):
+        self.backends: BackendPool = backends
+        self.api_key: str = api_key
+        self.pool_size: int = max(1, int(pool_size))
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.cache: ResultCache | None = cache
+        self.admission: AdmissionControl | None = admission
+        self.__session: aiohttp.ClientSession | None = None
+
+    def __get_session(self) -> aiohttp.ClientSession:
+        # the session must be created in a running event loop
+        if self.__session is None or self.__session.closed:
+            connector = aiohttp.TCPConnector(limit=self.pool_size, keepalive_timeout=60.)
+            self.__session = aiohttp.ClientSession(connector=connector, timeout=self.timeout)
+        return self.__session
+
+    async def detect_objects(self, image: bytes, min_confidence: float) -> List[dict]:
+        return await self.__post_image('/v1/vision/detection', image, min_confidence)
+
+    async def recognize_faces(self, image: bytes, min_confidence: float) -> List[dict]:
+        return await self.__post_image('/v1/vision/face/recognize', image, min_confidence)
+
+    async def __post_image(self, endpoint: str, image: bytes, min_confidence: float) -> List[dict]:
+        key = None
+        if self.cache is not None:
+            key = ResultCache.create_key(image, endpoint, min_confidence)
+            predictions = self.cache.get(key)
+            if predictions is not None:
+                return predictions
+        form = aiohttp.FormData()
+        form.add_field('image', image, filename='image.jpg', content_type='application/octet-stream')
+        form.add_field('min_confidence', str(min_confidence))
+        if len(self.api_key) > 0:
+            form.add_field('api_key', self.api_key)
+        backend, generation = acquire_backend(self.backends, self.admission, len(image), endpoint)
+        succeeded = False
+        in_flight.inc(endpoint=endpoint)
+        started_at = time.perf_counter()
+        try:
+            async with self.__get_session().post(f'{backend.url}{endpoint}', data=form) as response:
+                # an error response of a working server (e.g. an invalid image) is not a backend failure
+                succeeded = response.status < 500
+                try:
+                    dic = await response.json(content_type=None)
+                except ValueError:
+                    raise DeepStackError(f'DeepStack server returned an invalid response, status: {response.status}')
+        finally:
+            elapsed = time.perf_counter() - started_at
+            self.backends.release(backend, generation, succeeded, elapsed)
+            if self.admission is not None:
+                self.admission.release(len(image))
+            in_flight.dec(endpoint=endpoint)
+            stage_seconds.observe(elapsed, stage='deepstack', channel=endpoint)
+        if not dic.get('success', False):
+            raise DeepStackError(dic.get('error', f'DeepStack server returned an error, status: {response.status}'))
+        predictions = dic.get('predictions', [])
+        if key is not None:
+            self.cache.put(key, predictions)
+        return predictions
+
+    async def close(self):
+        if self.__session is not None:
+            await self.__session.close()
+
+
+def create_async_deepstack_client(role: ReplicaRole) -> AsyncDeepStackClient:
+    ds_config = config.deep_stack
+    return AsyncDeepStackClient(create_backend_pool(ds_config, role), ds_config.api_key, ds_config.async_max_in_flight,
+                                ds_config.http_timeout, create_result_cache(ds_config), create_admission_control(ds_config))
@@ -0,0 +1,95 @@
+import threading
+import time
+from enum import IntEnum
+from typing import Callable, List, Tuple
+
+from common.config import DeepStackConfig
+from common.deepstack.circuit_breaker import CircuitBreaker
+from common.metrics import circuit_state, metrics
+from common.utilities import logger
+
+
+class ReplicaRole(IntEnum):
+    All = 0
+    ObjectDetection = 1
+    FaceRecognition = 2
+
+
+# the replicas listen on consecutive ports starting from server_port. If fr_replica_count is greater than zero,
+# the last fr_replica_count replicas serve only facial recognition and the others serve only object detection
+def get_replica_roles(ds_config: DeepStackConfig) -> List[ReplicaRole]:
+    replica_count = max(1, int(ds_config.replica_count))
+    fr_replica_count = int(ds_config.fr_replica_count)
+    if fr_replica_count <= 0 or not ds_config.od_enabled or not ds_config.fr_enabled:
+        return [ReplicaRole.All] * replica_count
+    fr_replica_count = min(fr_replica_count, replica_count - 1)
+    if fr_replica_count == 0:
+        logger.warning('replica count is not enough to split the roles, all replicas will serve both object detection and facial recognition')
+        return [ReplicaRole.All] * replica_count
+    return [ReplicaRole.ObjectDetection] * (replica_count - fr_replica_count) + [ReplicaRole.FaceRecognition] * fr_replica_count
+
+
+def get_backend_urls(ds_config: DeepStackConfig, role: ReplicaRole) -> List[str]:
+    ret: List[str] = []
+    for index, replica_role in enumerate(get_replica_roles(ds_config)):
+        if replica_role == ReplicaRole.All or role == ReplicaRole.All or replica_role == role:
+            ret.append(f'{ds_config.server_url}:{ds_config.server_port + index}')
+    return ret
+
+
+class Backend:
+    def __init__(self, url: str, breaker: CircuitBreaker):
+        self.url: str = url
+        self.breaker: CircuitBreaker = breaker
+        self.outstanding: int = 0
+        self.request_count: int = 0
+        self.failure_count: int = 0
+
+
+# routes each request to the replica with the fewest outstanding requests whose circuit breaker lets it through.
+# If every breaker is open, acquire returns None and the request is shed instead of waiting for a timeout
+class BackendPool:
+    def __init__(self, urls: List[str], create_breaker: Callable[[str], CircuitBreaker]):
+        if len(urls) == 0:
+            raise ValueError('backend pool needs at least one url')
+        self.backends: List[Backend] = [Backend(url, create_breaker(url)) for url in urls]
+        self.__lock = threading.Lock()
+        metrics.add_collector(self.__collect)
+
+    # returns the backend and the breaker generation to pass to release
+    def acquire(self) -> Tuple[Backend, int] | None:
+        now = time.monotonic()
+        with self.__lock:
+            for backend in sorted(self.backends, key=lambda b: b.outstanding):
+                generation = backend.breaker.try_acquire(now)
+                if generation is not None:
+                    backend.outstanding += 1
+                    backend.request_count += 1
+                    return backend, generation
+            return None
+
+    def release(self, backend: Backend, generation: int, succeeded: bool, latency: float):
+        with self.__lock:
+            backend.outstanding -= 1
+            if not succeeded:
+                backend.failure_count += 1
+        backend.breaker.record(generation, succeeded, latency)
+
+    def get_stats(self) -> List[dict]:
+        now = time.monotonic()
+        with self.__lock:
+            return [{'url': b.url, 'outstanding': b.outstanding, 'requests': b.request_count, 'failures': b.failure_count,
+                     'state': b.breaker.state.name, 'healthy': b.breaker.is_available(now)} for b in self.backends]
+
+    def __collect(self):
+        for backend in self.backends:
+            circuit_state.set(int(backend.breaker.state), backend=backend.url)
+
+
+def create_backend_pool(ds_config: DeepStackConfig, role: ReplicaRole) -> BackendPool:
+    def create_breaker(url: str) -> CircuitBreaker:
+        return CircuitBreaker(url, ds_config.backend_max_failures, ds_config.backend_ejection_time, ds_config.breaker_window_size,
+                              ds_config.breaker_min_requests, ds_config.breaker_error_rate, ds_config.breaker_latency_threshold,
+                              ds_config.breaker_slow_rate, ds_config.breaker_half_open_requests)
+
+    return BackendPool(get_backend_urls(ds_config, role), create_breaker)
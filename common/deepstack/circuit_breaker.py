@@ -0,0 +1,103 @@
+import threading
+import time
+from collections import deque
+from enum import IntEnum
+
+from common.utilities import logger
+
+
+class CircuitState(IntEnum):
+    Closed = 0
+    Open = 1
+    HalfOpen = 2
+
+
+# opens when a backend fails max_failures times in a row or the error or slow rate of its recent requests exceeds the thresholds.
+# while it is open the requests are shed immediately instead of waiting for a timeout, after open_time a few probe requests
+# are let through (half-open) and their success closes it again
+class CircuitBreaker:
+    def __init__(self, name: str, max_failures: int, open_time: float, window_size: int, min_requests: int, error_rate: float,
+                 latency_threshold: float, slow_rate: float, half_open_requests: int):
+        self.name: str = name
+        self.max_failures: int = max(1, int(max_failures))
+        self.open_time: float = open_time
+        self.min_requests: int = max(1, int(min_requests))
+        self.error_rate: float = error_rate
+        self.latency_threshold: float = latency_threshold
+        self.slow_rate: float = slow_rate
+        self.half_open_requests: int = max(1, int(half_open_requests))
+        self.state: CircuitState = CircuitState.Closed
+        self.__lock = threading.Lock()
+        # (failed, slow) of the last requests
+        self.__window = deque(maxlen=max(1, int(window_size)))
+        self.__consecutive_failures: int = 0
+        self.__open_until: float = .0
+        self.__probes: int = 0
+        self.__probe_successes: int = 0
+        # incremented on every state change, a request is tagged with the generation it was admitted under,
+        # so a request sent before the breaker opened is never taken for a half-open probe
+        self.__generation: int = 0
+        self.opened_count: int = 0
+
+    # returns the generation to pass to record, or None if the request is shed
+    def try_acquire(self, now: float) -> int | None:
+        with self.__lock:
+            if self.state == CircuitState.Open:
+                if now < self.__open_until:
+                    return None
+                self.__set_state(CircuitState.HalfOpen)
+                self.__probes, self.__probe_successes = 0, 0
+                logger.info(f'circuit breaker of {self.name} is half-open')
+            if self.state == CircuitState.HalfOpen:
+                if self.__probes >= self.half_open_requests:
+                    return None
+                self.__probes += 1
+            return self.__generation
+
+    def is_available(self, now: float) -> bool:
+        with self.__lock:
+            if self.state == CircuitState.Open:
+                return now >= self.__open_until
+            if self.state == CircuitState.HalfOpen:
+                return self.__probes < self.half_open_requests
+            return True
+
+    def record(self, generation: int, succeeded: bool, latency: float):
+        slow = latency >= self.latency_threshold
+        with self.__lock:
+            if generation != self.__generation:
+                return  # admitted under a previous state
+            if self.state == CircuitState.HalfOpen:
+                self.__probes = max(0, self.__probes - 1)
+                if not succeeded or slow:
+                    self.__open()
+                    return
+                self.__probe_successes += 1
+                if self.__probe_successes >= self.half_open_requests:
+                    self.__set_state(CircuitState.Closed)
+                    self.__window.clear()
+                    self.__consecutive_failures = 0
+                    logger.warning(f'circuit breaker of {self.name} has been closed')
+                return
+            self.__window.append((not succeeded, slow))
+            self.__consecutive_failures = 0 if succeeded else self.__consecutive_failures + 1
+            if self.__consecutive_failures >= self.max_failures:
+                self.__open()
+                return
+            if len(self.__window) >= self.min_requests:
+                failed_count = sum(1 for failed, _ in self.__window if failed)
+                slow_count = sum(1 for _, s in self.__window if s)
+                if failed_count / len(self.__window) >= self.error_rate or slow_count / len(self.__window) >= self.slow_rate:
+                    self.__open()
+
+    def __set_state(self, state: CircuitState):
+        self.state = state
+        self.__generation += 1
+
+    def __open(self):
+        self.__set_state(CircuitState.Open)
+        self.__open_until = time.monotonic() + self.open_time
+        self.__consecutive_failures = 0
+        self.__window.clear()
+        self.opened_count += 1
+        logger.warning(f'circuit breaker of {self.name} has been opened for {self.open_time} seconds')
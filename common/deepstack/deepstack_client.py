@@ -0,0 +1,118 @@
+import time
+from typing import List, Tuple
+import requests
+from requests.adapters import HTTPAdapter
+
+from common.config import DeepStackConfig
+from common.deepstack.admission_control import AdmissionControl
+from common.deepstack.backend_pool import Backend, BackendPool, ReplicaRole, create_backend_pool
+from common.deepstack.result_cache import ResultCache, create_result_cache
+from common.metrics import dropped_total, in_flight, stage_seconds
+from common.utilities import config
+
+
+class DeepStackError(Exception):
+    pass
+
+
+# the request has been shed without being sent, because every circuit breaker is open or the in-flight limits are reached
+class DeepStackUnavailableError(DeepStackError):
+    pass
+
+
+# uploads the already encoded image bytes over a keep-alive connection pool instead of deepstack_sdk's one connection per call
+class DeepStackClient:
+    def __init__(self, backends: BackendPool, api_key: str, pool_size: int, timeout: float, cache: ResultCache | None = None,
+                 admission: AdmissionControl | None = None):
+        self.backends: BackendPool = backends
+        self.api_key: str = api_key
+        self.timeout: float = timeout
+        self.cache: ResultCache | None = cache
+        self.admission: AdmissionControl | None = admission
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=len(backends.backends), pool_maxsize=max(1, int(pool_size)), pool_block=True)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def detect_objects(self, image: bytes, min_confidence: float) -> List[dict]:
+        return self.__post_image('/v1/vision/detection', image, min_confidence)
+
+    def recognize_faces(self, image: bytes, min_confidence: float) -> List[dict]:
+        return self.__post_image('/v1/vision/face/recognize', image, min_confidence)
+
+    def __post_image(self, endpoint: str, image: bytes, min_confidence: float) -> List[dict]:
+        key = None
+        if self.cache is not None:
+            key = ResultCache.create_key(image, endpoint, min_confidence)
+            predictions = self.cache.get(key)
+            if predictions is not None:
+                return predictions
+        data = {'min_confidence': min_confidence}
+        response = self.post(endpoint, data=data, files={'image': ('image.jpg', image, 'application/octet-stream')})
+        predictions = response.get('predictions', [])
+        if key is not None:
+            self.cache.put(key, predictions)
+        return predictions
+
+    def post(self, endpoint: str, data: dict = None, files: dict = None) -> dict:
+        data = dict(data) if data is not None else {}
+        if len(self.api_key) > 0:
+            data['api_key'] = self.api_key
+        size = get_payload_size(files)
+        backend, generation = acquire_backend(self.backends, self.admission, size, endpoint)
+        succeeded = False
+        in_flight.inc(endpoint=endpoint)
+        started_at = time.perf_counter()
+        try:
+            response = self.session.post(f'{backend.url}{endpoint}', data=data, files=files, timeout=self.timeout)
+            # an error response of a working server (e.g. an invalid image) is not a backend failure
+            succeeded = response.status_code < 500
+        finally:
+            elapsed = time.perf_counter() - started_at
+            self.backends.release(backend, generation, succeeded, elapsed)
+            if self.admission is not None:
+                self.admission.release(size)
+            in_flight.dec(endpoint=endpoint)
+            stage_seconds.observe(elapsed, stage='deepstack', channel=endpoint)
+        try:
+            dic = response.json()
+        except ValueError:
+            raise DeepStackError(f'DeepStack server returned an invalid response, status: {response.status_code}')
+        if not dic.get('success', False):
+            raise DeepStackError(dic.get('error', f'DeepStack server returned an error, status: {response.status_code}'))
+        return dic
+
+    def close(self):
+        self.session.close()
+
+
+def get_payload_size(files: dict | None) -> int:
+    if files is None:
+        return 0
+    return sum(len(f[1]) for f in files.values() if isinstance(f, tuple) and isinstance(f[1], bytes))
+
+
+# sheds the request at once (DeepStackUnavailableError) instead of letting it wait for a timeout on a broken or overloaded server
+def acquire_backend(backends: BackendPool, admission: AdmissionControl | None, size: int, endpoint: str) -> Tuple[Backend, int]:
+    if admission is not None and not admission.try_admit(size):
+        dropped_total.inc(reason='admission', channel=endpoint)
+        raise DeepStackUnavailableError(f'DeepStack request has been shed, in-flight limits are reached ({endpoint})')
+    acquired = backends.acquire()
+    if acquired is None:
+        if admission is not None:
+            admission.release(size)
+        dropped_total.inc(reason='circuit_open', channel=endpoint)
+        raise DeepStackUnavailableError(f'DeepStack request has been shed, circuit breakers of all backends are open ({endpoint})')
+    return acquired
+
+
+def create_admission_control(ds_config: DeepStackConfig) -> AdmissionControl | None:
+    if ds_config.admission_max_in_flight <= 0 and ds_config.admission_max_in_flight_bytes <= 0:
+        return None
+    return AdmissionControl(ds_config.admission_max_in_flight, ds_config.admission_max_in_flight_bytes)
+
+
+def create_deepstack_client(role: ReplicaRole) -> DeepStackClient:
+    ds_config = config.deep_stack
+    return DeepStackClient(create_backend_pool(ds_config, role), ds_config.api_key, ds_config.http_pool_size, ds_config.http_timeout,
+                           create_result_cache(ds_config), create_admission_control(ds_config))
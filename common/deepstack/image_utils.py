@@ -0,0 +1,42 @@
+import io
+from typing import Any
+from PIL import Image
+
+# the formats DeepStack server can decode by itself, the bytes of these formats are uploaded unchanged
+_jpeg_magic = b'\xff\xd8\xff'
+_png_magic = b'\x89PNG\r\n\x1a\n'
+_bmp_magic = b'BM'
+_gif_magic = b'GIF8'
+
+
+def is_encoded_image(data: bytes) -> bool:
+    if data is None or len(data) < 12:
+        return False
+    return data.startswith(_jpeg_magic) or data.startswith(_png_magic) or data.startswith(_gif_magic) or data.startswith(
+        _bmp_magic) or (data[:4] == b'RIFF' and data[8:12] == b'WEBP')
+
+
+def is_jpeg(data: bytes) -> bool:
+    return data is not None and data.startswith(_jpeg_magic)
+
+
+def encode_pil_image(image: Image, quality: int = 90) -> bytes:
+    if image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+    buffer = io.BytesIO()
+    image.save(buffer, format='JPEG', quality=quality)
+    return buffer.getvalue()
+
+
+# returns the image as encoded bytes, decoding and re-encoding takes place only if the input is not encoded already
+def to_encoded_image(image: Any) -> bytes:
+    if isinstance(image, (bytes, bytearray, memoryview)):
+        data = bytes(image)
+        if is_encoded_image(data):
+            return data
+        # raises UnidentifiedImageError if it is not an image at all
+        return encode_pil_image(Image.open(io.BytesIO(data)))
+    if isinstance(image, Image.Image):
+        return encode_pil_image(image)
+    # numpy array
+    return encode_pil_image(Image.fromarray(image))
@@ -0,0 +1,144 @@
+import io
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Tuple
+
+import numpy as np
+import requests
+from PIL import Image
+
+from common.config import DeepStackConfig
+from common.deepstack.backend_pool import ReplicaRole, get_replica_roles
+from common.utilities import logger
+
+_detection_endpoint = '/v1/vision/detection'
+_face_endpoint = '/v1/vision/face/recognize'
+
+
+# the durations of the startup phases (containers, readiness, warm-up, restore etc.) in the order they are measured
+class StartupTimings:
+    def __init__(self):
+        self.phases: List[Tuple[str, float]] = []
+        self.started_at: float = time.perf_counter()
+
+    def measure(self, name: str) -> '_PhaseTimer':
+        return _PhaseTimer(self, name)
+
+    def report(self):
+        total = time.perf_counter() - self.started_at
+        phases = ', '.join(f'{name}: {elapsed:.2f}s' for name, elapsed in self.phases)
+        logger.warning(f'DeepStack service startup took {total:.2f}s ({phases})')
+
+
+class _PhaseTimer:
+    def __init__(self, timings: StartupTimings, name: str):
+        self.timings = timings
+        self.name = name
+        self.start: float = .0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.timings.phases.append((self.name, time.perf_counter() - self.start))
+        return False
+
+
+def create_synthetic_image(width: int = 640, height: int = 480) -> bytes:
+    gradient = np.linspace(0, 255, width, dtype=np.uint8)[None, :, None].repeat(height, 0).repeat(3, 2)
+    buffer = io.BytesIO()
+    Image.fromarray(gradient).save(buffer, format='JPEG', quality=80)
+    return buffer.getvalue()
+
+
+# the model endpoints which the replica serves, see get_replica_roles
+def get_replica_endpoints(ds_config: DeepStackConfig) -> Dict[str, List[str]]:
+    ret: Dict[str, List[str]] = {}
+    for index, role in enumerate(get_replica_roles(ds_config)):
+        endpoints: List[str] = []
+        if ds_config.od_enabled and role != ReplicaRole.FaceRecognition:
+            endpoints.append(_detection_endpoint)
+        if ds_config.fr_enabled and role != ReplicaRole.ObjectDetection:
+            endpoints.append(_face_endpoint)
+        ret[f'{ds_config.server_url}:{ds_config.server_port + index}'] = endpoints
+    return ret
+
+
+# polls the replicas with an exponential backoff until they accept the connections, then sends a synthetic image through each
+# enabled model, so the models are loaded before the restore and the first real frame
+class ReadinessProbe:
+    def __init__(self, endpoints: Dict[str, List[str]], api_key: str, timeout: float, initial_delay: float, max_delay: float,
+                 warm_up_count: int):
+        self.endpoints: Dict[str, List[str]] = endpoints
+        self.api_key: str = api_key
+        self.timeout: float = timeout
+        self.initial_delay: float = initial_delay
+        self.max_delay: float = max_delay
+        self.warm_up_count: int = max(0, int(warm_up_count))
+
+    def wait_until_ready(self) -> bool:
+        deadline = time.monotonic() + self.timeout
+        with ThreadPoolExecutor(max_workers=max(1, len(self.endpoints))) as executor:
+            results = list(executor.map(lambda url: self.__wait_for_server(url, deadline), self.endpoints.keys()))
+        return all(results)
+
+    def warm_up(self) -> bool:
+        if self.warm_up_count == 0:
+            return True
+        deadline = time.monotonic() + self.timeout
+        image = create_synthetic_image()
+        jobs = [(url, endpoint) for url, endpoints in self.endpoints.items() for endpoint in endpoints]
+        if len(jobs) == 0:
+            return True
+        with ThreadPoolExecutor(max_workers=len(jobs)) as executor:
+            results = list(executor.map(lambda job: self.__warm_up_model(job[0], job[1], image, deadline), jobs))
+        return all(results)
+
+    def __wait_for_server(self, url: str, deadline: float) -> bool:
+        delay = self.initial_delay
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                # any http response means the server is listening, the models are checked by the warm-up
+                requests.get(url, timeout=max(1., delay))
+                logger.info(f'DeepStack server {url} is reachable after {attempt} attempt(s)')
+                return True
+            except requests.RequestException as ex:
+                if time.monotonic() + delay > deadline:
+                    logger.error(f'DeepStack server {url} is not reachable after {attempt} attempt(s), err: {ex}')
+                    return False
+            time.sleep(delay)
+            delay = min(delay * 2., self.max_delay)
+
+    # a model which is still loading fails or answers with a server error, so the warm-up is retried until the first success
+    def __warm_up_model(self, url: str, endpoint: str, image: bytes, deadline: float) -> bool:
+        data = {'min_confidence': .9}
+        if len(self.api_key) > 0:
+            data['api_key'] = self.api_key
+        delay = self.initial_delay
+        sent = 0
+        while sent < self.warm_up_count:
+            started_at = time.perf_counter()
+            try:
+                response = requests.post(f'{url}{endpoint}', data=data, files={'image': ('image.jpg', image, 'application/octet-stream')},
+                                         timeout=max(1., deadline - time.monotonic()))
+                if response.status_code < 500:
+                    sent += 1
+                    logger.info(f'DeepStack model {url}{endpoint} warm-up request took {time.perf_counter() - started_at:.2f}s')
+                    continue
+                err = f'status: {response.status_code}'
+            except requests.RequestException as ex:
+                err = str(ex)
+            if time.monotonic() + delay > deadline:
+                logger.error(f'DeepStack model {url}{endpoint} could not be warmed up, err: {err}')
+                return False
+            time.sleep(delay)
+            delay = min(delay * 2., self.max_delay)
+        return True
+
+
+def create_readiness_probe(ds_config: DeepStackConfig) -> ReadinessProbe:
+    return ReadinessProbe(get_replica_endpoints(ds_config), ds_config.api_key, ds_config.startup_ready_timeout,
+                          ds_config.startup_probe_initial_delay, ds_config.startup_probe_max_delay, ds_config.startup_warm_up_count)
@@ -0,0 +1,87 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import List
+
+from common.config import DeepStackConfig
+
+
+class _CacheEntry:
+    def __init__(self, predictions: List[dict], size: int, expires_at: float):
+        self.predictions: List[dict] = predictions
+        self.size: int = size
+        self.expires_at: float = expires_at
+
+
+# caches the DeepStack predictions by the content hash of the encoded image, so a duplicate frame costs no inference
+class ResultCache:
+    def __init__(self, max_items: int, max_bytes: int, ttl: float):
+        self.max_items: int = max(1, int(max_items))
+        self.max_bytes: int = max(1, int(max_bytes))
+        self.ttl: float = ttl
+        self.__lock = threading.Lock()
+        self.__entries: OrderedDict = OrderedDict()
+        self.__total_bytes: int = 0
+        self.hit_count: int = 0
+        self.miss_count: int = 0
+        self.evicted_count: int = 0
+
+    @staticmethod
+    def create_key(image: bytes, model: str, min_confidence: float) -> bytes:
+        digest = hashlib.blake2b(image, digest_size=16).digest()
+        return digest + f'{model}:{min_confidence}'.encode('utf-8')
+
+    def get(self, key: bytes) -> List[dict] | None:
+        with self.__lock:
+            entry: _CacheEntry = self.__entries.get(key)
+            if entry is None:
+                self.miss_count += 1
+                return None
+            if entry.expires_at < time.monotonic():
+                self.__remove(key)
+                self.miss_count += 1
+                return None
+            self.__entries.move_to_end(key)
+            self.hit_count += 1
+            return entry.predictions
+
+    def put(self, key: bytes, predictions: List[dict]):
+        # the key, the entry and the predictions are counted roughly, the predictions are small json objects
+        size = len(key) + 64 + len(json.dumps(predictions))
+        if size > self.max_bytes:
+            return
+        with self.__lock:
+            if key in self.__entries:
+                self.__remove(key)
+            self.__entries[key] = _CacheEntry(predictions, size, time.monotonic() + self.ttl)
+            self.__total_bytes += size
+            self.__evict()
+
+    def __evict(self):
+        now = time.monotonic()
+        # the least recently used entries are at the beginning
+        while len(self.__entries) > 0:
+            key, entry = next(iter(self.__entries.items()))
+            if len(self.__entries) > self.max_items or self.__total_bytes > self.max_bytes or entry.expires_at < now:
+                self.__remove(key)
+                self.evicted_count += 1
+            else:
+                break
+
+    def __remove(self, key: bytes):
+        entry = self.__entries.pop(key)
+        self.__total_bytes -= entry.size
+
+    def get_stats(self) -> dict:
+        with self.__lock:
+            total = self.hit_count + self.miss_count
+            return {'items': len(self.__entries), 'bytes': self.__total_bytes, 'hits': self.hit_count, 'misses': self.miss_count,
+                    'evicted': self.evicted_count, 'hit_rate': self.hit_count / total if total > 0 else .0}
+
+
+def create_result_cache(ds_config: DeepStackConfig) -> ResultCache | None:
+    if not ds_config.result_cache_enabled:
+        return None
+    return ResultCache(ds_config.result_cache_max_items, ds_config.result_cache_max_bytes, ds_config.result_cache_ttl)
@@ -0,0 +1,54 @@
+import asyncio
+from enum import Enum
+
+from common.config import WorkerOverflowPolicy
+from common.event_bus.event_handler import AsyncEventHandler
+from common.metrics import dropped_total
+from common.utilities import crate_async_redis_connection, RedisDb, logger, config
+
+
+# asyncio counterpart of EventBus, the handlers run as tasks on a single event loop instead of OS threads
+class AsyncEventBus:
+    def __init__(self, channel: str):
+        self.connection = crate_async_redis_connection(RedisDb.EVENTBUS, True, 2)
+        self.channel = channel
+        self.channel_name: str = channel.value if isinstance(channel, Enum) else channel
+        self.dropped_count: int = 0
+        self.__tasks = set()
+
+    async def publish(self, event):
+        await self.connection.publish(self.channel, event)
+
+    async def subscribe(self, event_handler: AsyncEventHandler, max_in_flight: int):
+        semaphore = asyncio.Semaphore(max(1, int(max_in_flight)))
+        block = config.deep_stack.worker_overflow_policy == WorkerOverflowPolicy.Block
+        pub_sub = self.connection.pubsub()
+        await pub_sub.subscribe(self.channel)
+        async for event in pub_sub.listen():
+            if event is None or event['type'] != 'message':
+                continue
+            if semaphore.locked() and not block:
+                self.__on_dropped()
+                continue
+            await semaphore.acquire()
+            task = asyncio.create_task(self.__handle(event_handler, event, semaphore))
+            self.__tasks.add(task)  # keeps a strong reference until the task is done
+            task.add_done_callback(self.__tasks.discard)
+
+    @staticmethod
+    async def __handle(event_handler: AsyncEventHandler, event, semaphore: asyncio.Semaphore):
+        try:
+            await event_handler.handle(event)
+        except BaseException as ex:
+            logger.error(f'an error occurred while handling an async event, err: {ex}')
+        finally:
+            semaphore.release()
+
+    def __on_dropped(self):
+        self.dropped_count += 1
+        dropped_total.inc(reason='queue_full', channel=self.channel_name)
+        if self.dropped_count == 1 or self.dropped_count % 100 == 0:
+            logger.warning(f'{self.channel} async event bus is saturated, total dropped event count: {self.dropped_count}')
+
+    async def close(self):
+        await self.connection.close()
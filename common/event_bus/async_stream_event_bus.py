@@ -0,0 +1,121 @@
+import asyncio
+import time
+from enum import Enum
+from typing import List
+
+from redis.exceptions import ResponseError
+
+from common.config import WorkerOverflowPolicy
+from common.event_bus.event_handler import AsyncEventHandler
+from common.event_bus.stream_event_bus import get_stream_key, get_consumer_name, get_claimable_ids, get_reclaim_scan_count, \
+    to_event
+from common.metrics import dropped_total
+from common.utilities import crate_async_redis_connection, RedisDb, logger, config
+
+
+# asyncio counterpart of StreamEventBus
+class AsyncStreamEventBus:
+    def __init__(self, channel: str):
+        self.connection = crate_async_redis_connection(RedisDb.EVENTBUS, True, 2)
+        self.channel = channel
+        self.channel_name: str = channel.value if isinstance(channel, Enum) else channel
+        self.stream_key: str = get_stream_key(self.channel_name)
+        ds_config = config.deep_stack
+        self.group: str = ds_config.event_bus_stream_group
+        self.consumer: str = get_consumer_name()
+        self.batch_size: int = max(1, ds_config.event_bus_stream_batch_size)
+        self.block_ms: int = max(1, ds_config.event_bus_stream_block_ms)
+        self.max_len: int = ds_config.event_bus_stream_max_len
+        self.reclaim_idle_ms: int = ds_config.event_bus_stream_reclaim_idle_ms
+        self.reclaim_interval: float = ds_config.event_bus_stream_reclaim_interval
+        self.dropped_count: int = 0
+        self.__tasks = set()
+
+    async def publish(self, event):
+        if self.max_len > 0:
+            await self.connection.xadd(self.stream_key, {'data': event}, maxlen=self.max_len, approximate=True)
+        else:
+            await self.connection.xadd(self.stream_key, {'data': event})
+
+    async def subscribe(self, event_handler: AsyncEventHandler, max_in_flight: int):
+        semaphore = asyncio.Semaphore(max(1, int(max_in_flight)))
+        block = config.deep_stack.worker_overflow_policy == WorkerOverflowPolicy.Block
+        await self.__create_group()
+        logger.info(f'{self.channel_name} stream is consumed by {self.consumer} in the {self.group} group')
+        next_reclaim_at = time.monotonic()
+        while True:
+            events: List[dict] = []
+            if self.reclaim_idle_ms > 0 and time.monotonic() >= next_reclaim_at:
+                next_reclaim_at = time.monotonic() + self.reclaim_interval
+                events.extend(await self.__reclaim())
+            response = await self.connection.xreadgroup(self.group, self.consumer, {self.stream_key: '>'}, count=self.batch_size,
+                                                        block=self.block_ms)
+            for _, entries in response or []:
+                for entry_id, fields in entries:
+                    event = to_event(self.channel_name, entry_id, fields)
+                    if event is None:
+                        await self.connection.xack(self.stream_key, self.group, entry_id)
+                    else:
+                        events.append(event)
+            for event in events:
+                if semaphore.locked() and not block:
+                    self.__on_dropped()
+                    await self.__ack(event)
+                    continue
+                await semaphore.acquire()
+                task = asyncio.create_task(self.__handle(event_handler, event, semaphore))
+                self.__tasks.add(task)  # keeps a strong reference until the task is done
+                task.add_done_callback(self.__tasks.discard)
+
+    async def __handle(self, event_handler: AsyncEventHandler, event: dict, semaphore: asyncio.Semaphore):
+        try:
+            await event_handler.handle(event)
+        except BaseException as ex:
+            logger.error(f'an error occurred while handling an async stream event, err: {ex}')
+        finally:
+            semaphore.release()
+            await self.__ack(event)
+
+    async def __create_group(self):
+        try:
+            # the events published before the group first exists are consumed too
+            await self.connection.xgroup_create(self.stream_key, self.group, id='0', mkstream=True)
+        except ResponseError as ex:
+            if 'BUSYGROUP' not in str(ex):
+                raise
+
+    async def __reclaim(self) -> List[dict]:
+        ret: List[dict] = []
+        try:
+            pending = await self.connection.xpending_range(self.stream_key, self.group, min='-', max='+',
+                                                           count=get_reclaim_scan_count(self.batch_size), idle=self.reclaim_idle_ms)
+            ids = get_claimable_ids(pending, self.consumer, self.batch_size)
+            response = await self.connection.xclaim(self.stream_key, self.group, self.consumer, self.reclaim_idle_ms, ids) \
+                if len(ids) > 0 else []
+        except BaseException as ex:
+            logger.error(f'an error occurred while reclaiming the pending entries of {self.stream_key}, err: {ex}')
+            return ret
+        for entry_id, fields in response:
+            event = to_event(self.channel_name, entry_id, fields)
+            if event is None:
+                await self.connection.xack(self.stream_key, self.group, entry_id)
+            else:
+                ret.append(event)
+        if len(ret) > 0:
+            logger.warning(f'{len(ret)} pending entries of {self.stream_key} have been reclaimed by {self.consumer}')
+        return ret
+
+    async def __ack(self, event: dict):
+        try:
+            await self.connection.xack(self.stream_key, self.group, event['id'])
+        except BaseException as ex:
+            logger.error(f'an error occurred while acknowledging a stream entry, err: {ex}')
+
+    def __on_dropped(self):
+        self.dropped_count += 1
+        dropped_total.inc(reason='queue_full', channel=self.channel_name)
+        if self.dropped_count == 1 or self.dropped_count % 100 == 0:
+            logger.warning(f'{self.channel_name} async stream event bus is saturated, total dropped event count: {self.dropped_count}')
+
+    async def close(self):
+        await self.connection.close()
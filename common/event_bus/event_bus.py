@@ -1,13 +1,18 @@
+from enum import Enum
 from threading import Thread
 
 from common.event_bus.event_handler import EventHandler
-from common.utilities import crate_redis_connection, RedisDb
+from common.event_bus.worker_pool import WorkerPool
+from common.metrics import metrics, queue_depth
+from common.utilities import crate_redis_connection, RedisDb, config
 
 
 class EventBus:
     def __init__(self, channel: str):
         self.connection = crate_redis_connection(RedisDb.EVENTBUS, True, 2)
         self.channel = channel
+        self.channel_name: str = channel.value if isinstance(channel, Enum) else channel
+        self.pool: WorkerPool | None = None
 
     def publish(self, event):  # added for AI service
         self.connection.publish(self.channel, event)
@@ -18,13 +23,20 @@ class EventBus:
         th.start()
 
     def subscribe_async(self, event_handler: EventHandler):
+        ds_config = config.deep_stack
+        self.pool = WorkerPool(self.channel_name, ds_config.worker_count, ds_config.worker_queue_size, ds_config.worker_overflow_policy)
+        self.pool.start()
+        pool = self.pool
+        metrics.add_collector(lambda: queue_depth.set(pool.queue_depth(), channel=self.channel_name))
         pub_sub = self.connection.pubsub()
         pub_sub.subscribe(self.channel)
         for event in pub_sub.listen():
-            th = Thread(target=event_handler.handle, args=[event])
-            th.daemon = True
-            th.start()
+            if event is None or event['type'] != 'message':
+                continue
+            self.pool.submit(event_handler.handle, event)
 
     def unsubscribe(self):
         pub_sub = self.connection.pubsub()
         pub_sub.unsubscribe(self.channel)
+        if self.pool is not None:
+            self.pool.stop()
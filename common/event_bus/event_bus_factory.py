@@ -0,0 +1,21 @@
+from enum import Enum
+
+from common.event_bus.async_event_bus import AsyncEventBus
+from common.event_bus.async_stream_event_bus import AsyncStreamEventBus
+from common.event_bus.event_bus import EventBus
+from common.event_bus.stream_event_bus import StreamEventBus
+from common.utilities import config
+
+
+def is_stream_channel(channel: str) -> bool:
+    channel_name = channel.value if isinstance(channel, Enum) else channel
+    return channel_name in (config.deep_stack.event_bus_stream_channels or [])
+
+
+# the channels listed in event_bus_stream_channels use Redis Streams, the others keep using pub/sub
+def create_event_bus(channel: str) -> EventBus | StreamEventBus:
+    return StreamEventBus(channel) if is_stream_channel(channel) else EventBus(channel)
+
+
+def create_async_event_bus(channel: str) -> AsyncEventBus | AsyncStreamEventBus:
+    return AsyncStreamEventBus(channel) if is_stream_channel(channel) else AsyncEventBus(channel)
@@ -0,0 +1,54 @@
+import base64
+import json
+from enum import Enum
+from typing import Tuple
+
+from common.utilities import config, logger
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+# the json events always start with '{', a msgpack map starts with 0x80 - 0x8f, 0xde or 0xdf, so the format is detected by the first byte
+def decode_event(data: bytes | str) -> dict:
+    if isinstance(data, str) or data[:1] in (b'{', b' ', b'\n'):
+        return json.loads(data)  # json.loads takes the bytes as they are, no need for an intermediate str
+    if msgpack is None:
+        raise ValueError('a msgpack event has been received but msgpack is not installed')
+    return msgpack.unpackb(data, raw=False)
+
+
+# returns the image bytes and the base64 string if the image arrived as base64, which is reused by the json encoder
+def get_event_image(dic: dict, field: str) -> Tuple[bytes | None, str]:
+    value = dic.get(field)
+    if isinstance(value, (bytes, bytearray)):
+        return bytes(value), ''
+    if value:
+        return base64.b64decode(value), value
+    return None, ''
+
+
+# encodes the events of a channel either as msgpack with the raw image bytes or as json with the base64 image.
+# the json of the other fields is built first and the base64 image is spliced into it as bytes,
+# so json.dumps neither scans nor copies the multi-megabyte image string
+class EventCodec:
+    def __init__(self, channel: str):
+        self.channel_name: str = channel.value if isinstance(channel, Enum) else channel
+        self.use_msgpack: bool = self.channel_name in (config.deep_stack.event_codec_msgpack_channels or [])
+        if self.use_msgpack and msgpack is None:
+            logger.warning(f'msgpack is not installed, {self.channel_name} events will be encoded as json')
+            self.use_msgpack = False
+
+    def encode(self, dic: dict, image_field: str = '', image: bytes | None = None, base64_image: str = '') -> bytes:
+        if self.use_msgpack:
+            if len(image_field) > 0:
+                dic[image_field] = image if image is not None else base64.b64decode(base64_image)
+            return msgpack.packb(dic, use_bin_type=True)
+        head = json.dumps(dic).encode('utf-8')
+        if len(image_field) == 0:
+            return head
+        encoded_image = base64_image.encode('ascii') if len(base64_image) > 0 else base64.b64encode(image)
+        separator = b', "' if len(dic) > 0 else b'"'
+        return head[:-1] + separator + image_field.encode('utf-8') + b'": "' + encoded_image + b'"}'
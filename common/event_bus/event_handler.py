@@ -5,3 +5,9 @@ class EventHandler(ABC):
     @abstractmethod
     def handle(self, event):
         pass
+
+
+class AsyncEventHandler(ABC):
+    @abstractmethod
+    async def handle(self, event):
+        pass
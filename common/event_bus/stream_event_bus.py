@@ -0,0 +1,151 @@
+import os
+import socket
+import time
+from enum import Enum
+from threading import Thread
+from typing import List
+
+from redis.exceptions import ResponseError
+
+from common.event_bus.event_handler import EventHandler
+from common.event_bus.worker_pool import WorkerPool
+from common.metrics import metrics, queue_depth
+from common.utilities import crate_redis_connection, RedisDb, config, logger
+
+
+def get_stream_key(channel_name: str) -> str:
+    return f'streams:{channel_name}'
+
+
+# unique per process, so the pending entries of a stopped process are reclaimed by the others
+def get_consumer_name() -> str:
+    return f'{socket.gethostname()}-{os.getpid()}'
+
+
+# more pending entries than the batch are scanned, because the own entries of the consumer may come first
+def get_reclaim_scan_count(batch_size: int) -> int:
+    return batch_size * 8
+
+
+# the entries of this process are still waiting in its own queue, so only the ones of the other consumers are claimed
+def get_claimable_ids(pending: List[dict], consumer: str, batch_size: int) -> List:
+    ret = []
+    for p in pending:
+        owner = p['consumer'].decode('utf-8') if isinstance(p['consumer'], bytes) else p['consumer']
+        if owner != consumer:
+            ret.append(p['message_id'])
+    return ret[:batch_size]
+
+
+# converts a stream entry into the shape of a pub/sub message, so the same event handlers serve both backends
+def to_event(channel_name: str, entry_id, fields) -> dict | None:
+    if not fields:
+        return None
+    data = fields.get(b'data', fields.get('data'))
+    if data is None:
+        return None
+    return {'type': 'message', 'channel': channel_name, 'data': data, 'id': entry_id}
+
+
+# a Redis Streams alternative to the pub/sub EventBus, the consumers in the same group split the events between them
+# and the events published while the service restarts are not lost
+class StreamEventBus:
+    def __init__(self, channel: str):
+        self.connection = crate_redis_connection(RedisDb.EVENTBUS, True, 2)
+        self.channel = channel
+        self.channel_name: str = channel.value if isinstance(channel, Enum) else channel
+        self.stream_key: str = get_stream_key(self.channel_name)
+        ds_config = config.deep_stack
+        self.group: str = ds_config.event_bus_stream_group
+        self.consumer: str = get_consumer_name()
+        self.batch_size: int = max(1, ds_config.event_bus_stream_batch_size)
+        self.block_ms: int = max(1, ds_config.event_bus_stream_block_ms)
+        self.max_len: int = ds_config.event_bus_stream_max_len
+        self.reclaim_idle_ms: int = ds_config.event_bus_stream_reclaim_idle_ms
+        self.reclaim_interval: float = ds_config.event_bus_stream_reclaim_interval
+        self.pool: WorkerPool | None = None
+        self.__stopped = False
+
+    def publish(self, event):
+        if self.max_len > 0:
+            self.connection.xadd(self.stream_key, {'data': event}, maxlen=self.max_len, approximate=True)
+        else:
+            self.connection.xadd(self.stream_key, {'data': event})
+
+    def publish_async(self, event):
+        th = Thread(target=self.publish, args=[event])
+        th.daemon = True
+        th.start()
+
+    def subscribe_async(self, event_handler: EventHandler):
+        ds_config = config.deep_stack
+        self.pool = WorkerPool(self.channel_name, ds_config.worker_count, ds_config.worker_queue_size, ds_config.worker_overflow_policy,
+                               self.__ack)
+        self.pool.start()
+        pool = self.pool
+        metrics.add_collector(lambda: queue_depth.set(pool.queue_depth(), channel=self.channel_name))
+        self.__create_group()
+        logger.info(f'{self.channel_name} stream is consumed by {self.consumer} in the {self.group} group')
+
+        def handle(event: dict):
+            try:
+                event_handler.handle(event)
+            finally:
+                # a failing event is not redelivered, otherwise it would fail again forever
+                self.__ack(event)
+
+        next_reclaim_at = time.monotonic()
+        while not self.__stopped:
+            if self.reclaim_idle_ms > 0 and time.monotonic() >= next_reclaim_at:
+                next_reclaim_at = time.monotonic() + self.reclaim_interval
+                for event in self.__reclaim():
+                    self.pool.submit(handle, event)
+            response = self.connection.xreadgroup(self.group, self.consumer, {self.stream_key: '>'}, count=self.batch_size,
+                                                  block=self.block_ms)
+            for _, entries in response or []:
+                for entry_id, fields in entries:
+                    event = to_event(self.channel_name, entry_id, fields)
+                    if event is None:
+                        self.connection.xack(self.stream_key, self.group, entry_id)
+                        continue
+                    self.pool.submit(handle, event)
+
+    def unsubscribe(self):
+        self.__stopped = True
+        if self.pool is not None:
+            self.pool.stop()
+
+    def __create_group(self):
+        try:
+            # the events published before the group first exists are consumed too
+            self.connection.xgroup_create(self.stream_key, self.group, id='0', mkstream=True)
+        except ResponseError as ex:
+            if 'BUSYGROUP' not in str(ex):
+                raise
+
+    # claims the entries which were delivered to another consumer that has not acknowledged them for a while (e.g. a crashed process)
+    def __reclaim(self) -> List[dict]:
+        ret: List[dict] = []
+        try:
+            pending = self.connection.xpending_range(self.stream_key, self.group, min='-', max='+',
+                                                     count=get_reclaim_scan_count(self.batch_size), idle=self.reclaim_idle_ms)
+            ids = get_claimable_ids(pending, self.consumer, self.batch_size)
+            response = self.connection.xclaim(self.stream_key, self.group, self.consumer, self.reclaim_idle_ms, ids) if len(ids) > 0 else []
+        except BaseException as ex:
+            logger.error(f'an error occurred while reclaiming the pending entries of {self.stream_key}, err: {ex}')
+            return ret
+        for entry_id, fields in response:
+            event = to_event(self.channel_name, entry_id, fields)
+            if event is None:
+                self.connection.xack(self.stream_key, self.group, entry_id)
+            else:
+                ret.append(event)
+        if len(ret) > 0:
+            logger.warning(f'{len(ret)} pending entries of {self.stream_key} have been reclaimed by {self.consumer}')
+        return ret
+
+    def __ack(self, event: dict):
+        try:
+            self.connection.xack(self.stream_key, self.group, event['id'])
+        except BaseException as ex:
+            logger.error(f'an error occurred while acknowledging a stream entry, err: {ex}')
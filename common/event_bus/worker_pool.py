@@ -0,0 +1,110 @@
+import threading
+import time
+from collections import deque
+from typing import Callable, Any
+
+from common.config import WorkerOverflowPolicy
+from common.metrics import stage_seconds, dropped_total
+from common.utilities import logger
+
+
+# a fixed-size thread pool with a bounded queue, it replaces the thread-per-event model of the event bus
+class WorkerPool:
+    def __init__(self, name: str, worker_count: int, queue_size: int, overflow_policy: WorkerOverflowPolicy,
+                 on_dropped: Callable[[Any], None] = None):
+        self.name = name
+        self.worker_count: int = max(1, int(worker_count))
+        self.queue_size: int = max(1, int(queue_size))
+        self.overflow_policy: WorkerOverflowPolicy = WorkerOverflowPolicy(int(overflow_policy))
+        # called with the dropped item's argument outside the lock, e.g. to acknowledge a stream entry
+        self.on_dropped: Callable[[Any], None] = on_dropped
+        self.__queue = deque()
+        self.__lock = threading.Lock()
+        self.__not_empty = threading.Condition(self.__lock)
+        self.__not_full = threading.Condition(self.__lock)
+        self.__stopped = False
+        self.__threads = []
+        self.submitted_count: int = 0
+        self.processed_count: int = 0
+        self.dropped_count: int = 0
+        self.failed_count: int = 0
+
+    def start(self):
+        for index in range(self.worker_count):
+            th = threading.Thread(target=self.__work, name=f'{self.name}-worker-{index}')
+            th.daemon = True
+            th.start()
+            self.__threads.append(th)
+
+    def stop(self):
+        with self.__lock:
+            self.__stopped = True
+            self.__not_empty.notify_all()
+            self.__not_full.notify_all()
+
+    # returns False if the item has been dropped
+    def submit(self, fn: Callable, arg: Any) -> bool:
+        dropped = []
+        try:
+            with self.__lock:
+                self.submitted_count += 1
+                if len(self.__queue) >= self.queue_size:
+                    if self.overflow_policy == WorkerOverflowPolicy.DropNewest:
+                        self.__on_dropped()
+                        dropped.append(arg)
+                        return False
+                    elif self.overflow_policy == WorkerOverflowPolicy.DropOldest:
+                        dropped.append(self.__queue.popleft()[1])
+                        self.__on_dropped()
+                    else:
+                        while len(self.__queue) >= self.queue_size and not self.__stopped:
+                            self.__not_full.wait()
+                if self.__stopped:
+                    dropped.append(arg)
+                    return False
+                self.__queue.append((fn, arg, time.perf_counter()))
+                self.__not_empty.notify()
+            return True
+        finally:
+            if self.on_dropped is not None:
+                for item in dropped:
+                    self.on_dropped(item)
+
+    def queue_depth(self) -> int:
+        with self.__lock:
+            return len(self.__queue)
+
+    def get_stats(self) -> dict:
+        with self.__lock:
+            return {'queue_depth': len(self.__queue), 'queue_size': self.queue_size, 'worker_count': self.worker_count,
+                    'submitted': self.submitted_count, 'processed': self.processed_count, 'dropped': self.dropped_count,
+                    'failed': self.failed_count}
+
+    def __on_dropped(self):
+        self.dropped_count += 1
+        dropped_total.inc(reason='queue_full', channel=self.name)
+        # logging every drop would flood the logs when the DeepStack server slows down
+        if self.dropped_count == 1 or self.dropped_count % 100 == 0:
+            logger.warning(f'{self.name} worker pool is full, total dropped event count: {self.dropped_count}')
+
+    def __work(self):
+        while True:
+            with self.__lock:
+                while len(self.__queue) == 0 and not self.__stopped:
+                    self.__not_empty.wait()
+                if self.__stopped:
+                    return
+                fn, arg, submitted_at = self.__queue.popleft()
+                self.__not_full.notify()
+            stage_seconds.observe(time.perf_counter() - submitted_at, stage='queue_wait', channel=self.name)
+            try:
+                fn(arg)
+                succeeded = True
+            except BaseException as ex:
+                succeeded = False
+                logger.error(f'an error occurred on {self.name} worker pool, err: {ex}')
+            with self.__lock:
+                if succeeded:
+                    self.processed_count += 1
+                else:
+                    self.failed_count += 1
@@ -0,0 +1,191 @@
+import bisect
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Tuple, Callable
+
+from common.utilities import logger, config
+
+_default_buckets: List[float] = [.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1., 2.5, 5., 10.]
+
+
+def _format_labels(labels: Tuple[Tuple[str, str], ...]) -> str:
+    if len(labels) == 0:
+        return ''
+    return '{' + ','.join(f'{k}="{v}"' for k, v in labels) + '}'
+
+
+class Counter:
+    def __init__(self, name: str, description: str):
+        self.name: str = name
+        self.description: str = description
+        self.type_name: str = 'counter'
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple[Tuple[str, str], ...], float] = {}
+
+    def inc(self, value: float = 1., **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, .0) + value
+
+    def collect(self) -> List[str]:
+        with self._lock:
+            return [f'{self.name}{_format_labels(k)} {v}' for k, v in self._values.items()]
+
+
+class Gauge(Counter):
+    def __init__(self, name: str, description: str):
+        super().__init__(name, description)
+        self.type_name = 'gauge'
+
+    def dec(self, value: float = 1., **labels):
+        self.inc(-value, **labels)
+
+    def set(self, value: float, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram:
+    def __init__(self, name: str, description: str, buckets: List[float] = None):
+        self.name: str = name
+        self.description: str = description
+        self.type_name: str = 'histogram'
+        self.buckets: List[float] = buckets if buckets is not None else _default_buckets
+        self.__lock = threading.Lock()
+        # labels => (bucket counts, sum, count)
+        self.__values: Dict[Tuple[Tuple[str, str], ...], list] = {}
+
+    def observe(self, value: float, **labels):
+        key = tuple(sorted(labels.items()))
+        index = bisect.bisect_left(self.buckets, value)
+        with self.__lock:
+            item = self.__values.get(key)
+            if item is None:
+                item = [[0] * (len(self.buckets) + 1), .0, 0]
+                self.__values[key] = item
+            item[0][index] += 1
+            item[1] += value
+            item[2] += 1
+
+    def time(self, **labels) -> '_Timer':
+        return _Timer(self, labels)
+
+    def collect(self) -> List[str]:
+        lines: List[str] = []
+        with self.__lock:
+            for key, (counts, total, count) in self.__values.items():
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets + [float('inf')], counts):
+                    cumulative += bucket_count
+                    le = '+Inf' if bound == float('inf') else str(bound)
+                    lines.append(f'{self.name}_bucket{_format_labels(key + (("le", le),))} {cumulative}')
+                lines.append(f'{self.name}_sum{_format_labels(key)} {total}')
+                lines.append(f'{self.name}_count{_format_labels(key)} {count}')
+        return lines
+
+
+class _Timer:
+    def __init__(self, histogram: Histogram, labels: dict):
+        self.histogram = histogram
+        self.labels = labels
+        self.start: float = .0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.histogram.observe(time.perf_counter() - self.start, **self.labels)
+        return False
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.__metrics: Dict[str, object] = {}
+        # the callbacks update the gauges of the components which already keep their own counters (e.g. worker pool)
+        self.__collectors: List[Callable] = []
+
+    def __get_or_add(self, name: str, factory: Callable):
+        with self.__lock:
+            metric = self.__metrics.get(name)
+            if metric is None:
+                metric = factory()
+                self.__metrics[name] = metric
+            return metric
+
+    def counter(self, name: str, description: str) -> Counter:
+        return self.__get_or_add(name, lambda: Counter(name, description))
+
+    def gauge(self, name: str, description: str) -> Gauge:
+        return self.__get_or_add(name, lambda: Gauge(name, description))
+
+    def histogram(self, name: str, description: str, buckets: List[float] = None) -> Histogram:
+        return self.__get_or_add(name, lambda: Histogram(name, description, buckets))
+
+    def add_collector(self, fn: Callable):
+        with self.__lock:
+            self.__collectors.append(fn)
+
+    def expose(self) -> str:
+        with self.__lock:
+            collectors = list(self.__collectors)
+            items = list(self.__metrics.values())
+        for fn in collectors:
+            try:
+                fn()
+            except BaseException as ex:
+                logger.error(f'an error occurred while collecting metrics, err: {ex}')
+        lines: List[str] = []
+        for metric in items:
+            lines.append(f'# HELP {metric.name} {metric.description}')
+            lines.append(f'# TYPE {metric.name} {metric.type_name}')
+            lines.extend(metric.collect())
+        return '\n'.join(lines) + '\n'
+
+
+metrics = MetricsRegistry()
+
+stage_seconds = metrics.histogram('deepstack_service_stage_seconds', 'Duration of the pipeline stages')
+frames_total = metrics.counter('deepstack_service_frames_total', 'Processed frames per camera')
+published_total = metrics.counter('deepstack_service_published_total', 'Published events per camera')
+dropped_total = metrics.counter('deepstack_service_dropped_total', 'Dropped or skipped frames by reason')
+in_flight = metrics.gauge('deepstack_service_in_flight', 'Requests in flight on DeepStack')
+queue_depth = metrics.gauge('deepstack_service_queue_depth', 'Events waiting in the worker pool queue')
+circuit_state = metrics.gauge('deepstack_service_circuit_state', 'Circuit breaker state per backend, 0: closed, 1: open, 2: half-open')
+
+
+class _MetricsRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_response(404)
+            self.end_headers()
+            return
+        body = metrics.expose().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, fmt, *args):
+        pass
+
+
+# each process (object detection and facial recognition) exposes its own metrics, so they use different ports
+def start_metrics_server(port_offset: int):
+    ds_config = config.deep_stack
+    if not ds_config.metrics_enabled:
+        return
+    port = ds_config.metrics_port + port_offset
+    try:
+        server = ThreadingHTTPServer((ds_config.metrics_host, port), _MetricsRequestHandler)
+    except BaseException as ex:
+        logger.error(f'metrics server could not be started on port {port}, err: {ex}')
+        return
+    th = threading.Thread(target=server.serve_forever)
+    th.daemon = True
+    th.start()
+    logger.warning(f'metrics server has been started on {ds_config.metrics_host}:{port}/metrics')
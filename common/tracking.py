@@ -0,0 +1,42 @@
+from typing import List, Tuple
+
+import numpy as np
+
+
+# a and b are (n, 4) and (m, 4) arrays of x1, y1, x2, y2, returns the (n, m) IoU matrix
+def iou_matrix(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    if len(a) == 0 or len(b) == 0:
+        return np.zeros((len(a), len(b)))
+    x1 = np.maximum(a[:, None, 0], b[None, :, 0])
+    y1 = np.maximum(a[:, None, 1], b[None, :, 1])
+    x2 = np.minimum(a[:, None, 2], b[None, :, 2])
+    y2 = np.minimum(a[:, None, 3], b[None, :, 3])
+    intersection = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    return intersection / np.maximum(area_a[:, None] + area_b[None, :] - intersection, 1e-9)
+
+
+# the center distances divided by the diagonals of the boxes in a, so the threshold does not depend on the object size
+def centroid_distance_matrix(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    if len(a) == 0 or len(b) == 0:
+        return np.zeros((len(a), len(b)))
+    center_a = (a[:, :2] + a[:, 2:]) / 2.
+    center_b = (b[:, :2] + b[:, 2:]) / 2.
+    diagonal_a = np.maximum(np.hypot(a[:, 2] - a[:, 0], a[:, 3] - a[:, 1]), 1e-9)
+    return np.linalg.norm(center_a[:, None, :] - center_b[None, :, :], axis=2) / diagonal_a[:, None]
+
+
+# greedily pairs the rows and columns with the highest scores, the pairs below the min score are left unmatched
+def greedy_match(scores: np.ndarray, min_score: float) -> List[Tuple[int, int]]:
+    ret: List[Tuple[int, int]] = []
+    if scores.size == 0:
+        return ret
+    scores = scores.astype(np.float64, copy=True)
+    while True:
+        row, col = np.unravel_index(np.argmax(scores), scores.shape)
+        if scores[row, col] < min_score:
+            return ret
+        ret.append((int(row), int(col)))
+        scores[row, :] = -np.inf
+        scores[:, col] = -np.inf
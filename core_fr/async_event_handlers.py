@@ -0,0 +1,107 @@
+import asyncio
+import json
+from typing import List
+
+from common.deepstack.async_deepstack_client import AsyncDeepStackClient
+from common.deepstack.deepstack_client import DeepStackUnavailableError
+from common.deepstack.image_utils import to_encoded_image
+from common.data.image_repository import AsyncImageRepository, get_forward_image_key_async
+from common.event_bus.async_event_bus import AsyncEventBus
+from common.event_bus.event_codec import EventCodec, decode_event, get_event_image
+from common.event_bus.event_handler import AsyncEventHandler
+from common.metrics import stage_seconds, frames_total, published_total
+from common.utilities import logger, config, crate_async_redis_connection, RedisDb
+from core_fr.event_handlers import filter_faces, create_fr_event
+from core_fr.face_recognizer import DetectedFace, to_detected_faces
+from core_fr.person_gate import CropRequest
+from core_fr.recognition_pipeline import RecognitionPipeline
+from core_fr.utilities import EventChannels
+
+
+class FrAsyncReadServiceEventHandler(AsyncEventHandler):
+    def __init__(self, client: AsyncDeepStackClient, publisher: AsyncEventBus):
+        self.client = client
+        self.publisher = publisher
+        self.codec = EventCodec(publisher.channel)
+        self.prob_threshold: float = config.deep_stack.fr_threshold
+        self.encoding = 'utf-8'
+        self.channel: str = EventChannels.read_service.value
+        self.image_by_reference: bool = config.deep_stack.image_by_reference
+        self.images = AsyncImageRepository(crate_async_redis_connection(RedisDb.MAIN), config.deep_stack.image_ttl)
+        self.pipeline = RecognitionPipeline(config.deep_stack, self.channel)
+
+    # noinspection DuplicatedCode
+    async def handle(self, dic: dict):
+        if dic is None or dic['type'] != 'message':
+            return
+
+        try:
+            with stage_seconds.time(stage='json_decode', channel=self.channel):
+                dic = decode_event(dic['data'])
+            name = dic['name']
+            source_id = dic['source']
+            image_key = dic.get('image_key', '')
+            ai_clip_enabled = dic['ai_clip_enabled']
+            frames_total.inc(channel=self.channel, source=source_id)
+
+            with stage_seconds.time(stage='image_fetch', channel=self.channel):
+                image, base64_image = (await self.images.get(image_key), '') if len(image_key) > 0 else get_event_image(dic, 'img')
+            if image is None:
+                logger.warning(f'(camera {name}) image ({image_key}) has already expired')
+                return
+
+            results = await self.__recognize(name, source_id, dic, image)
+            if results is None:
+                return
+            if len(results) == 0:
+                logger.info(f'image contains no face for camera: {name}')
+                return
+
+            detected_faces, face_logs = filter_faces(results, self.prob_threshold)
+            if len(detected_faces) == 0:
+                logger.info('no detected face prob score is higher than threshold, this event will not be published')
+                return
+
+            image_key = await get_forward_image_key_async(self.images, image, image_key, self.image_by_reference)
+            with stage_seconds.time(stage='json_encode', channel=self.channel):
+                event = create_fr_event(self.codec, name, source_id, image, base64_image, image_key, ai_clip_enabled, detected_faces)
+            with stage_seconds.time(stage='publish', channel=self.channel):
+                await self.publisher.publish(event)
+            published_total.inc(channel=self.channel, source=source_id)
+            logger.info(f'face: detected {json.dumps(face_logs)}')
+        except (asyncio.CancelledError, KeyboardInterrupt):
+            raise
+        except BaseException as ex:
+            logger.error(f'an error occurred while handling an async facial-recognition request by DeepStack, err: {ex}')
+
+    # returns None if there is no person to recognize or the recognition has failed, both have already been logged
+    async def __recognize(self, name: str, source_id: str, dic: dict, image: bytes) -> List[DetectedFace] | None:
+        persons = self.pipeline.get_persons(dic)
+        if self.pipeline.has_no_person(persons):
+            logger.info(f'no person has been detected for camera: {name}, facial recognition is skipped')
+            return None
+        cached = self.pipeline.try_reuse(source_id, persons)
+        if cached is not None:
+            return cached
+        try:
+            if self.pipeline.crops_persons(persons):
+                requests = await asyncio.to_thread(self.pipeline.create_requests, image, persons)
+                predictions = await self.__recognize_crops(requests)
+            else:
+                predictions = await self.client.recognize_faces(to_encoded_image(image), self.prob_threshold)
+        except (asyncio.CancelledError, KeyboardInterrupt):
+            raise
+        except DeepStackUnavailableError:
+            return None  # shed while DeepStack is unavailable, counted by the dropped metric
+        except BaseException as ex:
+            logger.error(f'an error occurred while async face api call, ex: {ex}')
+            return None
+        return self.pipeline.update(source_id, persons, to_detected_faces(predictions))
+
+    # the crops are recognized concurrently and their face boxes are mapped back to the frame
+    async def __recognize_crops(self, requests: List[CropRequest]) -> List[dict]:
+        responses = await asyncio.gather(*[self.client.recognize_faces(r.image, self.prob_threshold) for r in requests])
+        ret: List[dict] = []
+        for request, predictions in zip(requests, responses):
+            ret.extend(request.map_predictions(predictions))
+        return ret
@@ -1,31 +1,141 @@
+import hashlib
+import json
+import os
+import shutil
+import time
+import uuid
 from os import path
+from typing import Iterator
+
 import requests
-from io import open
-import shutil
 
 from common.utilities import config, logger
+from core_fr.train_manifest import TrainManifest
+from core_fr.utilities import get_fr_server_urls, get_train_manifest_path
 from utils.dir import get_root_path_for_deepstack
 
+_chunk_size = 1024 * 1024
+
 
 class BackUp:
     def __init__(self):
-        self.server_url = f'{config.deep_stack.server_url}:{config.deep_stack.server_port}'
+        # all facial recognition replicas are trained with the same faces, so the first one is backed up
+        self.server_urls = get_fr_server_urls()
+        self.server_url = self.server_urls[0]
         self.full_file_path: str = path.join(get_root_path_for_deepstack(config), 'deepstack', 'backupdeepstack.zip')
+        # keeps the face database generation and the content hash of the last backup
+        self.state_file_path: str = path.join(get_root_path_for_deepstack(config), 'deepstack', 'backupdeepstack.json')
+        self.generations: int = max(0, config.deep_stack.fr_backup_generations)
+        self.restore_timeout: float = config.deep_stack.fr_restore_timeout
 
+    # the face database changes only by the training, so an unchanged generation means an unchanged database
     def backup(self):
+        generation = self.__get_generation()
+        state = self.__load_state()
+        if state.get('generation') == generation and path.exists(self.full_file_path):
+            logger.info(f'the face database has not been changed since the last back-up (generation: {generation}), back-up is skipped')
+            return
+
+        temp_path = f'{self.full_file_path}.tmp'
         try:
-            data = requests.post(f'{self.server_url}/v1/backup', stream=True)
-            with open(self.full_file_path, 'wb') as file:
-                shutil.copyfileobj(data.raw, file)
-            del data
-            logger.info('back-up operation has been completed successfully')
+            h = hashlib.blake2b(digest_size=16)
+            with requests.post(f'{self.server_url}/v1/backup', stream=True) as response:
+                response.raise_for_status()
+                with open(temp_path, 'wb') as file:
+                    for chunk in response.iter_content(chunk_size=_chunk_size):
+                        h.update(chunk)
+                        file.write(chunk)
+            content_hash = h.hexdigest()
+            if state.get('hash') == content_hash and path.exists(self.full_file_path):
+                os.remove(temp_path)
+                logger.info('the back-up content has not been changed, the previous back-up is kept')
+            else:
+                self.__rotate()
+                os.replace(temp_path, self.full_file_path)
+                logger.info('back-up operation has been completed successfully')
+            self.__save_state({'generation': generation, 'hash': content_hash})
         except BaseException as ex:
             logger.warning(f'an error occurred while backing up the DeepStack file, err: {ex}')
+            if path.exists(temp_path):
+                os.remove(temp_path)
 
+    # the server may still be starting, so the connection errors are retried until the restore timeout
     def restore(self):
+        if not path.exists(self.full_file_path):
+            logger.warning('there is no DeepStack back-up file to restore')
+            return
+        for server_url in self.server_urls:
+            deadline = time.monotonic() + self.restore_timeout
+            delay = .25
+            while True:
+                try:
+                    self.__post_restore(server_url)
+                    logger.info(f'restore operation has been completed successfully, server: {server_url}')
+                    break
+                except requests.ConnectionError as ex:
+                    if time.monotonic() + delay > deadline:
+                        logger.warning(f'DeepStack server did not respond to the restore, server: {server_url}, err: {ex}')
+                        break
+                    time.sleep(delay)
+                    delay = min(delay * 2., 2.)
+                except BaseException as ex:
+                    logger.warning(f'an error occurred while restoring the DeepStack file, server: {server_url}, err: {ex}')
+                    break
+
+    # the back-up file is streamed from the disk as a chunked multipart body instead of being read into the memory
+    def __post_restore(self, server_url: str):
+        boundary = uuid.uuid4().hex
+        headers = {'Content-Type': f'multipart/form-data; boundary={boundary}'}
+        response = requests.post(f'{server_url}/v1/restore', data=self.__create_multipart_body(boundary), headers=headers)
+        response.raise_for_status()
+        _ = response.json()
+
+    def __create_multipart_body(self, boundary: str) -> Iterator[bytes]:
+        file_name = path.basename(self.full_file_path)
+        yield (f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="{file_name}"\r\n'
+               f'Content-Type: application/octet-stream\r\n\r\n').encode('utf-8')
+        with open(self.full_file_path, 'rb') as file:
+            for chunk in iter(lambda: file.read(_chunk_size), b''):
+                yield chunk
+        yield f'\r\n--{boundary}--\r\n'.encode('utf-8')
+
+    # backupdeepstack.zip => backupdeepstack.1.zip => ... => backupdeepstack.{generations}.zip. The current back-up is linked
+    # (or copied) rather than moved, so it stays in place until the new one replaces it in a single step
+    def __rotate(self):
+        if self.generations < 1 or not path.exists(self.full_file_path):
+            return
+        root, ext = path.splitext(self.full_file_path)
+        for index in range(self.generations - 1, 0, -1):
+            older = f'{root}.{index}{ext}'
+            if path.exists(older):
+                os.replace(older, f'{root}.{index + 1}{ext}')
+        temp_path = f'{root}.1{ext}.tmp'
+        if path.exists(temp_path):
+            os.remove(temp_path)
+        try:
+            os.link(self.full_file_path, temp_path)
+        except OSError:
+            shutil.copy2(self.full_file_path, temp_path)  # e.g. the file system does not support hard links
+        os.replace(temp_path, f'{root}.1{ext}')
+
+    @staticmethod
+    def __get_generation() -> int:
+        manifest = TrainManifest(get_train_manifest_path())
+        manifest.load()
+        return manifest.generation
+
+    def __load_state(self) -> dict:
+        if not path.exists(self.state_file_path):
+            return {}
         try:
-            image_data = open(self.full_file_path, 'rb').read()
-            _ = requests.post(f'{self.server_url}/v1/restore', files={'file': image_data}).json()
-            logger.info('back-up operation has been completed successfully')
+            with open(self.state_file_path, 'r') as file:
+                return json.load(file)
         except BaseException as ex:
-            logger.warning(f'an error occurred while restoring the DeepStack file, err: {ex}')
+            logger.warning(f'an error occurred while loading the back-up state, err: {ex}')
+            return {}
+
+    def __save_state(self, state: dict):
+        temp_path = f'{self.state_file_path}.tmp'
+        with open(temp_path, 'w') as file:
+            json.dump(state, file)
+        os.replace(temp_path, self.state_file_path)
@@ -1,71 +1,117 @@
-import base64
-import io
 import json
-from PIL import Image, UnidentifiedImageError
+from typing import List, Tuple
 
-from common.event_bus.event_bus import EventBus
+from common.event_bus.event_bus_factory import create_event_bus
+from common.event_bus.event_codec import EventCodec, decode_event, get_event_image
 from common.event_bus.event_handler import EventHandler
-from common.utilities import logger, config
-from core_fr.face_recognizer import FaceRecognizer
-from core_fr.utilities import start_thread, EventChannels
+from common.data.image_repository import ImageRepository, get_forward_image_key
+from common.metrics import stage_seconds, frames_total, published_total
+from common.utilities import logger, config, crate_redis_connection, RedisDb
+from core_fr.face_recognizer import FaceRecognizer, DetectedFace
+from core_fr.recognition_pipeline import RecognitionPipeline
+from core_fr.utilities import EventChannels
 
 
 class FrReadServiceEventHandler(EventHandler):
     def __init__(self):
         self.prob_threshold: float = config.deep_stack.fr_threshold
         self.encoding = 'utf-8'
+        self.channel: str = EventChannels.read_service.value
         self.fr = FaceRecognizer()
-        self.publisher = EventBus(EventChannels.snapshot_out)
+        self.publisher = create_event_bus(EventChannels.snapshot_out)
+        self.codec = EventCodec(EventChannels.snapshot_out)
+        self.image_by_reference: bool = config.deep_stack.image_by_reference
+        self.images = ImageRepository(crate_redis_connection(RedisDb.MAIN), config.deep_stack.image_ttl)
+        self.pipeline = RecognitionPipeline(config.deep_stack, self.channel)
 
     def handle(self, dic: dict):
         if dic is None or dic['type'] != 'message':
             return
 
-        start_thread(self.__handle, [dic])
+        # it is already called by a worker of the event bus pool, no need to start another thread
+        self.__handle(dic)
 
     # noinspection DuplicatedCode
     def __handle(self, dic: dict):
         try:
-            data: bytes = dic['data']
-            dic = json.loads(data.decode(self.encoding))
+            with stage_seconds.time(stage='json_decode', channel=self.channel):
+                dic = decode_event(dic['data'])
             name = dic['name']
             source_id = dic['source']
-            base64_image = dic['img']
+            image_key = dic.get('image_key', '')
             # open it when you want to use snapshot_in
             # source_id = dic['source_id']
             # base64_image = dic['base64_image']
             ai_clip_enabled = dic['ai_clip_enabled']
+            frames_total.inc(channel=self.channel, source=source_id)
 
-            base64_decoded = base64.b64decode(base64_image)
-            try:
-                image = Image.open(io.BytesIO(base64_decoded))
-            except UnidentifiedImageError as err:
-                logger.error(f'an error occurred while creating a PIL image from base64 string, err: {err}')
+            # the encoded image bytes are sent as they are, no need to decode the image here
+            with stage_seconds.time(stage='image_fetch', channel=self.channel):
+                image, base64_image = (self.images.get(image_key), '') if len(image_key) > 0 else get_event_image(dic, 'img')
+            if image is None:
+                logger.warning(f'(camera {name}) image ({image_key}) has already expired')
                 return
 
-            results = self.fr.predict(image)
+            results = self.__recognize(name, source_id, dic, image)
+            if results is None:
+                return
             if len(results) == 0:
                 logger.info(f'image contains no face for camera: {name}')
                 return
 
-            detected_faces = []
-            face_logs = []
-            for face in results:
-                prob = face.pred_score
-                if prob < self.prob_threshold:
-                    logger.info(f'prob ({prob}) is lower than threshold: {self.prob_threshold} for {face.pred_cls_name}')
-                    continue
-                dic_box = {'x1': face.x1, 'y1': face.y1, 'x2': face.x2, 'y2': face.y2}
-                detected_faces.append({'pred_score': prob, 'pred_cls_idx': face.pred_cls_idx, 'pred_cls_name': face.pred_cls_name, 'box': dic_box})
-                face_logs.append({'pred_cls_name': face.pred_cls_name, 'pred_score': face.pred_score}),
+            detected_faces, face_logs = filter_faces(results, self.prob_threshold)
             if len(detected_faces) == 0:
                 logger.info('no detected face prob score is higher than threshold, this event will not be published')
                 return
 
-            dic = {'name': name, 'source': source_id, 'img': base64_image, 'ai_clip_enabled': ai_clip_enabled, 'detections': detected_faces,
-                   'channel': 'fr_service', 'list_name': 'detected_faces'}
-            event = json.dumps(dic)
-            self.publisher.publish(event)
+            image_key = get_forward_image_key(self.images, image, image_key, self.image_by_reference)
+            with stage_seconds.time(stage='json_encode', channel=self.channel):
+                event = create_fr_event(self.codec, name, source_id, image, base64_image, image_key, ai_clip_enabled, detected_faces)
+            with stage_seconds.time(stage='publish', channel=self.channel):
+                self.publisher.publish(event)
+            published_total.inc(channel=self.channel, source=source_id)
             logger.info(f'face: detected {json.dumps(face_logs)}')
         except BaseException as ex:
             logger.error(f'an error occurred while handling an facial-recognition request by DeepStack, err: {ex}')
+
+    # returns None if there is no person to recognize or the recognition has failed, both have already been logged
+    def __recognize(self, name: str, source_id: str, dic: dict, image: bytes) -> List[DetectedFace] | None:
+        persons = self.pipeline.get_persons(dic)
+        if self.pipeline.has_no_person(persons):
+            logger.info(f'no person has been detected for camera: {name}, facial recognition is skipped')
+            return None
+        cached = self.pipeline.try_reuse(source_id, persons)
+        if cached is not None:
+            return cached
+        if self.pipeline.crops_persons(persons):
+            results = self.fr.predict_crops(self.pipeline.create_requests(image, persons))
+        else:
+            results = self.fr.predict(image)
+        if results is None:
+            return None  # the failure is neither a frame without a face nor a vote for "no face" in the cache
+        return self.pipeline.update(source_id, persons, results)
+
+
+def filter_faces(results: List[DetectedFace], prob_threshold: float) -> Tuple[List[dict], List[dict]]:
+    detected_faces = []
+    face_logs = []
+    for face in results:
+        prob = face.pred_score
+        if prob < prob_threshold:
+            logger.info(f'prob ({prob}) is lower than threshold: {prob_threshold} for {face.pred_cls_name}')
+            continue
+        dic_box = {'x1': face.x1, 'y1': face.y1, 'x2': face.x2, 'y2': face.y2}
+        detected_faces.append({'pred_score': prob, 'pred_cls_idx': face.pred_cls_idx, 'pred_cls_name': face.pred_cls_name, 'box': dic_box})
+        face_logs.append({'pred_cls_name': face.pred_cls_name, 'pred_score': face.pred_score})
+    return detected_faces, face_logs
+
+
+# the image is embedded unless an image key is given, as base64 in json or as raw bytes in msgpack
+def create_fr_event(codec: EventCodec, name: str, source_id: str, image: bytes, base64_image: str, image_key: str, ai_clip_enabled: bool,
+                    detected_faces: List[dict]) -> bytes:
+    dic = {'name': name, 'source': source_id, 'ai_clip_enabled': ai_clip_enabled, 'detections': detected_faces,
+           'channel': 'fr_service', 'list_name': 'detected_faces'}
+    if len(image_key) > 0:
+        dic['image_key'] = image_key
+        return codec.encode(dic)
+    return codec.encode(dic, 'img', image, base64_image)
@@ -1,9 +1,10 @@
-from typing import List
-from PIL import Image
-from deepstack_sdk.structs import FaceRecognitionResponse
+from typing import List, Any
 
+from common.deepstack.backend_pool import ReplicaRole
+from common.deepstack.deepstack_client import DeepStackUnavailableError, create_deepstack_client
+from common.deepstack.image_utils import to_encoded_image
 from common.utilities import logger, config
-from core_fr.utilities import create_face
+from core_fr.person_gate import CropRequest
 
 
 class DetectedFace:
@@ -18,19 +19,40 @@ class DetectedFace:
 
 class FaceRecognizer:
     def __init__(self):
-        self.face = create_face()
+        self.client = create_deepstack_client(ReplicaRole.FaceRecognition)
         self.min_confidence = config.deep_stack.fr_threshold
 
-    def predict(self, pil_img: Image) -> List[DetectedFace]:
-        ret: List[DetectedFace] = []
+    # img is expected to be the encoded (jpeg, png etc.) image bytes, PIL images and numpy arrays are encoded before sending.
+    # returns None if the recognition has failed, so a failure is not mistaken for an image without a face
+    def predict(self, img: Any) -> List[DetectedFace] | None:
         try:
-            response: FaceRecognitionResponse = self.face.recognizeFace(pil_img, min_confidence=self.min_confidence)
-            for index, d in enumerate(response.detections):
-                df = DetectedFace()
-                df.pred_score, df.pred_cls_idx, df.pred_cls_name = d.confidence, index, d.userid
-                df.x1, df.y1, df.x2, df.y2 = d.x_min, d.y_min, d.x_max, d.y_max
-                ret.append(df)
+            predictions = self.client.recognize_faces(to_encoded_image(img), self.min_confidence)
+            return to_detected_faces(predictions)
+        except DeepStackUnavailableError:
+            pass  # shed while DeepStack is unavailable, counted by the dropped metric
         except BaseException as ex:
             logger.error(f'an error occurred while face api call, ex: {ex}')
-
-        return ret
+        return None
+
+    # the face boxes of the crops are mapped back to the frame, returns None if any crop has failed
+    def predict_crops(self, requests: List[CropRequest]) -> List[DetectedFace] | None:
+        predictions: List[dict] = []
+        for request in requests:
+            try:
+                predictions.extend(request.map_predictions(self.client.recognize_faces(request.image, self.min_confidence)))
+            except DeepStackUnavailableError:
+                return None  # shed while DeepStack is unavailable, counted by the dropped metric
+            except BaseException as ex:
+                logger.error(f'an error occurred while face api call for a person crop, ex: {ex}')
+                return None
+        return to_detected_faces(predictions)
+
+
+def to_detected_faces(predictions: List[dict]) -> List[DetectedFace]:
+    ret: List[DetectedFace] = []
+    for index, d in enumerate(predictions):
+        df = DetectedFace()
+        df.pred_score, df.pred_cls_idx, df.pred_cls_name = d['confidence'], index, d['userid']
+        df.x1, df.y1, df.x2, df.y2 = d['x_min'], d['y_min'], d['x_max'], d['y_max']
+        ret.append(df)
+    return ret
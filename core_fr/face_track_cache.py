@@ -0,0 +1,187 @@
+import threading
+import time
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from common.config import DeepStackConfig
+from common.tracking import iou_matrix, greedy_match
+from core_fr.face_recognizer import DetectedFace
+from core_fr.person_gate import PersonDetection
+
+
+class _FaceTrack:
+    def __init__(self, person: PersonDetection):
+        self.box: Tuple[int, int, int, int] = person.box
+        self.od_track_id: int = person.track_id
+        self.score_sums: Dict[str, float] = {}
+        self.counts: Dict[str, int] = {}
+        self.frame_count: int = 0
+        self.empty_count: int = 0
+        self.confirmed: bool = False
+        self.identity: str | None = None  # None after confirmation means the person shows no face
+        self.confirmed_at: float = .0
+        self.last_seen: float = time.monotonic()
+        self.face_offset: Tuple[float, float, float, float] = (.0, .0, .0, .0)  # the face box as ratios of the person box
+
+    def reset(self):
+        self.score_sums, self.counts = {}, {}
+        self.frame_count, self.empty_count = 0, 0
+        self.confirmed, self.identity = False, None
+
+    def get_leader(self) -> Tuple[str, float]:
+        name = max(self.score_sums, key=self.score_sums.get)
+        return name, self.score_sums[name] / self.counts[name]
+
+
+# follows the people of a camera by their object detection boxes (the track ids if object detection tracks, IoU otherwise).
+# an identity is confirmed by the confidence-weighted votes of the first frames and reused by the later frames of the same person,
+# so a lingering person is recognized once per re-verify interval instead of on every frame and the name does not flip
+class FaceTrackCache:
+    def __init__(self, iou_threshold: float, vote_frames: int, reverify_interval: float, track_ttl: float):
+        self.iou_threshold: float = iou_threshold
+        self.vote_frames: int = max(1, int(vote_frames))
+        self.reverify_interval: float = reverify_interval
+        self.track_ttl: float = track_ttl
+        self.__lock = threading.Lock()
+        self.__cameras: Dict[str, List[_FaceTrack]] = {}
+        self.hit_count: int = 0
+        self.miss_count: int = 0
+
+    # returns the cached faces if every person is on a confirmed track which does not need re-verification, None otherwise
+    def try_reuse(self, source_id: str, persons: List[PersonDetection]) -> List[DetectedFace] | None:
+        now = time.monotonic()
+        with self.__lock:
+            tracks = self.__get_tracks(source_id, now)
+            matched = self.__match(tracks, persons)
+            for track in matched:
+                if track is None or not track.confirmed or now - track.confirmed_at > self.reverify_interval:
+                    self.miss_count += 1
+                    return None
+            ret: List[DetectedFace] = []
+            for person, track in zip(persons, matched):
+                track.box, track.last_seen = person.box, now
+                if track.identity is not None:
+                    ret.append(self.__create_face(track, len(ret)))
+            self.hit_count += 1
+            return ret
+
+    # votes the recognized faces into the person tracks and returns the faces with the voted identities
+    def update(self, source_id: str, persons: List[PersonDetection], faces: List[DetectedFace]) -> List[DetectedFace]:
+        now = time.monotonic()
+        with self.__lock:
+            tracks = self.__get_tracks(source_id, now)
+            matched = self.__match(tracks, persons)
+            for index, person in enumerate(persons):
+                if matched[index] is None:
+                    matched[index] = _FaceTrack(person)
+                    tracks.append(matched[index])
+
+            # every face is given to the smallest person box containing its center, the others are passed through
+            faces_of_tracks: Dict[int, DetectedFace] = {}
+            ret: List[DetectedFace] = []
+            for face in faces:
+                index = _find_person(persons, face)
+                if index < 0:
+                    ret.append(face)
+                elif index not in faces_of_tracks or faces_of_tracks[index].pred_score < face.pred_score:
+                    faces_of_tracks[index] = face
+
+            for index, (person, track) in enumerate(zip(persons, matched)):
+                track.box, track.last_seen = person.box, now
+                face = faces_of_tracks.get(index)
+                if face is None:
+                    self.__vote_empty(track, now)
+                    continue
+                self.__vote(track, face, now)
+                name, score = track.get_leader()
+                face.pred_cls_name, face.pred_score = name, score
+                ret.append(face)
+            for index, face in enumerate(ret):
+                face.pred_cls_idx = index
+            return ret
+
+    def __vote(self, track: _FaceTrack, face: DetectedFace, now: float):
+        if track.confirmed:
+            if face.pred_cls_name == track.identity:
+                track.confirmed_at = now
+                track.face_offset = _get_offset(track.box, face)
+                return
+            track.reset()  # the re-verification disagrees, the votes start again
+        track.score_sums[face.pred_cls_name] = track.score_sums.get(face.pred_cls_name, .0) + face.pred_score
+        track.counts[face.pred_cls_name] = track.counts.get(face.pred_cls_name, 0) + 1
+        track.frame_count += 1
+        track.empty_count = 0
+        track.face_offset = _get_offset(track.box, face)
+        if track.frame_count >= self.vote_frames:
+            track.identity = track.get_leader()[0]
+            track.confirmed, track.confirmed_at = True, now
+
+    def __vote_empty(self, track: _FaceTrack, now: float):
+        track.empty_count += 1
+        if track.confirmed and track.identity is None:
+            track.confirmed_at = now
+        elif track.empty_count >= self.vote_frames:
+            # e.g. a person facing away, it is not recognized on every frame either
+            track.reset()
+            track.confirmed, track.confirmed_at = True, now
+
+    def __get_tracks(self, source_id: str, now: float) -> List[_FaceTrack]:
+        tracks = [t for t in self.__cameras.get(source_id, []) if now - t.last_seen <= self.track_ttl]
+        self.__cameras[source_id] = tracks
+        return tracks
+
+    def __match(self, tracks: List[_FaceTrack], persons: List[PersonDetection]) -> List[_FaceTrack | None]:
+        ret: List[_FaceTrack | None] = [None] * len(persons)
+        by_od_track_id = {t.od_track_id: t for t in tracks if t.od_track_id > 0}
+        free_tracks = list(tracks)
+        free_persons: List[int] = []
+        for index, person in enumerate(persons):
+            track = by_od_track_id.get(person.track_id) if person.track_id > 0 else None
+            if track is not None:
+                ret[index] = track
+                free_tracks.remove(track)
+            else:
+                free_persons.append(index)
+        if len(free_persons) == 0 or len(free_tracks) == 0:
+            return ret
+        track_boxes = np.array([t.box for t in free_tracks], dtype=np.float64).reshape(-1, 4)
+        person_boxes = np.array([persons[i].box for i in free_persons], dtype=np.float64).reshape(-1, 4)
+        for row, col in greedy_match(iou_matrix(track_boxes, person_boxes), self.iou_threshold):
+            ret[free_persons[col]] = free_tracks[row]
+        return ret
+
+    @staticmethod
+    def __create_face(track: _FaceTrack, index: int) -> DetectedFace:
+        face = DetectedFace()
+        face.pred_cls_name, face.pred_score = track.identity, track.get_leader()[1]
+        face.pred_cls_idx = index
+        x1, y1, x2, y2 = track.box
+        width, height = x2 - x1, y2 - y1
+        face.x1, face.y1 = int(x1 + track.face_offset[0] * width), int(y1 + track.face_offset[1] * height)
+        face.x2, face.y2 = int(x1 + track.face_offset[2] * width), int(y1 + track.face_offset[3] * height)
+        return face
+
+
+def _find_person(persons: List[PersonDetection], face: DetectedFace) -> int:
+    center_x, center_y = (face.x1 + face.x2) / 2., (face.y1 + face.y2) / 2.
+    ret, smallest = -1, float('inf')
+    for index, person in enumerate(persons):
+        x1, y1, x2, y2 = person.box
+        area = (x2 - x1) * (y2 - y1)
+        if x1 <= center_x <= x2 and y1 <= center_y <= y2 and area < smallest:
+            ret, smallest = index, area
+    return ret
+
+
+def _get_offset(box: Tuple[int, int, int, int], face: DetectedFace) -> Tuple[float, float, float, float]:
+    x1, y1, x2, y2 = box
+    width, height = max(1, x2 - x1), max(1, y2 - y1)
+    return (face.x1 - x1) / width, (face.y1 - y1) / height, (face.x2 - x1) / width, (face.y2 - y1) / height
+
+
+def create_face_track_cache(ds_config: DeepStackConfig) -> FaceTrackCache | None:
+    if not ds_config.fr_face_cache_enabled:
+        return None
+    return FaceTrackCache(ds_config.fr_face_cache_iou_threshold, ds_config.fr_face_cache_vote_frames, ds_config.fr_face_cache_reverify_interval,
+                          ds_config.fr_face_cache_track_ttl)
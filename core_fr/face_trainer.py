@@ -1,40 +1,96 @@
-import os
-import time
-from os.path import isfile, join
-from typing import List
+from concurrent.futures import ThreadPoolExecutor
+from os.path import join
+from typing import List, Set, Dict, Tuple
 
-from common.utilities import logger
+from common.utilities import logger, config
 from core_fr.back_up import BackUp
-from core_fr.utilities import create_face, get_train_dir_path, create_dir_if_not_exist
+from core_fr.train_manifest import TrainManifest, TrainImage
+from core_fr.train_preprocessor import TrainPreprocessor
+from core_fr.utilities import create_face, get_train_dir_path, create_dir_if_not_exist, get_fr_server_urls, get_train_manifest_path, \
+    get_train_cache_dir_path
 
 
 class FaceTrainer:
     def __init__(self):
-        self.face = create_face()
+        self.faces = [create_face(server_url) for server_url in get_fr_server_urls()]
         self.folder_path = get_train_dir_path()
         create_dir_if_not_exist(self.folder_path)
+        self.manifest = TrainManifest(get_train_manifest_path())
+        self.manifest.load()
+        ds_config = config.deep_stack
+        self.upload_workers: int = max(1, ds_config.fr_train_upload_workers)
+        self.preprocessor = TrainPreprocessor(get_train_cache_dir_path(), ds_config.fr_train_max_image_size,
+                                              ds_config.fr_train_preprocess_workers)
 
+    # only the added or changed users are registered again and only the removed users are deleted,
+    # the other faces stay recognizable during the training
     def fit(self):
-        for fc in self.face.listFaces():
-            try:
-                self.face.deleteFace(fc)
-            except BaseException as ex:
-                logger.error(f'en error occurred while deleting a DeepStack face, ex: {ex}')
-
+        current = self.manifest.scan(self.folder_path)
+        changed_users = set(self.manifest.get_changed_users(current))
         need_backup = False
-        for dir_name in os.listdir(self.folder_path):
-            full_path_dir = join(self.folder_path, dir_name)
-            files = os.listdir(full_path_dir)
-            images: List[str] = []
-            for image_path in files:
-                full_path_file = join(full_path_dir, image_path)
-                if isfile(full_path_file):
-                    images.append(full_path_file)
-            if len(images) > 0:
-                self.face.registerFace(images=images, userid=dir_name)
-                need_backup = True
+        # (face, user id, is listed on that replica)
+        jobs: List[Tuple[object, str, bool]] = []
+        for face in self.faces:
+            listed_users = set(face.listFaces())
+            for user_id in listed_users - set(current.keys()):
+                if self.__delete_face(face, user_id):
+                    need_backup = True
+            for user_id in current.keys():
+                # a replica which lost its database (e.g. a failed restore) is registered again
+                if user_id in changed_users or user_id not in listed_users:
+                    jobs.append((face, user_id, user_id in listed_users))
+
+        failed_users: Set[str] = set()
+        if len(jobs) > 0:
+            upload_paths = self.__prepare_images(current, {user_id for _, user_id, _ in jobs})
+            # the uploads are bounded, so the DeepStack server rather than the serial uploading limits the training
+            with ThreadPoolExecutor(max_workers=min(self.upload_workers, len(jobs))) as executor:
+                results = executor.map(lambda job: self.__register_face(job[0], job[1], job[2], upload_paths[job[1]]), jobs)
+                for (_, user_id, _), succeeded in zip(jobs, results):
+                    if succeeded:
+                        need_backup = True
+                    else:
+                        failed_users.add(user_id)
+
+        # the failed users are left out of the manifest, so they are registered again on the next training
+        self.manifest.users = {user_id: images for user_id, images in current.items() if user_id not in failed_users}
+        if need_backup:
+            self.manifest.generation += 1
+        self.manifest.save()
+        self.preprocessor.prune([image.content_hash for images in current.values() for image in images.values()])
+        logger.info(f'face training has been completed, changed users: {len(changed_users)}, registrations: {len(jobs)}, '
+                    f'failed users: {len(failed_users)}')
+
         if need_backup:
-            time.sleep(3.)
             backup = BackUp()
             backup.backup()
+        if len(failed_users) > 0:
+            raise Exception(f'face registration failed for users: {", ".join(sorted(failed_users))}')
+
+    def __prepare_images(self, current: Dict[str, Dict[str, TrainImage]], user_ids: Set[str]) -> Dict[str, List[str]]:
+        items: List[Tuple[str, str]] = []
+        for user_id in user_ids:
+            for file_name, image in current[user_id].items():
+                items.append((join(self.folder_path, user_id, file_name), image.content_hash))
+        prepared = self.preprocessor.prepare(items)
+        return {user_id: [prepared[join(self.folder_path, user_id, file_name)] for file_name in current[user_id].keys()]
+                for user_id in user_ids}
+
+    def __register_face(self, face, user_id: str, is_listed: bool, image_paths: List[str]) -> bool:
+        if is_listed:
+            self.__delete_face(face, user_id)
+        try:
+            face.registerFace(images=image_paths, userid=user_id)
+            return True
+        except BaseException as ex:
+            logger.error(f'an error occurred while registering a DeepStack face, user: {user_id}, ex: {ex}')
+            return False
 
+    @staticmethod
+    def __delete_face(face, user_id: str) -> bool:
+        try:
+            face.deleteFace(user_id)
+            return True
+        except BaseException as ex:
+            logger.error(f'en error occurred while deleting a DeepStack face, ex: {ex}')
+            return False
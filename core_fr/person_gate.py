@@ -0,0 +1,117 @@
+import io
+import math
+from typing import List, Tuple
+
+from PIL import Image
+
+from common.config import DeepStackConfig
+from common.deepstack.image_utils import encode_pil_image
+
+
+class _Tile:
+    def __init__(self, x: int, y: int, width: int, height: int, offset_x: int, offset_y: int):
+        # the position in the request image and in the frame
+        self.x: int = x
+        self.y: int = y
+        self.width: int = width
+        self.height: int = height
+        self.offset_x: int = offset_x
+        self.offset_y: int = offset_y
+
+
+class PersonDetection:
+    def __init__(self, box: Tuple[int, int, int, int], track_id: int):
+        self.box: Tuple[int, int, int, int] = box
+        self.track_id: int = track_id  # zero if object detection does not track
+
+
+class CropRequest:
+    def __init__(self, image: bytes, tiles: List[_Tile]):
+        self.image: bytes = image
+        self.tiles: List[_Tile] = tiles
+
+    # maps the face boxes back to the frame, a face crossing a tile boundary of a mosaic is dropped
+    def map_predictions(self, predictions: List[dict]) -> List[dict]:
+        ret: List[dict] = []
+        for prediction in predictions:
+            for tile in self.tiles:
+                if tile.x <= prediction['x_min'] and prediction['x_max'] <= tile.x + tile.width and \
+                        tile.y <= prediction['y_min'] and prediction['y_max'] <= tile.y + tile.height:
+                    mapped = dict(prediction)
+                    mapped['x_min'], mapped['x_max'] = prediction['x_min'] - tile.x + tile.offset_x, prediction['x_max'] - tile.x + tile.offset_x
+                    mapped['y_min'], mapped['y_max'] = prediction['y_min'] - tile.y + tile.offset_y, prediction['y_max'] - tile.y + tile.offset_y
+                    ret.append(mapped)
+                    break
+        return ret
+
+
+# runs facial recognition only on the padded person boxes which object detection has already found,
+# so the frames of cars or dogs are never sent and a person is uploaded instead of the whole frame
+class PersonGate:
+    def __init__(self, padding: float, use_mosaic: bool):
+        self.padding: float = max(.0, padding)
+        self.use_mosaic: bool = use_mosaic
+
+    def create_requests(self, image: bytes, boxes: List[Tuple[int, int, int, int]]) -> List[CropRequest]:
+        img = Image.open(io.BytesIO(image))
+        if img.mode not in ('RGB', 'L'):
+            img = img.convert('RGB')
+        width, height = img.size
+        regions = _merge_overlapping([self.__pad(box, width, height) for box in boxes])
+        crops = [(img.crop(region), region) for region in regions if region[2] > region[0] and region[3] > region[1]]
+        if not self.use_mosaic or len(crops) < 2:
+            return [CropRequest(encode_pil_image(crop), [_Tile(0, 0, crop.width, crop.height, region[0], region[1])]) for crop, region in crops]
+
+        cols = math.ceil(math.sqrt(len(crops)))
+        rows = math.ceil(len(crops) / cols)
+        cell_width, cell_height = max(c.width for c, _ in crops), max(c.height for c, _ in crops)
+        mosaic = Image.new('RGB', (cols * cell_width, rows * cell_height))
+        tiles: List[_Tile] = []
+        for index, (crop, region) in enumerate(crops):
+            x, y = (index % cols) * cell_width, (index // cols) * cell_height
+            mosaic.paste(crop, (x, y))
+            tiles.append(_Tile(x, y, crop.width, crop.height, region[0], region[1]))
+        return [CropRequest(encode_pil_image(mosaic), tiles)]
+
+    def __pad(self, box: Tuple[int, int, int, int], width: int, height: int) -> Tuple[int, int, int, int]:
+        x1, y1, x2, y2 = box
+        pad_x, pad_y = (x2 - x1) * self.padding, (y2 - y1) * self.padding
+        return max(0, int(x1 - pad_x)), max(0, int(y1 - pad_y)), min(width, int(x2 + pad_x)), min(height, int(y2 + pad_y))
+
+
+# returns None if the event does not come from object detection
+def get_person_detections(dic: dict) -> List[PersonDetection] | None:
+    detections = dic.get('detections')
+    if detections is None or dic.get('list_name', 'detected_objects') != 'detected_objects':
+        return None
+    ret: List[PersonDetection] = []
+    for detection in detections:
+        if detection.get('pred_cls_name') == 'person':
+            box = detection['box']
+            ret.append(PersonDetection((box['x1'], box['y1'], box['x2'], box['y2']), detection.get('track_id', 0)))
+    return ret
+
+
+# the overlapping regions are merged, so a face in the overlap is neither uploaded nor reported twice
+def _merge_overlapping(regions: List[Tuple[int, int, int, int]]) -> List[Tuple[int, int, int, int]]:
+    merged = list(regions)
+    changed = True
+    while changed:
+        changed = False
+        for i in range(len(merged)):
+            for j in range(i + 1, len(merged)):
+                a, b = merged[i], merged[j]
+                if a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]:
+                    merged[i] = (min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3]))
+                    del merged[j]
+                    changed = True
+                    break
+            if changed:
+                break
+    return merged
+
+
+def create_person_gate(ds_config: DeepStackConfig) -> PersonGate | None:
+    if not ds_config.fr_person_gate_enabled:
+        return None
+    return PersonGate(ds_config.fr_person_gate_padding, ds_config.fr_person_gate_mosaic)
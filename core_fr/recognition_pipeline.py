@@ -0,0 +1,51 @@
+from typing import List
+
+from common.config import DeepStackConfig
+from common.metrics import stage_seconds, dropped_total
+from core_fr.face_recognizer import DetectedFace
+from core_fr.face_track_cache import create_face_track_cache
+from core_fr.person_gate import PersonDetection, CropRequest, create_person_gate, get_person_detections
+
+
+# the steps around the recognition, shared by the threaded and the asyncio handlers. none of them does I/O,
+# the asyncio handler runs the person crops in a worker thread
+class RecognitionPipeline:
+    def __init__(self, ds_config: DeepStackConfig, channel: str):
+        self.channel: str = channel
+        self.person_gate = create_person_gate(ds_config)
+        self.face_cache = create_face_track_cache(ds_config)
+
+    # the person boxes of an event coming from object detection, None if they are not given or not used
+    def get_persons(self, dic: dict) -> List[PersonDetection] | None:
+        return get_person_detections(dic) if self.person_gate is not None or self.face_cache is not None else None
+
+    # returns True if object detection has found no person in the frame, there is nothing to recognize then
+    def has_no_person(self, persons: List[PersonDetection] | None) -> bool:
+        if persons is not None and len(persons) == 0 and self.person_gate is not None:
+            dropped_total.inc(reason='no_person', channel=self.channel)
+            return True
+        return False
+
+    # returns None if the faces of the tracked persons have to be recognized again
+    def try_reuse(self, source_id: str, persons: List[PersonDetection] | None) -> List[DetectedFace] | None:
+        if not self.__uses_cache(persons):
+            return None
+        cached = self.face_cache.try_reuse(source_id, persons)
+        if cached is not None:
+            dropped_total.inc(reason='face_cache', channel=self.channel)
+        return cached
+
+    # only the person crops are sent if the person gate is enabled and the event comes from object detection
+    def crops_persons(self, persons: List[PersonDetection] | None) -> bool:
+        return persons is not None and self.person_gate is not None
+
+    def create_requests(self, image: bytes, persons: List[PersonDetection]) -> List[CropRequest]:
+        with stage_seconds.time(stage='person_crop', channel=self.channel):
+            return self.person_gate.create_requests(image, [p.box for p in persons])
+
+    # the recognized faces are voted per person track, the cache may answer with the leader of a track
+    def update(self, source_id: str, persons: List[PersonDetection] | None, results: List[DetectedFace]) -> List[DetectedFace]:
+        return self.face_cache.update(source_id, persons, results) if self.__uses_cache(persons) else results
+
+    def __uses_cache(self, persons: List[PersonDetection] | None) -> bool:
+        return self.face_cache is not None and persons is not None and len(persons) > 0
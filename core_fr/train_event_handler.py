@@ -1,4 +1,5 @@
 import json
+import threading
 
 from common.event_bus.event_bus import EventBus
 from common.event_bus.event_handler import EventHandler
@@ -6,6 +7,11 @@ from common.utilities import logger
 from core_fr.face_trainer import FaceTrainer
 from core_fr.utilities import EventChannels, start_thread
 
+# the requests which arrive during a training are merged into a single run after it
+_state_lock = threading.Lock()
+_is_training = False
+_is_pending = False
+
 
 class TrainEventHandler(EventHandler):
 
@@ -13,7 +19,27 @@ class TrainEventHandler(EventHandler):
         if dic is None or dic['type'] != 'message':
             return
 
-        start_thread(_train, args=[])
+        global _is_training, _is_pending
+        with _state_lock:
+            if _is_training:
+                _is_pending = True
+                logger.info('a face training is already in progress, the request has been merged into the next run')
+                return
+            _is_training = True
+        start_thread(_train_until_no_pending, args=[])
+
+
+def _train_until_no_pending():
+    global _is_training, _is_pending
+    while True:
+        try:
+            _train()
+        finally:
+            with _state_lock:
+                if not _is_pending:
+                    _is_training = False
+                    return
+                _is_pending = False
 
 
 def _train():
@@ -0,0 +1,94 @@
+import hashlib
+import json
+import os
+from os.path import isfile, join
+from typing import Dict, List
+
+from common.utilities import logger
+
+
+class TrainImage:
+    def __init__(self, file_name: str, content_hash: str, size: int, mtime: float):
+        self.file_name: str = file_name
+        self.content_hash: str = content_hash
+        self.size: int = size
+        self.mtime: float = mtime
+
+
+# keeps the content hashes of the registered training images per user, so only the added or changed users are registered again
+class TrainManifest:
+    def __init__(self, file_path: str):
+        self.file_path: str = file_path
+        self.users: Dict[str, Dict[str, TrainImage]] = {}
+        self.generation: int = 0
+
+    def load(self):
+        if not os.path.exists(self.file_path):
+            return
+        try:
+            with open(self.file_path, 'r') as file:
+                dic = json.load(file)
+            self.generation = dic.get('generation', 0)
+            for user_id, images in dic.get('users', {}).items():
+                self.users[user_id] = {name: TrainImage(name, v['hash'], v['size'], v['mtime']) for name, v in images.items()}
+        except BaseException as ex:
+            # a broken manifest causes a full training, which is the old behavior
+            logger.error(f'an error occurred while loading the train manifest, all users will be registered again, err: {ex}')
+            self.users = {}
+
+    # written to a temp file first, so a crash never leaves a half-written manifest
+    def save(self):
+        dic = {'generation': self.generation, 'users': {}}
+        for user_id, images in self.users.items():
+            dic['users'][user_id] = {name: {'hash': i.content_hash, 'size': i.size, 'mtime': i.mtime} for name, i in images.items()}
+        temp_path = f'{self.file_path}.tmp'
+        with open(temp_path, 'w') as file:
+            json.dump(dic, file)
+        os.replace(temp_path, self.file_path)
+
+    # the unchanged files (same size and modification time) are not hashed again
+    def scan(self, folder_path: str) -> Dict[str, Dict[str, TrainImage]]:
+        ret: Dict[str, Dict[str, TrainImage]] = {}
+        for user_id in os.listdir(folder_path):
+            full_path_dir = join(folder_path, user_id)
+            if isfile(full_path_dir):
+                continue
+            previous = self.users.get(user_id, {})
+            images: Dict[str, TrainImage] = {}
+            for file_name in os.listdir(full_path_dir):
+                full_path_file = join(full_path_dir, file_name)
+                if not isfile(full_path_file):
+                    continue
+                stat = os.stat(full_path_file)
+                known = previous.get(file_name)
+                if known is not None and known.size == stat.st_size and known.mtime == stat.st_mtime:
+                    images[file_name] = known
+                else:
+                    images[file_name] = TrainImage(file_name, hash_file(full_path_file), stat.st_size, stat.st_mtime)
+            if len(images) > 0:
+                ret[user_id] = images
+        return ret
+
+    def get_changed_users(self, current: Dict[str, Dict[str, TrainImage]]) -> List[str]:
+        ret: List[str] = []
+        for user_id, images in current.items():
+            previous = self.users.get(user_id)
+            if previous is None or get_user_hash(previous) != get_user_hash(images):
+                ret.append(user_id)
+        return ret
+
+
+def hash_file(file_path: str) -> str:
+    h = hashlib.blake2b(digest_size=16)
+    with open(file_path, 'rb') as file:
+        for chunk in iter(lambda: file.read(1024 * 1024), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def get_user_hash(images: Dict[str, TrainImage]) -> str:
+    h = hashlib.blake2b(digest_size=16)
+    for file_name in sorted(images.keys()):
+        h.update(file_name.encode('utf-8'))
+        h.update(images[file_name].content_hash.encode('utf-8'))
+    return h.hexdigest()
@@ -0,0 +1,79 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from os.path import join
+from typing import Dict, List, Tuple
+
+from PIL import Image, ImageOps
+
+from common.utilities import logger
+
+
+# decodes, rotates by the EXIF orientation and downscales the training images in a thread pool (Pillow releases the GIL while decoding
+# and resizing, and the facial recognition process is daemonic, so it cannot have child processes),
+# the results are cached by the content hash, so an unchanged photo is never processed twice
+class TrainPreprocessor:
+    def __init__(self, cache_dir: str, max_size: int, worker_count: int):
+        self.cache_dir: str = cache_dir
+        self.max_size: int = max_size
+        self.worker_count: int = worker_count if worker_count > 0 else (os.cpu_count() or 1)
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def get_cache_path(self, content_hash: str) -> str:
+        return join(self.cache_dir, f'{content_hash}_{self.max_size}.jpg')
+
+    # items are (source path, content hash), returns the source path => the path to upload
+    def prepare(self, items: List[Tuple[str, str]]) -> Dict[str, str]:
+        ret: Dict[str, str] = {}
+        if self.max_size < 1:
+            return {source_path: source_path for source_path, _ in items}
+        jobs: List[Tuple[str, str, int]] = []
+        for source_path, content_hash in items:
+            cache_path = self.get_cache_path(content_hash)
+            ret[source_path] = cache_path
+            if not os.path.exists(cache_path):
+                jobs.append((source_path, cache_path, self.max_size))
+        if len(jobs) == 0:
+            return ret
+
+        try:
+            with ThreadPoolExecutor(max_workers=min(self.worker_count, len(jobs))) as executor:
+                for (source_path, _, _), succeeded in zip(jobs, executor.map(preprocess_image, jobs)):
+                    if not succeeded:
+                        ret[source_path] = source_path  # the original image is uploaded as it was before
+        except BaseException as ex:
+            logger.error(f'an error occurred while preprocessing the training images, the original images will be uploaded, err: {ex}')
+            return {source_path: source_path for source_path, _ in items}
+        logger.info(f'{len(jobs)} training images have been preprocessed, {len(items) - len(jobs)} were found in the cache')
+        return ret
+
+    # removes the cached images whose source images no longer exist
+    def prune(self, content_hashes: List[str]):
+        keep = {os.path.basename(self.get_cache_path(content_hash)) for content_hash in content_hashes}
+        for file_name in os.listdir(self.cache_dir):
+            if file_name in keep:
+                continue
+            try:
+                os.remove(join(self.cache_dir, file_name))
+            except BaseException as ex:
+                logger.error(f'an error occurred while removing a cached training image, err: {ex}')
+
+
+# runs on a pool thread and returns only a flag, the errors are logged here
+def preprocess_image(job: Tuple[str, str, int]) -> bool:
+    source_path, cache_path, max_size = job
+    temp_path = f'{cache_path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    try:
+        with Image.open(source_path) as img:
+            img = ImageOps.exif_transpose(img)
+            if img.mode != 'RGB':
+                img = img.convert('RGB')
+            img.thumbnail((max_size, max_size), Image.LANCZOS)
+            img.save(temp_path, format='JPEG', quality=92)
+        os.replace(temp_path, cache_path)
+        return True
+    except BaseException as ex:
+        logger.error(f'an error occurred while preprocessing a training image ({source_path}), err: {ex}')
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        return False
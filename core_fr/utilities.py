@@ -2,9 +2,11 @@ import os
 import uuid
 from enum import Enum
 from threading import Thread
+from typing import List
 
 from deepstack_sdk import ServerConfig, Face
 
+from common.deepstack.backend_pool import get_backend_urls, ReplicaRole
 from common.utilities import config
 from utils.dir import get_root_path_for_deepstack
 
@@ -19,18 +21,30 @@ class EventChannels(str, Enum):
     frtc = 'frtc'
 
 
-def create_face() -> Face:
-    ds_config = config.deep_stack
-    ds = ServerConfig(f'{ds_config.server_url}:{ds_config.server_port}')
+def create_face(server_url: str) -> Face:
+    ds = ServerConfig(server_url)
     ds.api_key = config.deep_stack.api_key
     face = Face(ds)
     return face
 
 
+# every replica serving facial recognition has its own face database, so all of them are trained
+def get_fr_server_urls() -> List[str]:
+    return get_backend_urls(config.deep_stack, ReplicaRole.FaceRecognition)
+
+
 def get_train_dir_path() -> str:
     return os.path.join(get_root_path_for_deepstack(config), 'fr', 'ml', 'train')
 
 
+def get_train_manifest_path() -> str:
+    return os.path.join(get_root_path_for_deepstack(config), 'fr', 'ml', 'train_manifest.json')
+
+
+def get_train_cache_dir_path() -> str:
+    return os.path.join(get_root_path_for_deepstack(config), 'fr', 'ml', 'train_cache')
+
+
 def create_dir_if_not_exist(path: str):
     if not os.path.exists(path):
         os.makedirs(path)
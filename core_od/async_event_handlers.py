@@ -0,0 +1,111 @@
+import asyncio
+
+from common.deepstack.async_deepstack_client import AsyncDeepStackClient
+from common.deepstack.deepstack_client import DeepStackUnavailableError
+from common.deepstack.image_utils import to_encoded_image
+from common.data.image_repository import AsyncImageRepository, get_forward_image_key_async
+from common.event_bus.async_event_bus import AsyncEventBus
+from common.event_bus.event_codec import EventCodec, decode_event, get_event_image
+from common.event_bus.event_handler import AsyncEventHandler
+from common.metrics import stage_seconds, frames_total, published_total
+from common.utilities import logger, config, crate_async_redis_connection, RedisDb
+from core_fr.utilities import EventChannels
+from core_od.deepstack_object_detector import to_detection_results
+from core_od.detection_pipeline import DetectionPipeline
+from core_od.event_handlers import create_od_event
+from core_od.frame_mailbox import FrameMailbox
+from core_od.mosaic_batcher import create_async_mosaic_batcher
+
+
+class OdAsyncReadServiceEventHandler(AsyncEventHandler):
+    def __init__(self, client: AsyncDeepStackClient, publisher: AsyncEventBus):
+        self.client = client
+        self.publisher = publisher
+        self.codec = EventCodec(publisher.channel)
+        self.min_confidence = config.deep_stack.od_threshold
+        self.encoding = 'utf-8'
+        self.channel: str = EventChannels.snapshot_in.value
+        self.image_by_reference: bool = config.deep_stack.image_by_reference
+        self.images = AsyncImageRepository(crate_async_redis_connection(RedisDb.MAIN), config.deep_stack.image_ttl)
+        self.mailbox = FrameMailbox(config.deep_stack.od_max_in_flight_per_camera, self.channel)
+        self.pipeline = DetectionPipeline(config.deep_stack, self.channel)
+        self.batcher = create_async_mosaic_batcher(client, config.deep_stack)
+
+    async def handle(self, dic: dict):
+        if dic is None or dic['type'] != 'message':
+            return
+
+        try:
+            with stage_seconds.time(stage='json_decode', channel=self.channel):
+                dic = decode_event(dic['data'])
+            source_id = dic['source_id']
+        except BaseException as ex:
+            logger.error(f'an error occurred while parsing an async object-detection request, err: {ex}')
+            return
+
+        self.mailbox.post(source_id, dic)
+        while True:
+            dic = self.mailbox.take(source_id)
+            if dic is None:
+                return
+            try:
+                await self._handle(dic)
+            finally:
+                self.mailbox.release(source_id)
+
+    # noinspection DuplicatedCode
+    async def _handle(self, dic: dict):
+        try:
+            name = dic['name']
+            source_id = dic['source_id']
+            image_key = dic.get('image_key', '')
+            ai_clip_enabled = dic['ai_clip_enabled']
+            frames_total.inc(channel=self.channel, source=source_id)
+
+            with stage_seconds.time(stage='image_fetch', channel=self.channel):
+                image, base64_image = (await self.images.get(image_key), '') if len(image_key) > 0 else get_event_image(dic, 'base64_image')
+            if image is None:
+                logger.warning(f'(camera {name}) image ({image_key}) has already expired')
+                return
+
+            if not await self.__is_changed(source_id, image):
+                results = self.pipeline.get_gated_results(source_id)
+                if results is None:
+                    logger.info(f'(camera {name}) frame has not changed, the inference is skipped')
+                    return
+            else:
+                zones, max_size = self.pipeline.get_frame_options(source_id)
+                frame = await asyncio.to_thread(self.pipeline.prepare, image, zones, max_size) if zones is not None or max_size > 0 else None
+                try:
+                    detector = self.batcher if self.batcher is not None else self.client
+                    predictions = await detector.detect_objects(to_encoded_image(image if frame is None else frame.image), self.min_confidence)
+                except (asyncio.CancelledError, KeyboardInterrupt):
+                    raise
+                except DeepStackUnavailableError:
+                    # shed while DeepStack is unavailable, counted by the dropped metric
+                    self.pipeline.fail(source_id)
+                    return
+                except BaseException as ex:
+                    logger.error(f'an error occurred while async detection api call, source: {source_id}, ex: {ex}')
+                    self.pipeline.fail(source_id)
+                    return
+                results = self.pipeline.finish(source_id, to_detection_results(predictions), zones, frame)
+            if self.pipeline.is_track_unchanged(source_id, results):
+                return
+            if len(results) > 0:
+                image_key = await get_forward_image_key_async(self.images, image, image_key, self.image_by_reference)
+                with stage_seconds.time(stage='json_encode', channel=self.channel):
+                    event = create_od_event(self.codec, name, source_id, image, base64_image, image_key, ai_clip_enabled, results)
+                with stage_seconds.time(stage='publish', channel=self.channel):
+                    await self.publisher.publish(event)
+                published_total.inc(channel=self.channel, source=source_id)
+            else:
+                logger.info(f'(camera {name}) detected nothing')
+        except (asyncio.CancelledError, KeyboardInterrupt):
+            raise
+        except BaseException as ex:
+            logger.error(f'an error occurred while handling an async object-detection request by DeepStack, err: {ex}')
+
+    # the thumbnail is decoded in a worker thread, the gate is guarded by its own lock
+    async def __is_changed(self, source_id: str, image: bytes) -> bool:
+        return self.pipeline.motion_gate is None or await asyncio.to_thread(self.pipeline.is_changed, source_id, image)
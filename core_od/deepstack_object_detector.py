@@ -1,33 +1,47 @@
-from typing import List
-from deepstack_sdk import ServerConfig, Detection
-from deepstack_sdk.structs import DetectionResponse
-import numpy.typing as npt
+from typing import List, Any
 
+from common.deepstack.backend_pool import ReplicaRole
+from common.deepstack.deepstack_client import DeepStackUnavailableError, create_deepstack_client
+from common.deepstack.image_utils import to_encoded_image
 from common.utilities import config, logger
 from core_od.models.coco_objects import coco80_object
 from core_od.models.detections import DetectionBox, DetectionResult
+from core_od.mosaic_batcher import create_mosaic_batcher
 
 
 class DeepstackObjectDetector:
     def __init__(self):
         self.ds_config = config.deep_stack
-        ds = ServerConfig(f'{self.ds_config.server_url}:{self.ds_config.server_port}')
-        ds.api_key = config.deep_stack.api_key
         self.min_confidence = self.ds_config.od_threshold
-        self.detection = Detection(ds)
+        self.client = create_deepstack_client(ReplicaRole.ObjectDetection)
+        self.batcher = create_mosaic_batcher(self.client, self.ds_config)
 
-    def get_results(self, img: npt.NDArray, detected_by: str) -> List[DetectionResult]:
-        ret: List[DetectionResult] = []
+    # img is expected to be the encoded (jpeg, png etc.) image bytes, PIL images and numpy arrays are encoded before sending.
+    # returns None if the detection has failed, so a failure is not mistaken for a frame without any object
+    def get_results(self, img: Any, detected_by: str) -> List[DetectionResult] | None:
         try:
-            detections: DetectionResponse = self.detection.detectObject(img, min_confidence=self.min_confidence)
-            for d in detections:
-                cls_idx = coco80_object.get_index(d.label)
-                box = DetectionBox()
-                box.x1, box.y1, box.x2, box.y2 = d.x_min, d.y_min, d.x_max, d.y_max
-                r = DetectionResult()
-                r.box = box
-                r.pred_cls_name, r.pred_cls_idx, r.pred_score = d.label, cls_idx, d.confidence
-                ret.append(r)
+            image = to_encoded_image(img)
+            if self.batcher is not None:
+                predictions = self.batcher.detect_objects(image, self.min_confidence)
+            else:
+                predictions = self.client.detect_objects(image, self.min_confidence)
+            return to_detection_results(predictions)
+        except DeepStackUnavailableError:
+            pass  # shed while DeepStack is unavailable, counted by the dropped metric
         except BaseException as ex:
             logger.error(f'an error occurred while detection api call, source: {detected_by}, ex: {ex}')
-        return ret
+        return None
+
+
+def to_detection_results(predictions: List[dict]) -> List[DetectionResult]:
+    ret: List[DetectionResult] = []
+    for d in predictions:
+        label = d['label']
+        cls_idx = coco80_object.get_index(label)
+        box = DetectionBox()
+        box.x1, box.y1, box.x2, box.y2 = d['x_min'], d['y_min'], d['x_max'], d['y_max']
+        r = DetectionResult()
+        r.box = box
+        r.pred_cls_name, r.pred_cls_idx, r.pred_score = label, cls_idx, d['confidence']
+        ret.append(r)
+    return ret
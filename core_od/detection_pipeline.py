@@ -0,0 +1,74 @@
+from typing import List, Tuple
+
+from common.config import DeepStackConfig
+from common.metrics import stage_seconds, dropped_total
+from core_od.frame_resizer import PreparedFrame, create_frame_resizer, prepare_frame, restore_boxes
+from core_od.motion_gate import create_motion_gate
+from core_od.object_tracker import create_object_tracker
+from core_od.models.detections import DetectionResult
+from core_od.zone_filter import CameraZones, create_zone_filter
+
+
+# the steps around the inference, shared by the threaded and the asyncio handlers. none of them does I/O,
+# the asyncio handler runs the ones decoding an image in a worker thread
+class DetectionPipeline:
+    def __init__(self, ds_config: DeepStackConfig, channel: str):
+        self.channel: str = channel
+        self.motion_gate = create_motion_gate(ds_config)
+        self.reuse_gated_results: bool = ds_config.od_motion_gate_reuse_results
+        self.zone_filter = create_zone_filter(ds_config)
+        self.tracker = create_object_tracker(ds_config)
+        self.frame_resizer = create_frame_resizer(ds_config)
+
+    # returns False if the frame is the same as the previous one of the camera, the inference can then be skipped
+    def is_changed(self, source_id: str, image: bytes) -> bool:
+        if self.motion_gate is None:
+            return True
+        with stage_seconds.time(stage='motion_gate', channel=self.channel):
+            changed = self.motion_gate.is_changed(source_id, image)
+        if not changed:
+            dropped_total.inc(reason='motion_gate', channel=self.channel)
+        return changed
+
+    # the results of the previous frame of the camera, or None if the unchanged frames are not published again
+    def get_gated_results(self, source_id: str) -> List[DetectionResult] | None:
+        return self.motion_gate.get_previous_results(source_id) if self.reuse_gated_results else None
+
+    # only the region of interest is sent if the camera has one, downscaled to the inference size of the camera
+    def get_frame_options(self, source_id: str) -> Tuple[CameraZones | None, int]:
+        zones = self.zone_filter.get(source_id) if self.zone_filter is not None else None
+        max_size = self.frame_resizer.get_max_size(source_id) if self.frame_resizer is not None else 0
+        return zones, max_size
+
+    # returns None if the image is sent as it is
+    def prepare(self, image: bytes, zones: CameraZones | None, max_size: int) -> PreparedFrame | None:
+        if zones is None and max_size < 1:
+            return None
+        with stage_seconds.time(stage='frame_prepare', channel=self.channel):
+            return prepare_frame(image, zones.roi if zones is not None else None, max_size)
+
+    # maps the boxes back to the original frame and drops the masked ones, the gate keeps them for the unchanged frames
+    def finish(self, source_id: str, results: List[DetectionResult], zones: CameraZones | None,
+               frame: PreparedFrame | None) -> List[DetectionResult]:
+        if frame is not None:
+            restore_boxes(results, frame)
+        if zones is not None:
+            count = len(results)
+            results = self.zone_filter.apply(results, zones, frame)
+            if len(results) < count:
+                dropped_total.inc(count - len(results), reason='zone_mask', channel=self.channel)
+        if self.motion_gate is not None:
+            self.motion_gate.set_results(source_id, results)
+        return results
+
+    # the reference was updated before the failed inference, so the next frame is not skipped as unchanged
+    def fail(self, source_id: str):
+        if self.motion_gate is not None:
+            self.motion_gate.invalidate(source_id)
+
+    # the unchanged tracks are not published again until the refresh interval
+    def is_track_unchanged(self, source_id: str, results: List[DetectionResult]) -> bool:
+        if self.tracker is not None and not self.tracker.update(source_id, results):
+            dropped_total.inc(reason='tracker_unchanged', channel=self.channel)
+            return True
+        return False
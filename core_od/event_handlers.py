@@ -1,16 +1,15 @@
-import base64
-import io
-import json
-from threading import Thread
-import numpy as np
 from typing import List
-from PIL import Image, UnidentifiedImageError
 
-from common.event_bus.event_bus import EventBus
+from common.event_bus.event_bus_factory import create_event_bus
+from common.event_bus.event_codec import EventCodec, decode_event, get_event_image
 from common.event_bus.event_handler import EventHandler
-from common.utilities import logger
+from common.data.image_repository import ImageRepository, get_forward_image_key
+from common.metrics import stage_seconds, frames_total, published_total
+from common.utilities import logger, config, crate_redis_connection, RedisDb
 from core_fr.utilities import EventChannels
 from core_od.deepstack_object_detector import DeepstackObjectDetector
+from core_od.detection_pipeline import DetectionPipeline
+from core_od.frame_mailbox import FrameMailbox
 from core_od.models.detections import DetectionResult
 
 
@@ -18,47 +17,101 @@ class OdReadServiceEventHandler(EventHandler):
     def __init__(self, detector: DeepstackObjectDetector):
         self.detector = detector
         self.encoding = 'utf-8'
-        self.publisher = EventBus(EventChannels.snapshot_out)
+        self.channel: str = EventChannels.snapshot_in.value
+        self.publisher = create_event_bus(EventChannels.snapshot_out)
+        self.codec = EventCodec(EventChannels.snapshot_out)
+        self.mailbox = FrameMailbox(config.deep_stack.od_max_in_flight_per_camera, self.channel)
+        self.pipeline = DetectionPipeline(config.deep_stack, self.channel)
+        self.image_by_reference: bool = config.deep_stack.image_by_reference
+        self.images = ImageRepository(crate_redis_connection(RedisDb.MAIN), config.deep_stack.image_ttl)
 
     def handle(self, dic: dict):
         if dic is None or dic['type'] != 'message':
             return
 
-        th = Thread(target=self._handle, args=[dic])
-        th.daemon = True
-        th.start()
+        try:
+            with stage_seconds.time(stage='json_decode', channel=self.channel):
+                dic = decode_event(dic['data'])
+            source_id = dic['source_id']
+        except BaseException as ex:
+            logger.error(f'an error occurred while parsing an object-detection request, err: {ex}')
+            return
+
+        # it is already called by a worker of the event bus pool, no need to start another thread.
+        # only the newest frame of the camera is processed, a stale one is replaced while the camera is busy
+        self.mailbox.post(source_id, dic)
+        self.__drain(source_id)
+
+    def __drain(self, source_id: str):
+        while True:
+            dic = self.mailbox.take(source_id)
+            if dic is None:
+                return
+            try:
+                self._handle(dic)
+            finally:
+                self.mailbox.release(source_id)
 
     # noinspection DuplicatedCode
     def _handle(self, dic: dict):
         try:
-            data: bytes = dic['data']
-            dic = json.loads(data.decode(self.encoding))
             name = dic['name']
             source_id = dic['source_id']
-            base64_image = dic['base64_image']
+            image_key = dic.get('image_key', '')
             ai_clip_enabled = dic['ai_clip_enabled']
+            frames_total.inc(channel=self.channel, source=source_id)
 
-            base64_decoded = base64.b64decode(base64_image)
-            try:
-                image = Image.open(io.BytesIO(base64_decoded))
-            except UnidentifiedImageError as err:
-                logger.error(f'an error occurred while creating a PIL image from base64 string, err: {err}')
+            # the image is fetched lazily, so the stale frames replaced in the mailbox are never fetched.
+            # the encoded image bytes are sent as they are, no need to decode the image here
+            with stage_seconds.time(stage='image_fetch', channel=self.channel):
+                image, base64_image = (self.images.get(image_key), '') if len(image_key) > 0 else get_event_image(dic, 'base64_image')
+            if image is None:
+                logger.warning(f'(camera {name}) image ({image_key}) has already expired')
                 return
-            img_np = np.asarray(image)
 
-            results: List[DetectionResult] = self.detector.get_results(img_np, source_id)
+            if not self.pipeline.is_changed(source_id, image):
+                results: List[DetectionResult] | None = self.pipeline.get_gated_results(source_id)
+                if results is None:
+                    logger.info(f'(camera {name}) frame has not changed, the inference is skipped')
+                    return
+            else:
+                zones, max_size = self.pipeline.get_frame_options(source_id)
+                frame = self.pipeline.prepare(image, zones, max_size)
+                results = self.detector.get_results(image if frame is None else frame.image, source_id)
+                if results is None:
+                    # the failure has already been logged, neither the gate nor the tracker keeps it as an empty frame
+                    self.pipeline.fail(source_id)
+                    return
+                results = self.pipeline.finish(source_id, results, zones, frame)
+            if self.pipeline.is_track_unchanged(source_id, results):
+                return
             if len(results) > 0:
-                detected_dic_list = []
-                for r in results:
-                    dic_box = {'x1': r.box.x1, 'y1': r.box.y1, 'x2': r.box.x2, 'y2': r.box.y2}
-                    dic_result = {'pred_cls_name': r.pred_cls_name, 'pred_cls_idx': r.pred_cls_idx, 'pred_score': r.pred_score, 'box': dic_box}
-                    detected_dic_list.append(dic_result)
-
-                dic = {'name': name, 'source': source_id, 'img': base64_image, 'ai_clip_enabled': ai_clip_enabled, 'detections': detected_dic_list,
-                       'channel': 'od_service', 'list_name': 'detected_objects'}
-                event = json.dumps(dic)
-                self.publisher.publish(event)
+                image_key = get_forward_image_key(self.images, image, image_key, self.image_by_reference)
+                with stage_seconds.time(stage='json_encode', channel=self.channel):
+                    event = create_od_event(self.codec, name, source_id, image, base64_image, image_key, ai_clip_enabled, results)
+                with stage_seconds.time(stage='publish', channel=self.channel):
+                    self.publisher.publish(event)
+                published_total.inc(channel=self.channel, source=source_id)
             else:
                 logger.info(f'(camera {name}) detected nothing')
         except BaseException as ex:
             logger.error(f'an error occurred while handling an object-detection request by DeepStack, err: {ex}')
+
+
+# the image is embedded unless an image key is given, as base64 in json or as raw bytes in msgpack
+def create_od_event(codec: EventCodec, name: str, source_id: str, image: bytes, base64_image: str, image_key: str, ai_clip_enabled: bool,
+                    results: List[DetectionResult]) -> bytes:
+    detected_dic_list = []
+    for r in results:
+        dic_box = {'x1': r.box.x1, 'y1': r.box.y1, 'x2': r.box.x2, 'y2': r.box.y2}
+        dic_result = {'pred_cls_name': r.pred_cls_name, 'pred_cls_idx': r.pred_cls_idx, 'pred_score': r.pred_score, 'box': dic_box}
+        if r.track_id > 0:
+            dic_result['track_id'] = r.track_id
+        detected_dic_list.append(dic_result)
+
+    dic = {'name': name, 'source': source_id, 'ai_clip_enabled': ai_clip_enabled, 'detections': detected_dic_list,
+           'channel': 'od_service', 'list_name': 'detected_objects'}
+    if len(image_key) > 0:
+        dic['image_key'] = image_key
+        return codec.encode(dic)
+    return codec.encode(dic, 'img', image, base64_image)
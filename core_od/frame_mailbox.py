@@ -0,0 +1,48 @@
+import threading
+from typing import Any, Dict
+
+from common.metrics import dropped_total
+
+
+# keeps only the newest pending frame per camera, older frames are replaced before they reach the DeepStack server
+class FrameMailbox:
+    def __init__(self, max_in_flight_per_source: int, channel: str):
+        self.channel: str = channel
+        self.max_in_flight_per_source: int = max(1, int(max_in_flight_per_source))
+        self.__lock = threading.Lock()
+        self.__pending: Dict[str, Any] = {}
+        self.__in_flight: Dict[str, int] = {}
+        self.posted_count: int = 0
+        self.replaced_count: int = 0
+
+    def post(self, source_id: str, frame: Any):
+        with self.__lock:
+            self.posted_count += 1
+            if source_id in self.__pending:
+                self.replaced_count += 1
+                dropped_total.inc(reason='stale_frame', channel=self.channel)
+            self.__pending[source_id] = frame
+
+    # returns None if there is no pending frame or the camera has already reached its in-flight limit
+    def take(self, source_id: str) -> Any:
+        with self.__lock:
+            if source_id not in self.__pending:
+                return None
+            in_flight = self.__in_flight.get(source_id, 0)
+            if in_flight >= self.max_in_flight_per_source:
+                return None
+            self.__in_flight[source_id] = in_flight + 1
+            return self.__pending.pop(source_id)
+
+    def release(self, source_id: str):
+        with self.__lock:
+            in_flight = self.__in_flight.get(source_id, 0) - 1
+            if in_flight > 0:
+                self.__in_flight[source_id] = in_flight
+            else:
+                self.__in_flight.pop(source_id, None)
+
+    def get_stats(self) -> dict:
+        with self.__lock:
+            return {'pending': len(self.__pending), 'in_flight': sum(self.__in_flight.values()), 'posted': self.posted_count,
+                    'replaced': self.replaced_count}
@@ -0,0 +1,92 @@
+import io
+import threading
+from typing import Dict, List
+
+from PIL import Image
+
+from common.config import DeepStackConfig
+from common.data.inference_size_repository import InferenceSizeRepository
+from common.deepstack.image_utils import encode_pil_image
+from common.utilities import logger, crate_redis_connection, RedisDb
+from core_od.models.detections import DetectionResult
+
+
+class PreparedFrame:
+    def __init__(self, image: bytes, offset_x: int, offset_y: int, scale_x: float, scale_y: float, width: int, height: int):
+        self.image: bytes = image
+        # the sent image coordinates are mapped to the frame by x * scale_x + offset_x
+        self.offset_x: int = offset_x
+        self.offset_y: int = offset_y
+        self.scale_x: float = scale_x
+        self.scale_y: float = scale_y
+        self.width: int = width  # of the full frame
+        self.height: int = height
+
+
+# keeps the per-camera inference sizes, refreshed in the background so a frame never waits for Redis
+class FrameResizer:
+    def __init__(self, repository: InferenceSizeRepository, default_max_size: int, refresh_interval: float):
+        self.repository = repository
+        self.default_max_size: int = default_max_size
+        self.refresh_interval: float = refresh_interval
+        self.__sizes: Dict[str, int] = {}
+        self.__refresh()
+        th = threading.Thread(target=self.__refresh_loop)
+        th.daemon = True
+        th.start()
+
+    def get_max_size(self, source_id: str) -> int:
+        return self.__sizes.get(source_id, self.default_max_size)
+
+    def __refresh_loop(self):
+        stopped = threading.Event()
+        while not stopped.wait(self.refresh_interval):
+            self.__refresh()
+
+    def __refresh(self):
+        try:
+            self.__sizes = self.repository.get_all()
+        except BaseException as ex:
+            logger.error(f'an error occurred while refreshing the camera inference sizes, err: {ex}')
+
+
+# crops the region of interest and downscales it in one pass. A jpeg is decoded in a reduced scale by draft mode,
+# so a 4K frame is never decoded in full resolution when a much smaller image is sent
+def prepare_frame(image: bytes, roi: List[float] | None, max_size: int) -> PreparedFrame:
+    img = Image.open(io.BytesIO(image))
+    width, height = img.size
+    x1, y1, x2, y2 = 0, 0, width, height
+    if roi is not None:
+        x1, y1 = max(0, int(roi[0] * width)), max(0, int(roi[1] * height))
+        x2, y2 = min(width, int(round(roi[2] * width))), min(height, int(round(roi[3] * height)))
+        if x2 <= x1 or y2 <= y1:
+            x1, y1, x2, y2 = 0, 0, width, height
+    region_width, region_height = x2 - x1, y2 - y1
+    ratio = min(1., max_size / max(region_width, region_height)) if max_size > 0 else 1.
+    is_full_frame = x1 == 0 and y1 == 0 and x2 == width and y2 == height
+    if ratio == 1. and is_full_frame:
+        return PreparedFrame(image, 0, 0, 1., 1., width, height)
+
+    target = (max(1, round(region_width * ratio)), max(1, round(region_height * ratio)))
+    if ratio < 1. and img.format == 'JPEG':
+        # draft picks the smallest 1/2, 1/4 or 1/8 scale which is still larger than the requested size
+        img.draft('RGB', (max(1, round(width * ratio)), max(1, round(height * ratio))))
+    draft_x, draft_y = width / img.size[0], height / img.size[1]
+    box = (x1 / draft_x, y1 / draft_y, x2 / draft_x, y2 / draft_y)
+    if img.mode not in ('RGB', 'L'):
+        img = img.convert('RGB')
+    resized = img.resize(target, Image.BILINEAR, box=box, reducing_gap=2.)
+    return PreparedFrame(encode_pil_image(resized), x1, y1, region_width / target[0], region_height / target[1], width, height)
+
+
+def restore_boxes(results: List[DetectionResult], frame: PreparedFrame):
+    for r in results:
+        r.box.x1, r.box.x2 = int(r.box.x1 * frame.scale_x) + frame.offset_x, int(round(r.box.x2 * frame.scale_x)) + frame.offset_x
+        r.box.y1, r.box.y2 = int(r.box.y1 * frame.scale_y) + frame.offset_y, int(round(r.box.y2 * frame.scale_y)) + frame.offset_y
+
+
+def create_frame_resizer(ds_config: DeepStackConfig) -> FrameResizer | None:
+    if not ds_config.od_inference_resize_enabled:
+        return None
+    return FrameResizer(InferenceSizeRepository(crate_redis_connection(RedisDb.MAIN)), ds_config.od_inference_max_size,
+                        ds_config.od_inference_size_refresh_interval)
@@ -12,3 +12,4 @@ class DetectionResult:
         self.pred_cls_idx: int = 0
         self.pred_score: float = 0.0
         self.box: DetectionBox = DetectionBox()
+        self.track_id: int = 0  # set by the object tracker, zero means untracked
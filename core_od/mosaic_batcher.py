@@ -0,0 +1,216 @@
+import asyncio
+import io
+import math
+import threading
+from typing import List
+
+from PIL import Image
+
+from common.config import DeepStackConfig
+from common.deepstack.async_deepstack_client import AsyncDeepStackClient
+from common.deepstack.deepstack_client import DeepStackClient
+from common.deepstack.image_utils import encode_pil_image
+from common.metrics import stage_seconds
+from common.utilities import logger
+
+
+class _BatchItem:
+    def __init__(self, image: bytes, width: int, height: int):
+        self.image: bytes = image
+        self.width: int = width
+        self.height: int = height
+        self.x: int = 0
+        self.y: int = 0
+        self.predictions: List[dict] = []
+        self.error: BaseException | None = None
+        self.done = threading.Event()
+        self.future: asyncio.Future | None = None  # set by AsyncMosaicBatcher
+
+
+# packs the small frames of different cameras into a single mosaic image, so they cost one DeepStack call instead of one per frame.
+# a batch is flushed when it reaches the max batch size or its first frame has waited for the max wait time
+class MosaicBatcher:
+    def __init__(self, client: DeepStackClient, max_batch_size: int, max_wait_ms: float, max_tile_size: int):
+        self.client = client
+        self.max_batch_size: int = max(1, int(max_batch_size))
+        self.max_wait: float = max(.0, max_wait_ms) / 1000.
+        self.max_tile_size: int = max_tile_size
+        self.__lock = threading.Lock()
+        self.__pending: List[_BatchItem] = []
+        self.batch_count: int = 0
+        self.frame_count: int = 0
+
+    # blocks the calling worker until the batch of the frame has been detected
+    def detect_objects(self, image: bytes, min_confidence: float) -> List[dict]:
+        width, height = Image.open(io.BytesIO(image)).size  # only the header is read
+        if max(width, height) > self.max_tile_size:
+            return self.client.detect_objects(image, min_confidence)
+
+        item = _BatchItem(image, width, height)
+        batch = None
+        with self.__lock:
+            self.__pending.append(item)
+            if len(self.__pending) >= self.max_batch_size:
+                batch = self.__take()
+        if batch is not None:
+            self.__detect(batch, min_confidence)
+        elif not item.done.wait(self.max_wait):
+            # the first waiter whose time is up flushes the pending frames, the others have already been taken by another flush
+            with self.__lock:
+                if item in self.__pending:
+                    batch = self.__take()
+            if batch is not None:
+                self.__detect(batch, min_confidence)
+            item.done.wait()
+
+        if item.error is not None:
+            raise item.error
+        return item.predictions
+
+    def get_stats(self) -> dict:
+        with self.__lock:
+            return {'batches': self.batch_count, 'frames': self.frame_count,
+                    'avg_batch_size': self.frame_count / self.batch_count if self.batch_count > 0 else .0}
+
+    def __take(self) -> List[_BatchItem]:
+        batch = self.__pending
+        self.__pending = []
+        self.batch_count += 1
+        self.frame_count += len(batch)
+        return batch
+
+    def __detect(self, batch: List[_BatchItem], min_confidence: float):
+        try:
+            if len(batch) == 1:
+                item = batch[0]
+                item.predictions = self.client.detect_objects(item.image, min_confidence)
+                return
+            with stage_seconds.time(stage='mosaic_compose', channel='od_mosaic'):
+                mosaic = create_mosaic(batch)
+            predictions = self.client.detect_objects(mosaic, min_confidence)
+            split_predictions(batch, predictions)
+        except BaseException as ex:
+            logger.error(f'an error occurred while detecting a mosaic batch of {len(batch)} frames, err: {ex}')
+            for item in batch:
+                item.error = ex
+        finally:
+            for item in batch:
+                item.done.set()
+
+
+# asyncio counterpart of MosaicBatcher, the frames wait on futures instead of blocking the workers
+class AsyncMosaicBatcher:
+    def __init__(self, client: AsyncDeepStackClient, max_batch_size: int, max_wait_ms: float, max_tile_size: int):
+        self.client = client
+        self.max_batch_size: int = max(1, int(max_batch_size))
+        self.max_wait: float = max(.0, max_wait_ms) / 1000.
+        self.max_tile_size: int = max_tile_size
+        self.__pending: List[_BatchItem] = []
+        self.batch_count: int = 0
+        self.frame_count: int = 0
+
+    async def detect_objects(self, image: bytes, min_confidence: float) -> List[dict]:
+        width, height = Image.open(io.BytesIO(image)).size  # only the header is read
+        if max(width, height) > self.max_tile_size:
+            return await self.client.detect_objects(image, min_confidence)
+
+        item = _BatchItem(image, width, height)
+        future = asyncio.get_running_loop().create_future()
+        item.future = future
+        self.__pending.append(item)
+        if len(self.__pending) >= self.max_batch_size:
+            await self.__detect(self.__take(), min_confidence)
+        else:
+            try:
+                await asyncio.wait_for(asyncio.shield(future), self.max_wait)
+            except asyncio.TimeoutError:
+                # the first waiter whose time is up flushes the pending frames, the others have already been taken by another flush
+                if item in self.__pending:
+                    await self.__detect(self.__take(), min_confidence)
+                await future
+
+        if item.error is not None:
+            raise item.error
+        return item.predictions
+
+    def get_stats(self) -> dict:
+        return {'batches': self.batch_count, 'frames': self.frame_count,
+                'avg_batch_size': self.frame_count / self.batch_count if self.batch_count > 0 else .0}
+
+    def __take(self) -> List[_BatchItem]:
+        batch = self.__pending
+        self.__pending = []
+        self.batch_count += 1
+        self.frame_count += len(batch)
+        return batch
+
+    async def __detect(self, batch: List[_BatchItem], min_confidence: float):
+        try:
+            if len(batch) == 1:
+                item = batch[0]
+                item.predictions = await self.client.detect_objects(item.image, min_confidence)
+                return
+            with stage_seconds.time(stage='mosaic_compose', channel='od_mosaic'):
+                # the decoding and encoding would block the event loop
+                mosaic = await asyncio.to_thread(create_mosaic, batch)
+            predictions = await self.client.detect_objects(mosaic, min_confidence)
+            split_predictions(batch, predictions)
+        except asyncio.CancelledError as ex:
+            # the waiters of the batch fail with it, the cancellation itself goes on
+            for item in batch:
+                item.error = ex
+            raise
+        except Exception as ex:
+            logger.error(f'an error occurred while detecting a mosaic batch of {len(batch)} frames, err: {ex}')
+            for item in batch:
+                item.error = ex
+        finally:
+            for item in batch:
+                if not item.future.done():
+                    item.future.set_result(None)
+
+
+# lays the frames out on a grid whose cells are as large as the largest frame and sets the offsets of the items
+def create_mosaic(batch: List[_BatchItem]) -> bytes:
+    cols = math.ceil(math.sqrt(len(batch)))
+    rows = math.ceil(len(batch) / cols)
+    cell_width = max(item.width for item in batch)
+    cell_height = max(item.height for item in batch)
+    mosaic = Image.new('RGB', (cols * cell_width, rows * cell_height))
+    for index, item in enumerate(batch):
+        item.x, item.y = (index % cols) * cell_width, (index // cols) * cell_height
+        with Image.open(io.BytesIO(item.image)) as img:
+            mosaic.paste(img.convert('RGB'), (item.x, item.y))
+    return encode_pil_image(mosaic)
+
+
+# a box is given to the frame which contains it entirely, the boxes crossing a tile boundary are dropped
+def split_predictions(batch: List[_BatchItem], predictions: List[dict]):
+    for prediction in predictions:
+        item = _find_item(batch, prediction['x_min'], prediction['y_min'], prediction['x_max'], prediction['y_max'])
+        if item is None:
+            continue
+        mapped = dict(prediction)
+        mapped['x_min'], mapped['x_max'] = prediction['x_min'] - item.x, prediction['x_max'] - item.x
+        mapped['y_min'], mapped['y_max'] = prediction['y_min'] - item.y, prediction['y_max'] - item.y
+        item.predictions.append(mapped)
+
+
+def _find_item(batch: List[_BatchItem], x1: int, y1: int, x2: int, y2: int) -> _BatchItem | None:
+    for item in batch:
+        if item.x <= x1 and x2 <= item.x + item.width and item.y <= y1 and y2 <= item.y + item.height:
+            return item
+    return None
+
+
+def create_mosaic_batcher(client: DeepStackClient, ds_config: DeepStackConfig) -> MosaicBatcher | None:
+    if not ds_config.od_mosaic_enabled:
+        return None
+    return MosaicBatcher(client, ds_config.od_mosaic_max_batch_size, ds_config.od_mosaic_max_wait_ms, ds_config.od_mosaic_max_tile_size)
+
+
+def create_async_mosaic_batcher(client: AsyncDeepStackClient, ds_config: DeepStackConfig) -> AsyncMosaicBatcher | None:
+    if not ds_config.od_mosaic_enabled:
+        return None
+    return AsyncMosaicBatcher(client, ds_config.od_mosaic_max_batch_size, ds_config.od_mosaic_max_wait_ms,
+                              ds_config.od_mosaic_max_tile_size)
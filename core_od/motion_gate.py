@@ -0,0 +1,90 @@
+import io
+import threading
+import time
+from typing import Dict, List
+import numpy as np
+from PIL import Image
+
+from common.config import DeepStackConfig
+from common.utilities import logger
+from core_od.models.detections import DetectionResult
+
+
+class _GateState:
+    def __init__(self, reference: np.ndarray):
+        self.reference: np.ndarray = reference
+        self.results: List[DetectionResult] = []
+        self.checked_at: float = time.monotonic()
+
+
+# skips the inference of a camera when its frame is almost the same as the last inferred one
+class MotionGate:
+    def __init__(self, threshold: float, size: int, max_interval: float):
+        self.threshold: float = threshold
+        self.size: int = max(8, int(size))
+        self.max_interval: float = max_interval
+        self.__lock = threading.Lock()
+        self.__states: Dict[str, _GateState] = {}
+        self.checked_count: int = 0
+        self.skipped_count: int = 0
+
+    def __create_thumbnail(self, image: bytes) -> np.ndarray:
+        img = Image.open(io.BytesIO(image))
+        # a jpeg is decoded in a reduced scale by draft mode which is much faster than a full decode
+        img.draft('L', (self.size * 2, self.size * 2))
+        img = img.convert('L').resize((self.size, self.size), Image.BILINEAR)
+        return np.asarray(img, dtype=np.int16)
+
+    # returns True if the frame needs to be inferred. The reference is updated only for the inferred frames,
+    # so slow changes accumulate until they exceed the threshold
+    def is_changed(self, source_id: str, image: bytes) -> bool:
+        thumbnail = self.__create_thumbnail(image)
+        now = time.monotonic()
+        with self.__lock:
+            self.checked_count += 1
+            state = self.__states.get(source_id)
+            if state is None:
+                self.__states[source_id] = _GateState(thumbnail)
+                return True
+            if state.reference.shape == thumbnail.shape and now - state.checked_at < self.max_interval:
+                diff = float(np.abs(thumbnail - state.reference).mean()) / 255.
+                if diff < self.threshold:
+                    self.skipped_count += 1
+                    self.__log_hit_rate()
+                    return False
+            state.reference = thumbnail
+            state.checked_at = now
+            return True
+
+    # the reference was updated before an inference which has failed, the next frame of the camera is inferred again
+    def invalidate(self, source_id: str):
+        with self.__lock:
+            self.__states.pop(source_id, None)
+
+    def get_previous_results(self, source_id: str) -> List[DetectionResult]:
+        with self.__lock:
+            state = self.__states.get(source_id)
+            return state.results if state is not None else []
+
+    def set_results(self, source_id: str, results: List[DetectionResult]):
+        with self.__lock:
+            state = self.__states.get(source_id)
+            if state is not None:
+                state.results = results
+
+    def hit_rate(self) -> float:
+        return self.skipped_count / self.checked_count if self.checked_count > 0 else .0
+
+    def get_stats(self) -> dict:
+        with self.__lock:
+            return {'checked': self.checked_count, 'skipped': self.skipped_count, 'hit_rate': self.hit_rate()}
+
+    def __log_hit_rate(self):
+        if self.skipped_count % 500 == 0:
+            logger.info(f'motion gate hit rate: {"{:.2f}".format(self.hit_rate())}, checked: {self.checked_count}, skipped: {self.skipped_count}')
+
+
+def create_motion_gate(ds_config: DeepStackConfig) -> MotionGate | None:
+    if not ds_config.od_motion_gate_enabled:
+        return None
+    return MotionGate(ds_config.od_motion_gate_threshold, ds_config.od_motion_gate_size, ds_config.od_motion_gate_max_interval)
@@ -0,0 +1,110 @@
+import threading
+import time
+from typing import Dict, List
+
+import numpy as np
+
+from common.config import DeepStackConfig
+from common.tracking import iou_matrix, centroid_distance_matrix, greedy_match
+from core_od.models.detections import DetectionResult
+
+
+class _Track:
+    def __init__(self, track_id: int, cls_idx: int, box: np.ndarray):
+        self.track_id: int = track_id
+        self.cls_idx: int = cls_idx
+        self.box: np.ndarray = box
+        self.missed: int = 0
+
+
+class _CameraTracks:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.tracks: List[_Track] = []
+        self.published_at: float = .0
+
+
+# assigns stable track ids to the detections of a camera, so a parked car or a person standing at a door is published
+# only when a track is born, dies, changes its class or the refresh interval has passed, instead of on every frame
+class ObjectTracker:
+    def __init__(self, iou_threshold: float, centroid_threshold: float, max_missed: int, refresh_interval: float):
+        self.iou_threshold: float = iou_threshold
+        self.centroid_threshold: float = centroid_threshold
+        self.max_missed: int = max(0, int(max_missed))
+        self.refresh_interval: float = refresh_interval
+        self.__lock = threading.Lock()
+        self.__cameras: Dict[str, _CameraTracks] = {}
+        self.__next_id: int = 1
+        self.suppressed_count: int = 0
+
+    # sets the track ids of the results and returns True if the frame needs to be published
+    def update(self, source_id: str, results: List[DetectionResult]) -> bool:
+        camera = self.__get_camera(source_id)
+        with camera.lock:
+            boxes = np.array([[r.box.x1, r.box.y1, r.box.x2, r.box.y2] for r in results], dtype=np.float64).reshape(-1, 4)
+            track_boxes = np.array([t.box for t in camera.tracks], dtype=np.float64).reshape(-1, 4)
+            matches = greedy_match(iou_matrix(track_boxes, boxes), self.iou_threshold)
+            matched_tracks = {row for row, _ in matches}
+            matched_results = {col for _, col in matches}
+            # the small or fast objects may not overlap their previous box, they are matched by their centers
+            if self.centroid_threshold > 0 and len(matched_tracks) < len(camera.tracks) and len(matched_results) < len(results):
+                distances = centroid_distance_matrix(track_boxes, boxes)
+                distances[list(matched_tracks), :] = np.inf
+                distances[:, list(matched_results)] = np.inf
+                for row, col in greedy_match(-distances, -self.centroid_threshold):
+                    matches.append((row, col))
+                    matched_tracks.add(row)
+                    matched_results.add(col)
+
+            changed = False
+            for row, col in matches:
+                track, result = camera.tracks[row], results[col]
+                if track.cls_idx != result.pred_cls_idx:
+                    track.cls_idx = result.pred_cls_idx
+                    changed = True
+                track.box, track.missed = boxes[col], 0
+                result.track_id = track.track_id
+
+            alive: List[_Track] = []
+            for index, track in enumerate(camera.tracks):
+                if index not in matched_tracks:
+                    track.missed += 1
+                    if track.missed > self.max_missed:
+                        changed = True  # the track has died
+                        continue
+                alive.append(track)
+            for col, result in enumerate(results):
+                if col not in matched_results:
+                    track = _Track(self.__create_id(), result.pred_cls_idx, boxes[col])
+                    result.track_id = track.track_id
+                    alive.append(track)
+                    changed = True  # a track has been born
+            camera.tracks = alive
+
+            now = time.monotonic()
+            if changed or (len(results) > 0 and now - camera.published_at >= self.refresh_interval):
+                camera.published_at = now
+                return True
+            self.suppressed_count += 1
+            return False
+
+    def __get_camera(self, source_id: str) -> _CameraTracks:
+        with self.__lock:
+            camera = self.__cameras.get(source_id)
+            if camera is None:
+                camera = _CameraTracks()
+                self.__cameras[source_id] = camera
+            return camera
+
+    def __create_id(self) -> int:
+        with self.__lock:
+            track_id = self.__next_id
+            self.__next_id += 1
+            return track_id
+
+
+def create_object_tracker(ds_config: DeepStackConfig) -> ObjectTracker | None:
+    if not ds_config.od_tracker_enabled:
+        return None
+    return ObjectTracker(ds_config.od_tracker_iou_threshold, ds_config.od_tracker_centroid_threshold, ds_config.od_tracker_max_missed,
+                         ds_config.od_tracker_refresh_interval)
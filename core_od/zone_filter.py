@@ -0,0 +1,79 @@
+import threading
+from typing import Dict, List
+
+import numpy as np
+
+from common.config import DeepStackConfig
+from common.data.zone_repository import ZoneRepository
+from common.utilities import logger, crate_redis_connection, RedisDb
+from core_od.frame_resizer import PreparedFrame
+from core_od.models.detections import DetectionResult
+
+
+class CameraZones:
+    def __init__(self, roi: List[float] | None, masks: List[np.ndarray]):
+        self.roi: List[float] | None = roi  # x1, y1, x2, y2 ratios
+        self.masks: List[np.ndarray] = masks  # polygons of (x, y) ratios
+
+
+# the region of interest of a camera is cropped by prepare_frame, this drops the detections whose centers fall into an exclusion mask.
+# the zones are refreshed in the background, so a frame never waits for Redis
+class ZoneFilter:
+    def __init__(self, repository: ZoneRepository, refresh_interval: float):
+        self.repository = repository
+        self.refresh_interval: float = refresh_interval
+        self.__zones: Dict[str, CameraZones] = {}
+        self.masked_count: int = 0
+        self.__refresh()
+        th = threading.Thread(target=self.__refresh_loop)
+        th.daemon = True
+        th.start()
+
+    def get(self, source_id: str) -> CameraZones | None:
+        return self.__zones.get(source_id)
+
+    # drops the detections whose centers fall into a mask, the boxes are expected in the full frame coordinates
+    def apply(self, results: List[DetectionResult], zones: CameraZones, frame: PreparedFrame) -> List[DetectionResult]:
+        if len(zones.masks) == 0 or len(results) == 0:
+            return results
+        centers = np.array([[(r.box.x1 + r.box.x2) / 2. / frame.width, (r.box.y1 + r.box.y2) / 2. / frame.height] for r in results])
+        masked = np.zeros(len(results), dtype=bool)
+        for polygon in zones.masks:
+            masked |= points_in_polygon(centers, polygon)
+        self.masked_count += int(masked.sum())
+        return [r for r, m in zip(results, masked) if not m]
+
+    def __refresh_loop(self):
+        stopped = threading.Event()
+        while not stopped.wait(self.refresh_interval):
+            self.__refresh()
+
+    def __refresh(self):
+        try:
+            zones: Dict[str, CameraZones] = {}
+            for source_id, dic in self.repository.get_all().items():
+                roi = dic.get('roi')
+                masks = [np.asarray(polygon, dtype=np.float64) for polygon in dic.get('masks') or [] if len(polygon) > 2]
+                if roi is None and len(masks) == 0:
+                    continue
+                zones[source_id] = CameraZones(roi, masks)
+            self.__zones = zones
+        except BaseException as ex:
+            logger.error(f'an error occurred while refreshing the camera zones, err: {ex}')
+
+
+# even-odd ray casting of all points against all edges at once, points is (n, 2) and polygon is (m, 2)
+def points_in_polygon(points: np.ndarray, polygon: np.ndarray) -> np.ndarray:
+    x, y = points[:, 0:1], points[:, 1:2]
+    xi, yi = polygon[:, 0], polygon[:, 1]
+    xj, yj = np.roll(xi, 1), np.roll(yi, 1)
+    crosses = (yi > y) != (yj > y)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        x_cross = (xj - xi) * (y - yi) / (yj - yi) + xi
+    return np.count_nonzero(crosses & (x < x_cross), axis=1) % 2 == 1
+
+
+def create_zone_filter(ds_config: DeepStackConfig) -> ZoneFilter | None:
+    if not ds_config.od_zones_enabled:
+        return None
+    return ZoneFilter(ZoneRepository(crate_redis_connection(RedisDb.MAIN)), ds_config.od_zones_refresh_interval)
@@ -0,0 +1,202 @@
+import os
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import cpu_count
+from os import path
+from typing import Callable, List
+
+import numpy as np
+import requests
+
+from common.config import DeepStackConfig, DeepStackPerformanceMode
+from common.data.tuning_repository import TuningRepository
+from common.deepstack.readiness import ReadinessProbe, create_readiness_probe, create_synthetic_image, get_replica_endpoints
+from common.utilities import logger, crate_redis_connection, RedisDb
+from docker_manager import ContainerTuning, DockerManager
+
+
+def get_host_name() -> str:
+    return socket.gethostname()
+
+
+def to_tuning(dic: dict) -> ContainerTuning:
+    return ContainerTuning(int(dic['thread_count']), DeepStackPerformanceMode(int(dic['performance_mode'])))
+
+
+# each candidate (THREADCOUNT, MODE) is measured by recreating the containers and replaying the frames through them, the one with the
+# best throughput whose p95 latency is within the limit is kept in Redis, so the sweep runs only once per host
+class DockerAutotuner:
+    def __init__(self, ds_config: DeepStackConfig, docker_manager: DockerManager, repository: TuningRepository):
+        self.ds_config: DeepStackConfig = ds_config
+        self.docker_manager: DockerManager = docker_manager
+        self.repository: TuningRepository = repository
+        self.host: str = get_host_name()
+        self.probe: ReadinessProbe = create_readiness_probe(ds_config)
+
+    def apply(self):
+        dic = self.repository.get(self.host)
+        if dic is not None:
+            self.docker_manager.tuning = to_tuning(dic)
+            logger.warning(f'DeepStack containers use the tuned settings of host {self.host}, thread count: {dic["thread_count"]}, '
+                           f'mode: {DeepStackPerformanceMode(int(dic["performance_mode"])).name}')
+            return
+        self.docker_manager.tuning = self.sweep()
+
+    def sweep(self) -> ContainerTuning | None:
+        frames = self.__load_frames()
+        results: List[dict] = []
+        for tuning in self.get_candidates():
+            self.docker_manager.tuning = tuning
+            try:
+                self.docker_manager.run()
+                if not self.probe.wait_until_ready() or not self.probe.warm_up():
+                    logger.error(f'DeepStack containers are not ready, thread count: {tuning.thread_count}, mode: {tuning.performance_mode.name}')
+                    continue
+                result = self.measure(frames)
+            except BaseException as ex:
+                logger.error(f'an error occurred while measuring a DeepStack tuning candidate, err: {ex}')
+                continue
+            result.update({'thread_count': tuning.thread_count, 'performance_mode': int(tuning.performance_mode)})
+            logger.warning(f'DeepStack tuning candidate, thread count: {tuning.thread_count}, mode: {tuning.performance_mode.name}, '
+                           f'throughput: {result["throughput_fps"]:.2f} fps, p95: {result["latency_p95_ms"]:.0f} ms, errors: {result["errors"]}')
+            results.append(result)
+
+        best = choose_best(results, self.ds_config.autotune_max_p95 * 1000.)
+        if best is None:
+            logger.error('DeepStack tuning has failed, the containers use the default settings')
+            return None
+        best['tuned_at'] = time.time()
+        self.repository.add(self.host, best)
+        logger.warning(f'DeepStack tuning of host {self.host} has been completed, thread count: {best["thread_count"]}, '
+                       f'mode: {DeepStackPerformanceMode(best["performance_mode"]).name}')
+        return to_tuning(best)
+
+    def get_candidates(self) -> List[ContainerTuning]:
+        thread_counts = [int(t) for t in self.ds_config.autotune_thread_counts]
+        if len(thread_counts) == 0:
+            # the cpu cores are shared by the replicas
+            cc = max(1, int(cpu_count() / max(1, int(self.ds_config.replica_count))))
+            thread_counts = sorted({max(1, cc // 4), max(1, cc // 2), cc})
+        modes = [DeepStackPerformanceMode(int(m)) for m in self.ds_config.autotune_performance_modes]
+        if len(modes) == 0:
+            modes = list(DeepStackPerformanceMode)
+        return [ContainerTuning(t, m) for m in modes for t in thread_counts]
+
+    # the replicas are loaded at the same time with autotune_concurrency requests each, like the service does
+    def measure(self, frames: List[bytes]) -> dict:
+        jobs = [(url, endpoints[0]) for url, endpoints in get_replica_endpoints(self.ds_config).items() if len(endpoints) > 0]
+        concurrency = max(1, int(self.ds_config.autotune_concurrency))
+        stop_at = time.perf_counter() + self.ds_config.autotune_duration
+        lock = threading.Lock()
+        latencies: List[float] = []
+        errors = [0]
+
+        def send(url: str, endpoint: str, seed: int):
+            session = requests.Session()
+            data = {'min_confidence': self.ds_config.od_threshold}
+            if len(self.ds_config.api_key) > 0:
+                data['api_key'] = self.ds_config.api_key
+            index = seed
+            while time.perf_counter() < stop_at:
+                frame = frames[index % len(frames)]
+                index += 1
+                started_at = time.perf_counter()
+                try:
+                    response = session.post(f'{url}{endpoint}', data=data, files={'image': ('image.jpg', frame, 'application/octet-stream')},
+                                            timeout=self.ds_config.http_timeout)
+                    succeeded = response.status_code < 500
+                except requests.RequestException:
+                    succeeded = False
+                with lock:
+                    if succeeded:
+                        latencies.append(time.perf_counter() - started_at)
+                    else:
+                        errors[0] += 1
+            session.close()
+
+        started_at = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=len(jobs) * concurrency) as executor:
+            for url, endpoint in jobs:
+                for seed in range(concurrency):
+                    executor.submit(send, url, endpoint, seed)
+        elapsed = time.perf_counter() - started_at
+        return {'throughput_fps': len(latencies) / elapsed if elapsed > 0 else .0,
+                'latency_p95_ms': float(np.percentile(latencies, 95)) * 1000. if len(latencies) > 0 else .0, 'errors': errors[0]}
+
+    def __load_frames(self) -> List[bytes]:
+        frames: List[bytes] = []
+        sample_dir = self.ds_config.autotune_sample_dir
+        if len(sample_dir) > 0 and path.isdir(sample_dir):
+            for file_name in sorted(os.listdir(sample_dir)):
+                if file_name.lower().endswith(('.jpg', '.jpeg')):
+                    with open(path.join(sample_dir, file_name), 'rb') as file:
+                        frames.append(file.read())
+        if len(frames) == 0:
+            frames.append(create_synthetic_image(1280, 720))
+        return frames
+
+
+# the candidates with errors or over the p95 limit are chosen only if there is no other candidate
+def choose_best(results: List[dict], max_p95_ms: float) -> dict | None:
+    succeeded = [r for r in results if r['throughput_fps'] > 0]
+    if len(succeeded) == 0:
+        return None
+
+    def score(r: dict):
+        within_limit = max_p95_ms <= 0 or r['latency_p95_ms'] <= max_p95_ms
+        return within_limit, r['errors'] == 0, r['throughput_fps'], -r['latency_p95_ms']
+
+    return max(succeeded, key=score)
+
+
+def create_docker_autotuner(ds_config: DeepStackConfig, docker_manager: DockerManager) -> DockerAutotuner | None:
+    if not ds_config.autotune_enabled:
+        return None
+    return DockerAutotuner(ds_config, docker_manager, TuningRepository(crate_redis_connection(RedisDb.MAIN)))
+
+
+# watches the worker pool queue, if it stays over the limit for the sustained time the tuning of the host is removed,
+# so the next start of the service measures the settings again
+class QueueGrowthMonitor:
+    def __init__(self, get_queue_depth: Callable[[], int], queue_size: int, ratio: float, sustained_time: float,
+                 repository: TuningRepository, check_interval: float = 5.):
+        self.get_queue_depth: Callable[[], int] = get_queue_depth
+        self.limit: float = max(1., queue_size * ratio)
+        self.sustained_time: float = sustained_time
+        self.repository: TuningRepository = repository
+        self.check_interval: float = check_interval
+        self.host: str = get_host_name()
+
+    def start(self):
+        th = threading.Thread(target=self.__run)
+        th.daemon = True
+        th.start()
+
+    def __run(self):
+        over_since = .0
+        while True:
+            time.sleep(self.check_interval)
+            try:
+                if self.get_queue_depth() < self.limit:
+                    over_since = .0
+                    continue
+                now = time.monotonic()
+                if over_since == .0:
+                    over_since = now
+                elif now - over_since >= self.sustained_time:
+                    self.repository.remove(self.host)
+                    logger.warning(f'worker queue has been growing for {self.sustained_time} seconds, '
+                                   f'DeepStack settings of host {self.host} will be tuned again on the next start')
+                    return
+            except BaseException as ex:
+                logger.error(f'an error occurred while monitoring the worker queue, err: {ex}')
+
+
+def start_queue_growth_monitor(ds_config: DeepStackConfig, get_queue_depth: Callable[[], int]):
+    if not ds_config.autotune_enabled or not ds_config.autotune_retune_enabled:
+        return
+    repository = TuningRepository(crate_redis_connection(RedisDb.MAIN))
+    QueueGrowthMonitor(get_queue_depth, ds_config.worker_queue_size, ds_config.autotune_retune_queue_ratio,
+                       ds_config.autotune_retune_sustained_time, repository).start()
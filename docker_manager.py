@@ -1,13 +1,30 @@
+import hashlib
+import json
 from os import path
 from typing import List, Any
 import docker
+import requests
 from docker.types import Mount
 from multiprocessing import cpu_count
 
 from common.config import DeepStackDockerType, DeepStackPerformanceMode
+from common.deepstack.backend_pool import ReplicaRole, get_replica_roles
 from common.utilities import config, logger
 from utils.dir import get_root_path_for_deepstack, create_dir_if_not_exists
 
+_fingerprint_label = 'deepstack_service.fingerprint'
+
+
+# the containers created from the same spec have the same fingerprint
+def get_fingerprint(spec: dict) -> str:
+    return hashlib.blake2b(json.dumps(spec, sort_keys=True).encode('utf-8'), digest_size=16).hexdigest()
+
+
+class ContainerTuning:
+    def __init__(self, thread_count: int, performance_mode: DeepStackPerformanceMode):
+        self.thread_count: int = thread_count
+        self.performance_mode: DeepStackPerformanceMode = performance_mode
+
 
 # for more info: https://docker-py.readthedocs.io/en/stable/containers.html
 class DockerManager:
@@ -15,6 +32,12 @@ class DockerManager:
         self.client = docker.from_env()
         self.container_name = 'deepstack-server'
         self.ds_config = config.deep_stack
+        self.adopted_count: int = 0
+        # the cpu cores are shared by the replicas, DeepStack uses 5 threads if THREADCOUNT is not given
+        self.thread_count: int = max(5, int(cpu_count() / 2 / max(1, int(self.ds_config.replica_count))))
+        logger.warning(f'thread count is {self.thread_count}')
+        # set by the autotuner, overrides THREADCOUNT and MODE
+        self.tuning: ContainerTuning | None = None
 
     def __get_image_name(self) -> str:
         docker_type = self.ds_config.docker_type
@@ -31,53 +54,112 @@ class DockerManager:
         else:
             return 'deepquestai/deepstack'
 
-    def __init_container(self, all_containers: List):
-        for container in all_containers:
-            if container.name == self.container_name:
-                self.stop_and_remove_container(container)
-                logger.warning(f'a previous DeepStack server container has been found and removed.')
-                break
+    # the first replica keeps the original name, so a single replica setup stays the same
+    def get_replica_container_name(self, index: int) -> str:
+        return self.container_name if index == 0 else f'{self.container_name}-{index}'
+
+    def __is_replica_container(self, container_name: str) -> bool:
+        if container_name == self.container_name:
+            return True
+        prefix = f'{self.container_name}-'
+        return container_name.startswith(prefix) and container_name[len(prefix):].isdigit()
 
+    def __create_container_spec(self, index: int, role: ReplicaRole) -> dict:
         environments = dict()
-        if self.ds_config.od_enabled:
+        if self.ds_config.od_enabled and role != ReplicaRole.FaceRecognition:
             environments['VISION-DETECTION'] = 'True'
-        if self.ds_config.fr_enabled:
+        if self.ds_config.fr_enabled and role != ReplicaRole.ObjectDetection:
             environments['VISION-FACE'] = 'True'
-        if self.ds_config.performance_mode != DeepStackPerformanceMode.Medium:
-            mode: str = 'High' if self.ds_config.performance_mode == DeepStackPerformanceMode.High else 'Low'
+        performance_mode = self.ds_config.performance_mode if self.tuning is None else self.tuning.performance_mode
+        if performance_mode != DeepStackPerformanceMode.Medium:
+            mode: str = 'High' if performance_mode == DeepStackPerformanceMode.High else 'Low'
             environments['MODE'] = mode
 
-        cc = int(cpu_count() / 2)
-        if cc > 5:
-            environments['THREADCOUNT'] = cc
-            logger.warning(f'thread count is {cc}')
-        else:
-            logger.warning('thread count is 5')
+        # the tuned thread count is logged by the autotuner
+        if self.tuning is not None:
+            environments['THREADCOUNT'] = str(self.tuning.thread_count)
+        elif self.thread_count > 5:
+            environments['THREADCOUNT'] = str(self.thread_count)
+
+        # e.g. ['0-3', '4-7'] pins each replica to its own cores, the list is repeated if there are more replicas
+        cpusets = self.ds_config.docker_cpusets
+        cpuset = cpusets[index % len(cpusets)] if len(cpusets) > 0 else ''
+
+        mount_dir_path = path.join(get_root_path_for_deepstack(config), "deepstack")
+        # each replica has its own face database, sharing the same datastore between the containers is not safe
+        if index > 0:
+            mount_dir_path = path.join(mount_dir_path, 'replicas', str(index))
+
+        return {'image': self.__get_image_name(), 'environment': environments, 'ports': {'5000': str(self.ds_config.server_port + index)},
+                'mounts': [{'source': mount_dir_path, 'target': '/datastore'}],
+                'runtime': 'nvidia' if self.ds_config.docker_type == DeepStackDockerType.NVIDIA_JETSON else '',
+                'gpu': self.ds_config.docker_type == DeepStackDockerType.GPU, 'cpuset': cpuset, 'mem_limit': self.ds_config.docker_mem_limit}
 
+    def __init_container(self, index: int, spec: dict):
         device_requests = []
-        if self.ds_config.docker_type == DeepStackDockerType.GPU:
+        if spec['gpu']:
             device_requests.append(docker.types.DeviceRequest(count=-1, capabilities=[['gpu']]))
 
         mounts = list()
-        mount_dir_path = path.join(get_root_path_for_deepstack(config), "deepstack")
-        create_dir_if_not_exists(mount_dir_path)
-        mounts.append(Mount(source=f'{mount_dir_path}', target='/datastore', type='bind'))
+        for mount in spec['mounts']:
+            create_dir_if_not_exists(mount['source'])
+            mounts.append(Mount(source=mount['source'], target=mount['target'], type='bind'))
 
-        container = self.client.containers.run(image=self.__get_image_name(), detach=True, restart_policy={'Name': 'unless-stopped'},
-                                               name=self.container_name, ports={'5000': str(self.ds_config.server_port)},
-                                               environment=environments, mounts=mounts, device_requests=device_requests,
-                                               runtime='nvidia' if self.ds_config.docker_type == DeepStackDockerType.NVIDIA_JETSON else '')
+        container = self.client.containers.run(image=spec['image'], detach=True, restart_policy={'Name': 'unless-stopped'},
+                                               name=self.get_replica_container_name(index), ports=spec['ports'],
+                                               environment=spec['environment'], mounts=mounts, device_requests=device_requests,
+                                               runtime=spec['runtime'], labels={_fingerprint_label: get_fingerprint(spec)},
+                                               cpuset_cpus=spec['cpuset'] or None, mem_limit=spec['mem_limit'] or None)
         return container
 
-    def run(self) -> Any:
-        all_containers = self.get_all_containers()
-        container = self.__init_container(all_containers)
-        return container
+    # a running container created with the same configuration which answers the health check is kept as it is,
+    # so a restart of the service does not pay the container creation, the model loading and the restore
+    def __try_adopt_container(self, container, index: int, fingerprint: str) -> bool:
+        if not self.ds_config.docker_reuse_containers or container is None:
+            return False
+        if container.status != 'running' or container.labels.get(_fingerprint_label) != fingerprint:
+            logger.warning(f'DeepStack server container ({container.name}) is not running or its configuration has been changed')
+            return False
+        url = f'{self.ds_config.server_url}:{self.ds_config.server_port + index}'
+        try:
+            requests.get(url, timeout=self.ds_config.docker_health_check_timeout)
+            return True
+        except requests.RequestException as ex:
+            logger.warning(f'DeepStack server container ({container.name}) did not pass the health check, err: {ex}')
+            return False
 
-    def remove(self):
-        container = self.get_container(self.container_name)
-        if container is not None:
+    def run(self) -> List[Any]:
+        existing = {c.name: c for c in self.get_all_containers() if self.__is_replica_container(c.name)}
+        containers = []
+        self.adopted_count = 0
+        for index, role in enumerate(get_replica_roles(self.ds_config)):
+            name = self.get_replica_container_name(index)
+            spec = self.__create_container_spec(index, role)
+            container = existing.pop(name, None)
+            if self.__try_adopt_container(container, index, get_fingerprint(spec)):
+                containers.append(container)
+                self.adopted_count += 1
+                logger.warning(f'DeepStack server replica {index} ({role.name}) is already running on port {self.ds_config.server_port + index}, '
+                               f'the container ({name}) has been adopted')
+                continue
+            if container is not None:
+                self.stop_and_remove_container(container)
+                logger.warning(f'a previous DeepStack server container ({container.name}) has been found and removed.')
+            containers.append(self.__init_container(index, spec))
+            logger.warning(f'DeepStack server replica {index} ({role.name}) has been started on port {self.ds_config.server_port + index}')
+        # the replicas which are not needed anymore (e.g. replica_count has been decreased)
+        for container in existing.values():
             self.stop_and_remove_container(container)
+            logger.warning(f'a previous DeepStack server container ({container.name}) has been found and removed.')
+        return containers
+
+    def is_all_adopted(self) -> bool:
+        return self.adopted_count == len(get_replica_roles(self.ds_config))
+
+    def remove(self):
+        for container in self.get_all_containers():
+            if self.__is_replica_container(container.name):
+                self.stop_and_remove_container(container)
 
     def get_container(self, container_name: str):
         filters: dict = {'name': container_name}
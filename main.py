@@ -1,20 +1,29 @@
+import asyncio
 import sys
-import time
 from multiprocessing import Process
 
+from common.config import DeepStackRuntimeType
+from common.deepstack.backend_pool import ReplicaRole
+from common.deepstack.async_deepstack_client import create_async_deepstack_client
+from common.deepstack.readiness import StartupTimings, create_readiness_probe
+from common.event_bus.event_bus_factory import create_event_bus, create_async_event_bus
+from common.metrics import start_metrics_server
+from core_fr.async_event_handlers import FrAsyncReadServiceEventHandler
 from core_fr.back_up import BackUp
 from common.event_bus.event_bus import EventBus
 from common.utilities import logger, config
 from core_fr.event_handlers import FrReadServiceEventHandler
 from core_fr.train_event_handler import TrainEventHandler
 from core_fr.utilities import EventChannels, start_thread
+from core_od.async_event_handlers import OdAsyncReadServiceEventHandler
 from core_od.deepstack_object_detector import DeepstackObjectDetector
 from core_od.event_handlers import OdReadServiceEventHandler
 from core_od.utilities import register_detect_service
+from docker_autotuner import create_docker_autotuner, start_queue_growth_monitor
 from docker_manager import DockerManager
 
 
-def setup_fr():
+def start_train_event_handler():
     def train_event_handler():
         logger.info('DeepStack face training event handler will start soon')
         eb = EventBus(EventChannels.fr_train_request)
@@ -23,22 +32,64 @@ def setup_fr():
 
     start_thread(fn=train_event_handler, args=[])
 
+
+def setup_fr():
+    start_metrics_server(1)
+    start_train_event_handler()
+
     handler = FrReadServiceEventHandler()
 
     logger.info('DeepStack face recognition service will start soon')
-    event_bus = EventBus(EventChannels.read_service)
+    event_bus = create_event_bus(EventChannels.read_service)
+    start_queue_growth_monitor(config.deep_stack, lambda: event_bus.pool.queue_depth() if event_bus.pool is not None else 0)
     event_bus.subscribe_async(handler)
     sys.exit()
 
 
 def setup_od():
+    start_metrics_server(0)
     detector = DeepstackObjectDetector()
-    event_bus = EventBus(EventChannels.snapshot_in)
+    event_bus = create_event_bus(EventChannels.snapshot_in)
     handler = OdReadServiceEventHandler(detector)
     logger.info('DeepStack service will start soon')
+    start_queue_growth_monitor(config.deep_stack, lambda: event_bus.pool.queue_depth() if event_bus.pool is not None else 0)
     event_bus.subscribe_async(handler)
 
 
+def setup_fr_async():
+    start_metrics_server(1)
+    start_train_event_handler()
+
+    async def run():
+        client = create_async_deepstack_client(ReplicaRole.FaceRecognition)
+        handler = FrAsyncReadServiceEventHandler(client, create_async_event_bus(EventChannels.snapshot_out))
+        event_bus = create_async_event_bus(EventChannels.read_service)
+        logger.info('DeepStack asyncio face recognition service will start soon')
+        try:
+            await event_bus.subscribe(handler, config.deep_stack.async_max_in_flight)
+        finally:
+            await client.close()
+
+    asyncio.run(run())
+    sys.exit()
+
+
+def setup_od_async():
+    start_metrics_server(0)
+
+    async def run():
+        client = create_async_deepstack_client(ReplicaRole.ObjectDetection)
+        handler = OdAsyncReadServiceEventHandler(client, create_async_event_bus(EventChannels.snapshot_out))
+        event_bus = create_async_event_bus(EventChannels.snapshot_in)
+        logger.info('DeepStack asyncio service will start soon')
+        try:
+            await event_bus.subscribe(handler, config.deep_stack.async_max_in_flight)
+        finally:
+            await client.close()
+
+    asyncio.run(run())
+
+
 def main():
     if len(config.deep_stack.server_url) == 0:
         logger.error('Config.Deepstack.ServerUrl is empty, the deepstack service is now exiting')
@@ -47,20 +98,41 @@ def main():
     dckr_mngr = None
     backup = None
     try:
+        ds_config = config.deep_stack
+        timings = StartupTimings()
         dckr_mngr = DockerManager()
         backup = BackUp()
 
-        dckr_mngr.run()
-        time.sleep(3.)
-        backup.restore()
+        autotuner = create_docker_autotuner(ds_config, dckr_mngr)
+        if autotuner is not None:
+            with timings.measure('autotune'):
+                autotuner.apply()
+        with timings.measure('containers'):
+            dckr_mngr.run()
+        probe = create_readiness_probe(ds_config)
+        with timings.measure('readiness'):
+            if not probe.wait_until_ready():
+                logger.error('DeepStack servers are not ready, the service starts anyway and the requests are retried by the circuit breakers')
+        # the adopted containers have already loaded their models and keep their face database
+        if dckr_mngr.is_all_adopted():
+            logger.warning('all DeepStack server containers have been adopted, the warm-up and the restore are skipped')
+        else:
+            with timings.measure('warm-up'):
+                if not probe.warm_up():
+                    logger.error('DeepStack models could not be warmed up, the first frames may be slow')
+            with timings.measure('restore'):
+                backup.restore()
+        timings.report()
 
         register_detect_service('deepstack_service', 'deepstack_service-instance', 'The Deepstack Object Detection and Facial Recognition Service®')
-        ds_config = config.deep_stack
+        use_asyncio = ds_config.runtime_type == DeepStackRuntimeType.Asyncio
+        if use_asyncio:
+            logger.warning('DeepStack Service runs on the asyncio runtime')
 
         proc_fr = None
         if ds_config.fr_enabled:
             logger.info('DeepStack Facial Recognition is enabled')
-            proc_fr = Process(target=setup_fr, args=())
+            proc_fr = Process(target=setup_fr_async if use_asyncio else setup_fr, args=())
             proc_fr.daemon = True
             proc_fr.start()
         else:
@@ -68,7 +140,10 @@ def main():
 
         if ds_config.od_enabled:
             logger.info('DeepStack Object Detection is enabled')
-            setup_od()
+            if use_asyncio:
+                setup_od_async()
+            else:
+                setup_od()
         else:
             logger.warning('DeepStack Object Detection is not enabled')
 
@@ -81,8 +156,8 @@ def main():
     finally:
         if backup is not None:
             backup.backup()
-            time.sleep(3.)
-        if dckr_mngr is not None:
+        # the containers are kept running, so the next start adopts them
+        if dckr_mngr is not None and not config.deep_stack.docker_reuse_containers:
             dckr_mngr.remove()
 
 